@@ -0,0 +1,245 @@
+"""
+Asyncio streaming layer for the API clients.
+
+All async streams share one event loop. When the application runs under
+qasync (see ``run_event_loop``) that loop is the Qt event loop itself;
+otherwise a single background thread hosts it. Either way ten concurrent
+streams cost ten sockets on one loop instead of ten blocked QThreads.
+"""
+
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Iterator, Optional
+
+# Optional async HTTP client for native streaming
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+# Optional Qt/asyncio integration
+try:
+    import qasync
+    QASYNC_AVAILABLE = True
+except ImportError:
+    qasync = None
+    QASYNC_AVAILABLE = False
+
+from .stream_decoder import NDJSON, SSE, aiter_decoded
+
+logger = logging.getLogger(__name__)
+
+
+def run_event_loop(app) -> int:
+    """
+    Run the Qt application, driving it through a qasync event loop when available
+    so async streams are serviced on the GUI thread without extra threads.
+    """
+    if not QASYNC_AVAILABLE:
+        return app.exec()
+
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    stream_loop.attach(loop)
+    with loop:
+        return loop.run_forever() or 0
+
+
+class AsyncLoopBridge:
+    """Owns the single event loop that runs every async stream."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def uses_qt(self) -> bool:
+        """True when streams run on the Qt event loop (qasync)."""
+        return self._loop is not None and self._thread is None
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Use an externally driven loop (e.g. the qasync loop) for all streams."""
+        with self._lock:
+            if self._loop is not None and self._loop is not loop:
+                logger.warning("Async stream loop already started; keeping the existing loop")
+                return
+            self._loop = loop
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Get the stream loop, starting the background loop thread on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="async-streams", daemon=True)
+                self._thread.start()
+                logger.debug("Started background asyncio loop for streaming")
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the stream loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def stream(self, stream: AsyncIterator[str], on_chunk: Callable[[str], Any],
+               on_finished: Optional[Callable[[str], Any]] = None,
+               on_error: Optional[Callable[[Exception], Any]] = None) -> Future:
+        """
+        Consume an async token stream on the loop, reporting through callbacks.
+        Cancel the returned future to stop the stream. Without qasync the
+        callbacks run on the loop thread; Qt code should emit signals from them.
+        """
+        async def consume():
+            full_response = []
+            try:
+                async for chunk in stream:
+                    full_response.append(chunk)
+                    on_chunk(chunk)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+                return None
+            finally:
+                await _aclose(stream)
+            result = "".join(full_response)
+            if on_finished is not None:
+                on_finished(result)
+            return result
+
+        return self.submit(consume())
+
+    def stop(self):
+        """Stop the background loop thread, if one was started."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if thread is None:
+                return
+            self._loop = self._thread = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=2)
+
+
+# Process-wide stream loop
+stream_loop = AsyncLoopBridge()
+
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client(max_connections: int = 100):
+    """Get the shared httpx.AsyncClient for the running loop (one connection pool per loop)."""
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError("httpx is not installed")
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        client = httpx.AsyncClient(limits=limits, timeout=None)
+        _http_clients[loop] = client
+    return client
+
+
+async def aclose_async_http_client():
+    """Close the running loop's shared httpx.AsyncClient, e.g. before the loop is closed."""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def aiter_sse_json(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                         timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """POST a streaming request and yield the JSON payload of each SSE ``data:`` event."""
+    client = get_async_http_client()
+    async with client.stream("POST", url, json=payload, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+        async for event in aiter_decoded(response, SSE):
+            yield event
+
+
+async def aiter_ndjson(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """POST a streaming request and yield each newline-delimited JSON object."""
+    client = get_async_http_client()
+    async with client.stream("POST", url, json=payload, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+        async for event in aiter_decoded(response, NDJSON):
+            yield event
+
+
+async def aiter_sync(make_iterator: Callable[[], Iterator[str]]) -> AsyncIterator[str]:
+    """
+    Adapt a blocking generator to an async iterator.
+
+    Each ``next`` runs on the loop's default executor, so this is the fallback
+    for SDK-based clients without a native async path; it does not save threads.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(make_iterator())
+    done = object()
+    try:
+        while True:
+            # Run each step in a copy of the caller's context, so context variables
+            # (e.g. the request's usage holder) are visible to the client code
+            context = contextvars.copy_context()
+            item = await loop.run_in_executor(None, context.run, next, iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # Cancelled while the generator was running on the executor
+                pass
+
+
+def iter_async(stream: AsyncIterator[str], timeout: Optional[float] = None) -> Iterator[str]:
+    """
+    Consume an async stream from a blocking caller (e.g. a QThread) via the stream loop.
+    Closing the returned generator cancels the async stream.
+    """
+    items: "queue.Queue" = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in stream:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(done)
+            await _aclose(stream)
+
+    future = stream_loop.submit(pump())
+    try:
+        while True:
+            item = items.get(timeout=timeout)
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+async def _aclose(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception as e:
+            logger.debug(f"Error closing async stream: {e}")
+
@@ -0,0 +1,387 @@
+"""
+Resumable bulk prompt runner.
+
+Runs every row of a CSV or JSONL file through one or more provider/model
+targets on top of MultiProviderClient. Rows are rendered through a
+{{variable}} template (the Prompt Library syntax), requests run
+concurrently with a limit per provider, and each result is appended to a
+JSONL output file as soon as it completes. The output file doubles as the
+checkpoint: re-running the same job skips every row/target pair that
+already has a successful record, so a crashed run resumes where it stopped.
+
+Usage:
+    python -m api.batch_runner prompts.csv -t "Summarize for {{audience}}:\n\n{{text}}" \
+        --target "OpenAI:gpt-4o-mini" --target "Ollama:llama3.2" -o results.jsonl
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.token_counter import token_counter
+from .async_streams import stream_loop
+from .comparison import ComparisonTarget
+from .metrics import StreamMetrics
+from .rate_limiter import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Same placeholder syntax as the Prompt Library templates
+_VARIABLE = re.compile(r"\{\{\s*([\w.-]+)\s*\}\}")
+
+DEFAULT_CONCURRENCY = 4
+
+
+def template_variables(template: str) -> List[str]:
+    """Names of the {{variables}} used in a template, in order of first use."""
+    return list(dict.fromkeys(_VARIABLE.findall(template)))
+
+
+def render_template(template: str, variables: Dict[str, Any]) -> str:
+    """
+    Substitute {{name}} placeholders with values from a row.
+    :raises ValueError: listing the variables the row does not provide
+    """
+    missing = [name for name in template_variables(template) if variables.get(name) is None]
+    if missing:
+        raise ValueError(f"Missing template variables: {', '.join(missing)}")
+    return _VARIABLE.sub(lambda match: str(variables[match.group(1)]), template)
+
+
+def load_rows(path: str) -> List[Dict[str, Any]]:
+    """Read input rows from a .csv file (one row per line, header required) or a .jsonl file."""
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return [dict(row) for row in csv.DictReader(f)]
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}")
+            rows.append(row if isinstance(row, dict) else {"prompt": row})
+    return rows
+
+
+@dataclass
+class BatchProgress:
+    """Counters of a batch run with throughput and ETA."""
+    total: int = 0
+    skipped: int = 0
+    completed: int = 0
+    failed: int = 0
+    tokens: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def done(self) -> int:
+        return self.completed + self.failed
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.skipped - self.done)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Finished requests per second in this run."""
+        if self.done == 0 or self.elapsed <= 0:
+            return None
+        return self.done / self.elapsed
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until the remaining requests finish at the current throughput."""
+        throughput = self.throughput
+        if throughput is None:
+            return None
+        return self.remaining / throughput
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "remaining": self.remaining,
+            "tokens": self.tokens,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "tokens_per_second": self.tokens / self.elapsed if self.elapsed > 0 else None,
+            "eta": self.eta,
+        }
+
+    def describe(self) -> str:
+        """One-line progress summary for logs."""
+        text = f"{self.done + self.skipped}/{self.total} done ({self.failed} failed, {self.skipped} resumed)"
+        throughput = self.throughput
+        if throughput:
+            text += f", {throughput * 60:.1f} req/min, ETA {self.eta:.0f}s"
+        return text
+
+
+class BatchRunner:
+    """Run rows of prompts through provider/model targets with per-provider concurrency limits."""
+
+    def __init__(self, client, rows: Iterable[Dict[str, Any]], targets: Iterable[Tuple[str, str]],
+                 output_path: str, template: Optional[str] = None, system_message: Optional[str] = None,
+                 model_params: Optional[Dict[str, Any]] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 provider_concurrency: Optional[Dict[str, int]] = None, id_field: str = "id",
+                 on_progress: Optional[Callable[[BatchProgress], None]] = None):
+        """
+        :param rows: dicts of template variables; without a template each row needs a "prompt"
+        :param targets: (provider, model) pairs every row is sent to
+        :param output_path: JSONL file results are appended to; also the resume checkpoint
+        :param concurrency: int, default number of concurrent requests per provider
+        :param provider_concurrency: provider -> concurrent requests, overriding the default
+        :param id_field: row field identifying a row across runs (falls back to its position)
+        """
+        self.client = client
+        self.rows = list(rows)
+        self.targets = [ComparisonTarget(provider, model) for provider, model in targets]
+        if not self.targets:
+            raise ValueError("A batch run needs at least one target")
+        self.output_path = output_path
+        self.template = template
+        self.system_message = system_message
+        self.model_params = model_params or {}
+        self.concurrency = max(1, concurrency)
+        self.provider_concurrency = provider_concurrency or {}
+        self.id_field = id_field
+        self.on_progress = on_progress
+        self.progress = BatchProgress()
+        self._output = None
+        self._write_lock = threading.Lock()
+
+    def _row_id(self, index: int, row: Dict[str, Any]) -> str:
+        value = row.get(self.id_field)
+        return str(value) if value not in (None, "") else str(index)
+
+    def _render(self, row: Dict[str, Any]) -> str:
+        if self.template:
+            return render_template(self.template, row)
+        prompt = row.get("prompt")
+        if prompt is None:
+            raise ValueError("Row has no 'prompt' field and no template was given")
+        return str(prompt)
+
+    def completed_pairs(self) -> Set[Tuple[str, str]]:
+        """(row id, target key) pairs that already have a successful record in the output file."""
+        done = set()
+        if not os.path.exists(self.output_path):
+            return done
+        with open(self.output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut off by a crash; that request simply runs again
+                    continue
+                if record.get("status") == "ok":
+                    done.add((str(record.get("id")), f"{record.get('provider')}:{record.get('model')}"))
+        return done
+
+    def _write(self, record: Dict[str, Any]):
+        with self._write_lock:
+            self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._output.flush()
+            os.fsync(self._output.fileno())
+
+    async def _awrite(self, record: Dict[str, Any]):
+        # fsync blocks; keep it off the event loop other streams share
+        await asyncio.get_running_loop().run_in_executor(None, self._write, record)
+
+    def _terminate_last_line(self):
+        """End a line cut off by a crash, so the first new record starts on its own line."""
+        if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0:
+            return
+        with open(self.output_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _report(self):
+        if self.on_progress is not None:
+            try:
+                self.on_progress(self.progress)
+            except Exception as e:
+                logger.warning(f"Batch progress callback failed: {e}")
+
+    async def _run_one(self, semaphore: asyncio.Semaphore, row_id: str, row: Dict[str, Any],
+                       target: ComparisonTarget):
+        record = {"id": row_id, "provider": target.provider, "model": target.model}
+        async with semaphore:
+            metrics = StreamMetrics(target.provider, target.model)
+            chunks = []
+            usage = {}
+            try:
+                prompt = self._render(row)
+                record["prompt"] = prompt
+                stream = self.client.agenerate_response(
+                    prompt,
+                    provider_name=target.provider,
+                    model_name=target.model,
+                    system_message=self.system_message,
+                    model_params=dict(self.model_params),
+                    failover=False,
+                    priority=PRIORITY_BACKGROUND,
+                    on_usage=usage.update
+                )
+                try:
+                    async for chunk in stream:
+                        metrics.record_chunk(chunk)
+                        chunks.append(chunk)
+                finally:
+                    await stream.aclose()
+            except Exception as e:
+                metrics.finish(error=str(e))
+                record.update(status="error", error=str(e))
+                self.progress.failed += 1
+                logger.warning(f"Batch row {row_id} on {target.key} failed: {e}")
+            else:
+                metrics.finish()
+                record.update(status="ok", response="".join(chunks))
+                self.progress.completed += 1
+            # Chunks are not tokens (a chunk may hold several); prefer the provider's count
+            if usage.get("output_tokens"):
+                record["usage"] = usage
+                self.progress.tokens += usage["output_tokens"]
+            else:
+                self.progress.tokens += token_counter.count("".join(chunks), target.model)
+            record["metrics"] = metrics.to_dict()
+        await self._awrite(record)
+        self._report()
+
+    async def arun(self) -> BatchProgress:
+        """Run all pending row/target pairs; returns the final progress."""
+        done = self.completed_pairs()
+        self.progress = BatchProgress(total=len(self.rows) * len(self.targets))
+        semaphores: Dict[str, asyncio.Semaphore] = {}
+        tasks = []
+        for index, row in enumerate(self.rows):
+            row_id = self._row_id(index, row)
+            for target in self.targets:
+                if (row_id, target.key) in done:
+                    self.progress.skipped += 1
+                    continue
+                semaphore = semaphores.get(target.provider)
+                if semaphore is None:
+                    limit = self.provider_concurrency.get(target.provider, self.concurrency)
+                    semaphore = semaphores[target.provider] = asyncio.Semaphore(max(1, limit))
+                tasks.append((semaphore, row_id, row, target))
+
+        if self.progress.skipped:
+            logger.info(f"Resuming batch: {self.progress.skipped} results already in {self.output_path}")
+        output_dir = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(output_dir, exist_ok=True)
+        self._terminate_last_line()
+        with open(self.output_path, "a", encoding="utf-8") as self._output:
+            # One task per request; the semaphores keep each provider's concurrency bounded
+            await asyncio.gather(*(self._run_one(*task) for task in tasks))
+        self._output = None
+        self._report()
+        return self.progress
+
+    def run(self) -> BatchProgress:
+        """Run the batch to completion on a private event loop (for scripts)."""
+        return asyncio.run(self.arun())
+
+    def start(self):
+        """Run the batch on the shared stream loop; returns a concurrent.futures.Future."""
+        return stream_loop.submit(self.arun())
+
+
+def _parse_target(value: str) -> Tuple[str, str]:
+    # Model names may contain ':' (Ollama tags), provider names never do
+    provider, _, model = value.partition(":")
+    if not provider or not model:
+        raise argparse.ArgumentTypeError(f"Expected provider:model, got {value!r}")
+    return provider, model
+
+
+def _parse_provider_limit(value: str) -> Tuple[str, int]:
+    provider, _, limit = value.rpartition("=")
+    if not provider or not limit.isdigit():
+        raise argparse.ArgumentTypeError(f"Expected provider=N, got {value!r}")
+    return provider, int(limit)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Run a CSV/JSONL file of prompts through one or more models")
+    parser.add_argument("input", help="CSV (with header) or JSONL file of rows")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file; re-run to resume")
+    parser.add_argument("--target", action="append", type=_parse_target, required=True,
+                        help="provider:model to run every row through (repeatable)")
+    template = parser.add_mutually_exclusive_group()
+    template.add_argument("-t", "--template", help="prompt template with {{column}} placeholders")
+    template.add_argument("--template-file", help="file containing the prompt template")
+    parser.add_argument("--system", help="system message")
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--max-tokens", type=int)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="concurrent requests per provider")
+    parser.add_argument("--provider-concurrency", action="append", type=_parse_provider_limit, default=[],
+                        metavar="PROVIDER=N", help="concurrency for one provider (repeatable)")
+    parser.add_argument("--id-field", default="id", help="row field identifying rows across runs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    template_text = args.template
+    if args.template_file:
+        with open(args.template_file, "r", encoding="utf-8") as f:
+            template_text = f.read()
+    model_params = {}
+    if args.temperature is not None:
+        model_params["temperature"] = args.temperature
+    if args.max_tokens is not None:
+        model_params["max_tokens"] = args.max_tokens
+
+    from .multi_provider import MultiProviderClient
+    client = MultiProviderClient()
+    client.wait_for_discovery()
+
+    last_report = [0.0]
+
+    def report(progress: BatchProgress):
+        # At most one line per second, plus the final one
+        now = time.perf_counter()
+        if now - last_report[0] >= 1.0 or progress.remaining == 0:
+            last_report[0] = now
+            logger.info(progress.describe())
+
+    runner = BatchRunner(
+        client, load_rows(args.input), args.target, args.output,
+        template=template_text,
+        system_message=args.system,
+        model_params=model_params,
+        concurrency=args.concurrency,
+        provider_concurrency=dict(args.provider_concurrency),
+        id_field=args.id_field,
+        on_progress=report
+    )
+    try:
+        progress = runner.run()
+    finally:
+        client.cleanup()
+    print(json.dumps(progress.to_dict(), indent=2))
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
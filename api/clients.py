@@ -2,51 +2,322 @@
 API Clients module for multi-provider LLM access
 """
 
-import json
-import requests
-from core.config import (GEMINI_AVAILABLE, ANTHROPIC_AVAILABLE, OPENAI_AVAILABLE, 
-                        OLLAMA_AVAILABLE, genai, anthropic, openai, 
-                        QSettings, logger)
+import asyncio
+import contextvars
+import threading
+import time
+from core.config import OLLAMA_AVAILABLE, QSettings, logger
+from core.token_counter import token_counter
+from .async_streams import HTTPX_AVAILABLE, aiter_ndjson, aiter_sse_json, aiter_sync
+from .http_pool import HTTPSessionPool
+from .model_cache import CatalogEntry, ModelCatalogCache
+from .ollama_residency import ollama_residency
+from .provider_registry import provider_registry
+from .slot_affinity import SlotAffinity, conversation_key
+from .stream_decoder import iter_decoded, openai_delta_text
+
+# Marks an SDK client that has not been constructed yet
+_UNSET = object()
+
+# Usage holder of the request whose client code is running; clients are shared, so usage is kept per request
+_request_usage = contextvars.ContextVar("request_usage", default=None)
+
+
+class RequestUsage:
+    """
+    Token usage of one request. Iterate a client's response through wrap()
+    (or awrap() for async streams) and whatever usage the client reports
+    while producing it ends up in .usage, however many requests share the client.
+    """
+
+    def __init__(self):
+        self.usage = None
+
+    def wrap(self, iterator):
+        iterator = iter(iterator)
+        try:
+            while True:
+                token = _request_usage.set(self)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _request_usage.reset(token)
+                yield chunk
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    async def awrap(self, stream):
+        try:
+            while True:
+                token = _request_usage.set(self)
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _request_usage.reset(token)
+                yield chunk
+        finally:
+            await stream.aclose()
+
 
 class APIClient:
     """Base class for API clients"""
+    # Keep-alive sessions shared by every requests-based client, one per host
+    http_pool = HTTPSessionPool()
+    # Model catalogs shared by all clients, persisted for instant startup
+    model_cache = ModelCatalogCache()
+    # Most texts one embeddings request may carry (0: the provider has no embeddings API)
+    EMBED_BATCH_SIZE = 0
+    DEFAULT_EMBEDDING_MODEL = None
+
     def __init__(self, api_key=None):
         self.api_key = api_key
         self.name = "Base"
         self.models = []
+        # Token usage of the last completed request, including prompt cache reads/writes
+        self.last_usage = None
+        # Provider SDK client, imported and built by _create_client on first use
+        self._client = _UNSET
+        self._client_lock = threading.Lock()
+
+    def _create_client(self):
+        """Import the provider SDK and construct its client; None if the provider has none"""
+        return None
+
+    @property
+    def client(self):
+        """Provider SDK client, constructed on first access (None if unavailable)"""
+        if self._client is _UNSET:
+            with self._client_lock:
+                if self._client is _UNSET:
+                    try:
+                        self._client = self._create_client()
+                    except ImportError as e:
+                        logger.warning(f"{self.name} library not available: {e}")
+                        self._client = None
+                    except Exception as e:
+                        logger.error(f"Failed to initialize {self.name} client: {e}")
+                        self._client = None
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def client_initialized(self):
+        """Whether the SDK client has been constructed yet"""
+        return self._client is not _UNSET
+
+    def _openai_sdk_client(self, base_url=None):
+        """OpenAI SDK client for OpenAI and OpenAI-compatible APIs"""
+        if not self.api_key:
+            return None
+        import openai
+        return openai.OpenAI(api_key=self.api_key, base_url=base_url)
+    
+    @classmethod
+    def configure_http_pool(cls, pool_connections=None, pool_maxsize=None, http2=None):
+        """Configure the shared HTTP connection pool"""
+        cls.http_pool.configure(pool_connections=pool_connections, pool_maxsize=pool_maxsize, http2=http2)
+    
+    @classmethod
+    def get_http_pool_metrics(cls):
+        """Get connection reuse statistics for the shared HTTP pool"""
+        return cls.http_pool.get_metrics()
     
     def get_models(self):
         """Get available models"""
         return self.models
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
-        """Generate response from the API"""
+    def _catalog_endpoint(self):
+        """Endpoint used to key this client's cached model catalog"""
+        return getattr(self, 'base_url', None) or getattr(self, 'host', None) or ""
+    
+    def _catalog_fetcher(self, timeout=None):
+        """Return a callable that fetches the model catalog, or None for static model lists"""
+        return None
+    
+    def _http_catalog_fetcher(self, url, headers=None, timeout=None, parse=None):
+        """Build a catalog fetcher for an HTTP model listing, using ETag/Last-Modified validators"""
+        def fetch(entry):
+            request_headers = dict(headers or {})
+            if entry is not None:
+                if entry.etag:
+                    request_headers["If-None-Match"] = entry.etag
+                if entry.last_modified:
+                    request_headers["If-Modified-Since"] = entry.last_modified
+            response = self.http_pool.get(url, headers=request_headers, timeout=timeout)
+            if response.status_code == 304 and entry is not None:
+                return None
+            response.raise_for_status()
+            data = response.json()
+            models = parse(data) if parse else [model["id"] for model in data.get("data", [])]
+            return CatalogEntry(
+                models=models,
+                fetched_at=time.time(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified")
+            )
+        return fetch
+    
+    def get_cached_models(self):
+        """Get models from the catalog cache; stale listings are revalidated in the background"""
+        self.models = self.model_cache.get(self.name, self._catalog_endpoint(), self._catalog_fetcher())
+        return self.models
+    
+    def refresh_cached_models(self, timeout=None):
+        """Force a refresh of the model catalog, raising if the provider cannot be reached"""
+        fetcher = self._catalog_fetcher(timeout) if timeout is not None else self._catalog_fetcher()
+        self.models = self.model_cache.get(self.name, self._catalog_endpoint(), fetcher, force=True)
+        return self.models
+    
+    def get_cached_snapshot(self):
+        """Get the last known models for this client without any network access"""
+        return self.model_cache.peek(self.name, self._catalog_endpoint())
+    
+    def _set_usage(self, input_tokens=0, output_tokens=0, cache_read_tokens=0, cache_write_tokens=0):
+        """
+        Record the token usage reported for a request: in its RequestUsage when
+        there is one, and as last_usage (the latest of any caller) for direct use
+        """
+        usage = {
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "cache_read_tokens": cache_read_tokens or 0,
+            "cache_write_tokens": cache_write_tokens or 0
+        }
+        capture = _request_usage.get()
+        if capture is not None:
+            capture.usage = usage
+        self.last_usage = usage
+    
+    def _record_openai_usage(self, usage):
+        """Record usage from an OpenAI-compatible response, including automatic prefix cache hits"""
+        if not usage:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None) if details else None
+        if cached is None:
+            # DeepSeek reports its disk cache separately
+            cached = getattr(usage, 'prompt_cache_hit_tokens', 0)
+        self._set_usage(getattr(usage, 'prompt_tokens', 0), getattr(usage, 'completion_tokens', 0), cached)
+    
+    def _record_gemini_usage(self, response):
+        """Record usage from a Gemini response, including implicit context cache hits"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage:
+            self._set_usage(getattr(usage, 'prompt_token_count', 0), getattr(usage, 'candidates_token_count', 0),
+                            getattr(usage, 'cached_content_token_count', 0))
+    
+    def _openai_chat_completion(self, model, messages, stream):
+        """
+        Run a chat completion on an OpenAI-compatible SDK client and yield its text,
+        recording the usage it reports (streams ask for it in a final chunk)
+        """
+        params = {"model": model, "messages": messages, "stream": stream}
+        if stream:
+            params["stream_options"] = {"include_usage": True}
+        response = self.client.chat.completions.create(**params)
+        if not stream:
+            self._record_openai_usage(getattr(response, 'usage', None))
+            yield response.choices[0].message.content
+            return
+        for chunk in response:
+            # Groq reports stream usage under x_groq
+            usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+            if usage:
+                self._record_openai_usage(usage)
+            # The final usage chunk has no choices
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    @staticmethod
+    def _build_messages(prompt, system_message=None, history=None):
+        """Build a chat message list: system message, prior turns, then the prompt"""
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        if history:
+            messages.extend(history)
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    @staticmethod
+    def _build_transcript(prompt, history=None):
+        """Flatten prior turns and the prompt into "Role: text" lines for prompt-only APIs"""
+        turns = list(history or []) + [{"role": "user", "content": prompt}]
+        return "\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in turns)
+    
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
+        """
+        Generate response from the API
+        :param history: list of prior {"role", "content"} turns, oldest first
+                        (see core.conversation_context.ConversationContext.history)
+        """
         raise NotImplementedError
+    
+    async def agenerate_response(self, prompt, model, system_message=None, model_params=None, history=None):
+        """Stream a response as an async iterator of text chunks"""
+        # Fallback for clients without a native async path: drive the blocking
+        # generator from the event loop's executor
+        async for chunk in aiter_sync(lambda: self.generate_response(
+                prompt, model, stream=True, system_message=system_message, model_params=model_params,
+                history=history)):
+            yield chunk
+    
+    @property
+    def supports_embeddings(self):
+        return self.EMBED_BATCH_SIZE > 0
+    
+    def embed(self, texts, model=None):
+        """
+        Embed one batch of at most EMBED_BATCH_SIZE texts; returns one vector per text.
+        Use api.embeddings.EmbeddingService for batching, concurrency and caching.
+        """
+        raise NotImplementedError(f"{self.name} does not provide embeddings")
+    
+    def _embed_openai_compatible(self, url, texts, model, headers=None):
+        """POST to an OpenAI-style /embeddings endpoint and return the vectors in input order"""
+        response = self.http_pool.post(url, json={"model": model, "input": list(texts)},
+                                       headers=headers, timeout=60)
+        response.raise_for_status()
+        data = sorted(response.json().get("data", []), key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
 
 class GeminiClient(APIClient):
     """Google Gemini API client"""
+    EMBED_BATCH_SIZE = 100
+    DEFAULT_EMBEDDING_MODEL = "text-embedding-004"
+
     def __init__(self, api_key=None):
         super().__init__(api_key)
         self.name = "Gemini"
         self.models = ["gemini-2.5-flash", "gemini-2.5-pro", "gemini-1.5-flash", "gemini-1.5-pro"]
-        self.client = None
-        if api_key and GEMINI_AVAILABLE and genai:
-            try:
-                # Use the new google-genai library
-                self.client = genai.Client(api_key=api_key)  # type: ignore
-            except Exception as e:
-                logger.error(f"Failed to initialize Gemini client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        """Create the google-genai client"""
+        if not self.api_key:
+            return None
+        from google import genai
+        return genai.Client(api_key=self.api_key)
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Gemini"""
         if not self.client:
             raise Exception("Gemini client not initialized. Check API key.")
         
-        # Prepare the content with system message if provided
+        # Prepare the content with system message and prior turns if provided
         full_prompt = prompt
-        if system_message:
-            full_prompt = f"System: {system_message}\n\nUser: {prompt}"
+        if system_message or history:
+            full_prompt = self._build_transcript(prompt, history)
+            if system_message:
+                full_prompt = f"System: {system_message}\n\n{full_prompt}"
         
         try:
             if stream:
@@ -58,11 +329,14 @@ class GeminiClient(APIClient):
                 for chunk in response:
                     if hasattr(chunk, 'text') and chunk.text:
                         yield chunk.text
+                    # Usage is cumulative; the last chunk carries the totals
+                    self._record_gemini_usage(chunk)
             else:
                 response = self.client.models.generate_content(
                     model=model, 
                     contents=full_prompt
                 )
+                self._record_gemini_usage(response)
                 if hasattr(response, 'text') and response.text:
                     yield response.text
                 else:
@@ -70,35 +344,98 @@ class GeminiClient(APIClient):
         except Exception as e:
             raise Exception(f"Gemini API error: {e}")
 
+    def embed(self, texts, model=None):
+        """Embed a batch of texts with the Gemini embeddings API"""
+        if not self.client:
+            raise Exception("Gemini client not initialized. Check API key.")
+        try:
+            result = self.client.models.embed_content(model=model or self.DEFAULT_EMBEDDING_MODEL,
+                                                      contents=list(texts))
+            return [list(embedding.values) for embedding in result.embeddings]
+        except Exception as e:
+            raise Exception(f"Gemini embeddings error: {e}")
+
 class ClaudeClient(APIClient):
     """Anthropic Claude API client"""
+    # Anthropic caches prefixes of at least this many tokens (twice as many for Haiku models)
+    CACHE_MIN_TOKENS = 1024
+    MAX_CACHE_BREAKPOINTS = 4
+
     def __init__(self, api_key=None):
         super().__init__(api_key)
         self.name = "Claude"
         self.models = ["claude-3-sonnet-20240229", "claude-3-haiku-20240307", "claude-3-opus-20240229"]
-        self.client = None
-        if api_key and ANTHROPIC_AVAILABLE and anthropic:
-            try:
-                self.client = anthropic.Anthropic(api_key=api_key)
-            except Exception as e:
-                logger.error(f"Failed to initialize Claude client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        """Create the Anthropic SDK client"""
+        if not self.api_key:
+            return None
+        import anthropic
+        return anthropic.Anthropic(api_key=self.api_key)
+    
+    @staticmethod
+    def _cached_block(text):
+        return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def _apply_cache_breakpoints(self, api_params, model):
+        """
+        Mark stable prefixes as cacheable: the system prompt, the conversation
+        up to the new prompt (read back on the next turn) and long earlier turns
+        such as attachments. Anthropic allows at most four breakpoints.
+        """
+        minimum = self.CACHE_MIN_TOKENS * (2 if "haiku" in model else 1)
+        breakpoints = 0
+        
+        system = api_params.get("system")
+        prefix_tokens = token_counter.count(system, model) if system else 0
+        if system and prefix_tokens >= minimum:
+            api_params["system"] = self._cached_block(system)
+            breakpoints += 1
+        
+        messages = api_params["messages"]
+        turn_tokens = token_counter.count_batch((message["content"] for message in messages), model)
+        prefix_tokens += sum(turn_tokens)
+        if prefix_tokens < minimum:
+            return
+        # The newest turn caches the whole conversation for the next request
+        marked = [len(messages) - 1]
+        # Long earlier turns (attachments, pasted documents) get the remaining breakpoints, newest first
+        for index in range(len(messages) - 2, -1, -1):
+            if len(marked) >= self.MAX_CACHE_BREAKPOINTS - breakpoints:
+                break
+            if turn_tokens[index] >= minimum:
+                marked.append(index)
+        for index in marked:
+            messages[index] = {"role": messages[index]["role"], "content": self._cached_block(messages[index]["content"])}
+    
+    def _record_usage(self, usage):
+        if usage:
+            self._set_usage(getattr(usage, 'input_tokens', 0), getattr(usage, 'output_tokens', 0),
+                            getattr(usage, 'cache_read_input_tokens', 0),
+                            getattr(usage, 'cache_creation_input_tokens', 0))
+    
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Claude"""
         if not self.client:
             raise Exception("Claude client not initialized. Check API key.")
         
+        # Claude takes system text separately, so pull system turns (e.g. a history summary) out
+        history = history or []
+        system_parts = [system_message] if system_message else []
+        system_parts.extend(turn["content"] for turn in history if turn["role"] == "system")
+        messages = [turn for turn in history if turn["role"] != "system"]
+        messages.append({"role": "user", "content": prompt})
+        
         # Prepare API parameters
         api_params = {
             "model": model,
             "max_tokens": 4000,  # Default max tokens
-            "messages": [{"role": "user", "content": prompt}]
+            "messages": messages
         }
         
         # Add system message if provided
-        if system_message:
-            api_params["system"] = system_message
+        if system_parts:
+            api_params["system"] = "\n\n".join(system_parts)
         
         # Apply model parameters if provided
         if model_params:
@@ -120,13 +457,17 @@ class ClaudeClient(APIClient):
             if 'stop' in model_params and model_params['stop']:
                 api_params['stop_sequences'] = model_params['stop']
         
+        self._apply_cache_breakpoints(api_params, model)
+        
         try:
             if stream:
                 with self.client.messages.stream(**api_params) as stream:
                     for text in stream.text_stream:
                         yield text
+                    self._record_usage(stream.get_final_message().usage)
             else:
                 response = self.client.messages.create(**api_params)
+                self._record_usage(getattr(response, 'usage', None))
                 if hasattr(response, 'content') and response.content:
                     # Claude response content is a list of content blocks
                     for content_block in response.content:
@@ -146,33 +487,34 @@ class DeepSeekClient(APIClient):
         self.name = "DeepSeek"
         self.models = ["deepseek-chat", "deepseek-coder"]
         self.base_url = "https://api.deepseek.com/v1"
-        self.client = None
-        if api_key and OPENAI_AVAILABLE and openai:
-            try:
-                self.client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-            except Exception as e:
-                logger.error(f"Failed to initialize DeepSeek client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        return self._openai_sdk_client(self.base_url)
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from DeepSeek"""
         if not self.client:
             raise Exception("DeepSeek client not initialized. Check API key.")
         
         try:
+            # Prefix caching is automatic; ask for usage to see the cache hits
             response = self.client.chat.completions.create(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
-                stream=stream
+                messages=self._build_messages(prompt, system_message, history),
+                stream=stream,
+                **({"stream_options": {"include_usage": True}} if stream else {})
             )
             
             if stream:
                 for chunk in response:
+                    if getattr(chunk, 'usage', None):
+                        self._record_openai_usage(chunk.usage)
                     if hasattr(chunk, 'choices') and chunk.choices:  # type: ignore
                         choice = chunk.choices[0]  # type: ignore
                         if hasattr(choice, 'delta') and choice.delta and hasattr(choice.delta, 'content') and choice.delta.content:
                             yield choice.delta.content
             else:
+                self._record_openai_usage(getattr(response, 'usage', None))
                 if hasattr(response, 'choices') and response.choices:  # type: ignore
                     choice = response.choices[0]  # type: ignore
                     if hasattr(choice, 'message') and choice.message and hasattr(choice.message, 'content') and choice.message.content:
@@ -191,33 +533,34 @@ class QwenClient(APIClient):
         self.name = "Qwen"
         self.models = ["qwen-plus", "qwen-turbo", "qwen-max", "qwen2.5-72b-instruct", "qwen-max-0919", "qwen-plus-0919"]
         self.base_url = "https://dashscope-intl.aliyuncs.com/compatible-mode/v1"
-        self.client = None
-        if api_key and OPENAI_AVAILABLE and openai:
-            try:
-                self.client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-            except Exception as e:
-                logger.error(f"Failed to initialize Qwen client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        return self._openai_sdk_client(self.base_url)
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Qwen"""
         if not self.client:
             raise Exception("Qwen client not initialized. Check API key.")
         
         try:
+            # Prefix caching is automatic; ask for usage to see the cache hits
             response = self.client.chat.completions.create(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
-                stream=stream
+                messages=self._build_messages(prompt, system_message, history),
+                stream=stream,
+                **({"stream_options": {"include_usage": True}} if stream else {})
             )
             
             if stream:
                 for chunk in response:
+                    if getattr(chunk, 'usage', None):
+                        self._record_openai_usage(chunk.usage)
                     if hasattr(chunk, 'choices') and chunk.choices:  # type: ignore
                         choice = chunk.choices[0]  # type: ignore
                         if hasattr(choice, 'delta') and choice.delta and hasattr(choice.delta, 'content') and choice.delta.content:
                             yield choice.delta.content
             else:
+                self._record_openai_usage(getattr(response, 'usage', None))
                 if hasattr(response, 'choices') and response.choices:  # type: ignore
                     choice = response.choices[0]  # type: ignore
                     if hasattr(choice, 'message') and choice.message and hasattr(choice.message, 'content') and choice.message.content:
@@ -231,6 +574,9 @@ class QwenClient(APIClient):
 
 class OpenAIClient(APIClient):
     """OpenAI API client"""
+    EMBED_BATCH_SIZE = 2048
+    DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+
     def __init__(self, api_key=None):
         super().__init__(api_key)
         self.name = "OpenAI"
@@ -238,23 +584,16 @@ class OpenAIClient(APIClient):
             "gpt-4", "gpt-4-turbo", "gpt-4-turbo-preview", 
             "gpt-3.5-turbo", "gpt-3.5-turbo-16k"
         ]
-        self.client = None
-        if api_key and OPENAI_AVAILABLE and openai:
-            try:
-                self.client = openai.OpenAI(api_key=api_key)
-            except Exception as e:
-                logger.error(f"Failed to initialize OpenAI client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        return self._openai_sdk_client()
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from OpenAI"""
         if not self.client:
             raise Exception("OpenAI client not initialized. Check API key.")
         
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_message, history)
         
         # Prepare API parameters
         api_params = {
@@ -288,64 +627,84 @@ class OpenAIClient(APIClient):
             if 'stop' in model_params and model_params['stop']:
                 api_params['stop'] = model_params['stop']
         
+        # Prompt caching is automatic for prefixes over 1024 tokens; usage reports the cached part
+        if stream:
+            api_params["stream_options"] = {"include_usage": True}
+        
         try:
             response = self.client.chat.completions.create(**api_params)
             
             if stream:
                 for chunk in response:
-                    if chunk.choices[0].delta.content:
+                    if chunk.usage:
+                        self._record_openai_usage(chunk.usage)
+                    # The final usage chunk has no choices
+                    if chunk.choices and chunk.choices[0].delta.content:
                         yield chunk.choices[0].delta.content
             else:
+                self._record_openai_usage(response.usage)
                 yield response.choices[0].message.content
                 
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
             raise Exception(f"OpenAI API error: {e}")
 
+    def embed(self, texts, model=None):
+        """Embed a batch of texts with the OpenAI embeddings API"""
+        if not self.client:
+            raise Exception("OpenAI client not initialized. Check API key.")
+        try:
+            response = self.client.embeddings.create(model=model or self.DEFAULT_EMBEDDING_MODEL, input=list(texts))
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            logger.error(f"OpenAI embeddings error: {e}")
+            raise Exception(f"OpenAI embeddings error: {e}")
+
 class LMStudioClient(APIClient):
     """LM Studio API client (OpenAI-compatible)"""
-    def __init__(self, base_url="http://127.0.0.1:1234"):
+    def __init__(self, base_url="http://127.0.0.1:1234", auto_refresh=True):
         super().__init__()
         self.name = "LM Studio"
         self.base_url = base_url
         self.models = []
-        self.refresh_models()
+        if auto_refresh:
+            self.refresh_models()
     
-    def refresh_models(self):
+    def _catalog_fetcher(self, timeout=5):
+        """Fetch the LM Studio model list"""
+        return self._http_catalog_fetcher(f"{self.base_url}/v1/models", timeout=timeout)
+    
+    def refresh_models(self, timeout=5):
         """Refresh available models from LM Studio"""
         try:
-            response = requests.get(f"{self.base_url}/v1/models", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                self.models = [model["id"] for model in data.get("data", [])]
-                logger.info(f"LM Studio models refreshed: {len(self.models)} models")
-            else:
-                logger.warning(f"Failed to get LM Studio models: {response.status_code}")
+            self.refresh_cached_models(timeout)
+            logger.info(f"LM Studio models refreshed: {len(self.models)} models")
         except Exception as e:
             logger.warning(f"LM Studio not available: {e}")
             self.models = []
+        return self.models
     
     def get_models(self):
         """Get available models"""
-        self.refresh_models()
-        return self.models
+        return self.get_cached_models()
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
-        """Generate response from LM Studio"""
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+    def _chat_payload(self, prompt, model, stream, system_message=None, history=None):
+        """Build the chat completion request body"""
+        messages = self._build_messages(prompt, system_message, history)
         
-        payload = {
+        return {
             "model": model,
             "messages": messages,
             "stream": stream,
             "temperature": 0.7
         }
+    
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
+        """Generate response from LM Studio"""
+        payload = self._chat_payload(prompt, model, stream, system_message, history)
         
         try:
-            response = requests.post(
+            response = self.http_pool.post(
                 f"{self.base_url}/v1/chat/completions",
                 json=payload,
                 stream=stream,
@@ -353,22 +712,10 @@ class LMStudioClient(APIClient):
             )
             
             if stream:
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            line = line[6:]
-                            if line.strip() == '[DONE]':
-                                break
-                            try:
-                                data = json.loads(line)
-                                if 'choices' in data and len(data['choices']) > 0:
-                                    delta = data['choices'][0].get('delta', {})
-                                    content = delta.get('content', '')
-                                    if content:
-                                        yield content
-                            except json.JSONDecodeError:
-                                continue
+                for data in iter_decoded(response):
+                    content = openai_delta_text(data)
+                    if content:
+                        yield content
             else:
                 data = response.json()
                 if 'choices' in data and len(data['choices']) > 0:
@@ -377,53 +724,124 @@ class LMStudioClient(APIClient):
         except Exception as e:
             logger.error(f"LM Studio API error: {e}")
             raise Exception(f"LM Studio API error: {e}")
+    
+    async def agenerate_response(self, prompt, model, system_message=None, model_params=None, history=None):
+        """Stream a response from LM Studio on the event loop"""
+        if not HTTPX_AVAILABLE:
+            async for chunk in super().agenerate_response(prompt, model, system_message, model_params, history):
+                yield chunk
+            return
+        
+        payload = self._chat_payload(prompt, model, True, system_message, history)
+        try:
+            async for data in aiter_sse_json(f"{self.base_url}/v1/chat/completions", payload, timeout=30):
+                content = openai_delta_text(data)
+                if content:
+                    yield content
+        except Exception as e:
+            logger.error(f"LM Studio API error: {e}")
+            raise Exception(f"LM Studio API error: {e}")
 
 class LlamaCppClient(APIClient):
     """llama.cpp server API client"""
-    def __init__(self, base_url="http://127.0.0.1:8080"):
+    # Every text of a batch has to fit the server's batch size together
+    EMBED_BATCH_SIZE = 16
+
+    def __init__(self, base_url="http://127.0.0.1:8080", auto_refresh=True):
         super().__init__()
         self.name = "llama.cpp"
         self.base_url = base_url
         self.models = []
-        self.refresh_models()
+        # Conversations keep to one server slot so its cached prompt is reused
+        self.slots = SlotAffinity()
+        self._slots_probed = False
+        # Whether /props reported the slot count
+        self._slots_ready = False
+        if auto_refresh:
+            self.refresh_models()
     
-    def refresh_models(self):
-        """Refresh available models from llama.cpp server"""
+    def _probe_slots(self, timeout=5):
+        """
+        Read the server's slot count (--parallel) from /props. Retried on the
+        next request until the server answers; a server without /props leaves
+        the count unknown, and the server then picks slots itself.
+        """
+        if self._slots_probed:
+            return
         try:
-            # llama.cpp server doesn't have a models endpoint, so we'll check if it's running
-            response = requests.get(f"{self.base_url}/health", timeout=5)
+            response = self.http_pool.get(f"{self.base_url}/props", timeout=timeout)
             if response.status_code == 200:
-                # If server is running, we assume there's at least one model loaded
-                self.models = ["llama.cpp-model"]
-                logger.info("llama.cpp server is running")
+                self.slots.resize(int(response.json().get("total_slots") or 1))
+                self._slots_ready = True
             else:
-                logger.warning(f"llama.cpp server health check failed: {response.status_code}")
+                logger.debug(f"llama.cpp /props returned {response.status_code}, not pinning slots")
+            self._slots_probed = True
+        except Exception as e:
+            logger.debug(f"llama.cpp /props unavailable, will retry: {e}")
+    
+    def get_slot_stats(self):
+        """Get slot affinity hits and the share of prompt tokens reused from the server's cache"""
+        return self.slots.get_stats()
+    
+    def _catalog_fetcher(self, timeout=5):
+        """Check the llama.cpp server health as its model listing"""
+        def fetch(entry):
+            # llama.cpp server doesn't have a models endpoint, so we'll check if it's running
+            response = self.http_pool.get(f"{self.base_url}/health", timeout=timeout)
+            if response.status_code != 200:
+                raise Exception(f"health check failed: {response.status_code}")
+            # If server is running, we assume there's at least one model loaded
+            return CatalogEntry(models=["llama.cpp-model"], fetched_at=time.time())
+        return fetch
+    
+    def refresh_models(self, timeout=5):
+        """Refresh available models from llama.cpp server"""
+        try:
+            self.refresh_cached_models(timeout)
+            logger.info("llama.cpp server is running")
         except Exception as e:
             logger.warning(f"llama.cpp server not available: {e}")
             self.models = []
+        return self.models
     
     def get_models(self):
         """Get available models"""
-        self.refresh_models()
-        return self.models
+        return self.get_cached_models()
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
-        """Generate response from llama.cpp server"""
-        # Combine system message and prompt
+    def _completion_payload(self, prompt, stream, system_message=None, history=None, model_params=None):
+        """Build the /completion request body"""
+        # Combine system message, prior turns and prompt
         full_prompt = prompt
-        if system_message:
-            full_prompt = f"{system_message}\n\nUser: {prompt}\nAssistant:"
+        if system_message or history:
+            full_prompt = f"{self._build_transcript(prompt, history)}\nAssistant:"
+            if system_message:
+                full_prompt = f"{system_message}\n\n{full_prompt}"
         
         payload = {
             "prompt": full_prompt,
             "stream": stream,
             "temperature": 0.7,
             "top_p": 0.9,
-            "n_predict": 512
+            "n_predict": 512,
+            # Only the part of the prompt after the slot's cached prefix is evaluated
+            "cache_prompt": True
         }
+        # A new conversation is keyed by its first turn, which is this prompt
+        key = conversation_key(system_message, history or [{"role": "user", "content": prompt}],
+                               (model_params or {}).get("conversation_id"))
+        # Until the slot count is known, pinning would crowd every conversation onto slot 0
+        slot = self.slots.assign(key) if self._slots_ready else -1
+        if slot >= 0:
+            payload["id_slot"] = slot
+        return payload
+    
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
+        """Generate response from llama.cpp server"""
+        self._probe_slots()
+        payload = self._completion_payload(prompt, stream, system_message, history, model_params)
         
         try:
-            response = requests.post(
+            response = self.http_pool.post(
                 f"{self.base_url}/completion",
                 json=payload,
                 stream=stream,
@@ -431,25 +849,61 @@ class LlamaCppClient(APIClient):
             )
             
             if stream:
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            line = line[6:]
-                            try:
-                                data = json.loads(line)
-                                content = data.get('content', '')
-                                if content:
-                                    yield content
-                            except json.JSONDecodeError:
-                                continue
+                for data in iter_decoded(response):
+                    content = data.get('content', '')
+                    if content:
+                        yield content
+                    if data.get('stop'):
+                        self.slots.record_response(data)
             else:
                 data = response.json()
+                self.slots.record_response(data)
                 yield data.get('content', '')
                     
         except Exception as e:
             logger.error(f"llama.cpp API error: {e}")
             raise Exception(f"llama.cpp API error: {e}")
+    
+    async def agenerate_response(self, prompt, model, system_message=None, model_params=None, history=None):
+        """Stream a response from the llama.cpp server on the event loop"""
+        if not HTTPX_AVAILABLE:
+            async for chunk in super().agenerate_response(prompt, model, system_message, model_params, history):
+                yield chunk
+            return
+        
+        if not self._slots_probed:
+            await asyncio.get_running_loop().run_in_executor(None, self._probe_slots)
+        payload = self._completion_payload(prompt, True, system_message, history, model_params)
+        try:
+            async for data in aiter_sse_json(f"{self.base_url}/completion", payload, timeout=30):
+                content = data.get('content', '')
+                if content:
+                    yield content
+                if data.get('stop'):
+                    self.slots.record_response(data)
+        except Exception as e:
+            logger.error(f"llama.cpp API error: {e}")
+            raise Exception(f"llama.cpp API error: {e}")
+    
+    def embed(self, texts, model=None):
+        """Embed a batch of texts with the server's /embedding endpoint (needs --embedding)"""
+        try:
+            response = self.http_pool.post(f"{self.base_url}/embedding", json={"content": list(texts)}, timeout=60)
+            response.raise_for_status()
+            data = response.json()
+            if isinstance(data, dict):
+                data = [data]
+            vectors = []
+            for item in sorted(data, key=lambda item: item.get("index", 0)):
+                embedding = item["embedding"]
+                # Newer servers nest the pooled vector in a list of one
+                if embedding and isinstance(embedding[0], list):
+                    embedding = embedding[0]
+                vectors.append(embedding)
+            return vectors
+        except Exception as e:
+            logger.error(f"llama.cpp embeddings error: {e}")
+            raise Exception(f"llama.cpp embeddings error: {e}")
 
 class GroqClient(APIClient):
     """Groq API client"""
@@ -460,40 +914,23 @@ class GroqClient(APIClient):
             "llama2-70b-4096", "mixtral-8x7b-32768", 
             "gemma-7b-it", "llama3-8b-8192", "llama3-70b-8192"
         ]
-        self.client = None
-        if api_key:
-            try:
-                import groq
-                self.client = groq.Groq(api_key=api_key)
-            except ImportError:
-                logger.warning("Groq library not available")
-            except Exception as e:
-                logger.error(f"Failed to initialize Groq client: {e}")
+
+    def _create_client(self):
+        """Create the Groq SDK client"""
+        if not self.api_key:
+            return None
+        import groq
+        return groq.Groq(api_key=self.api_key)
     
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Groq"""
         if not self.client:
             raise Exception("Groq client not initialized. Check API key or install groq library.")
         
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_message, history)
         
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=stream
-            )
-            
-            if stream:
-                for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
-            else:
-                yield response.choices[0].message.content
-                
+            yield from self._openai_chat_completion(model, messages, stream)
         except Exception as e:
             logger.error(f"Groq API error: {e}")
             raise Exception(f"Groq API error: {e}")
@@ -505,63 +942,48 @@ class NebiusClient(APIClient):
         self.name = "Nebius AI Studio"
         self.base_url = "https://api.studio.nebius.ai/v1"
         self.models = []
-        if api_key and OPENAI_AVAILABLE and openai:
+        if api_key:
             try:
-                self.client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-                self.refresh_models()
+                self.get_cached_models()
             except Exception as e:
-                logger.error(f"Failed to initialize Nebius client: {e}")
-                self.client = None
-        else:
-            if not OPENAI_AVAILABLE:
-                logger.warning("OpenAI library not available for Nebius client")
-            elif not openai:
-                logger.warning("OpenAI module not properly imported for Nebius client")
-            self.client = None
+                logger.error(f"Failed to load Nebius models: {e}")
+
+    def _create_client(self):
+        return self._openai_sdk_client(self.base_url)
+
+    def _catalog_fetcher(self, timeout=10):
+        """Fetch the Nebius model catalog"""
+        return self._http_catalog_fetcher(f"{self.base_url}/models",
+                                          headers={"Authorization": f"Bearer {self.api_key}"},
+                                          timeout=timeout)
 
     def refresh_models(self):
         """Refresh available models from Nebius"""
-        if not self.client:
-            logger.warning("Nebius client not initialized, cannot refresh models")
+        # The catalog is fetched over HTTP; checking the key avoids building the SDK client
+        if not self.api_key:
+            logger.warning("Nebius API key not set, cannot refresh models")
             return []
         try:
-            response = self.client.models.list()
-            self.models = [model.id for model in response.data]
-            return self.models
+            return self.refresh_cached_models()
         except Exception as e:
             logger.error(f"Failed to get Nebius models: {e}")
             return []
 
     def get_models(self):
         """Get available models"""
-        if not self.models:
-            self.refresh_models()
-        return self.models
+        if not self.api_key:
+            return self.models
+        return self.get_cached_models()
 
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Nebius AI Studio"""
         if not self.client:
             raise Exception("Nebius client not initialized. Check API key.")
 
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_message, history)
 
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=stream
-            )
-            
-            if stream:
-                for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
-            else:
-                yield response.choices[0].message.content
-                
+            yield from self._openai_chat_completion(model, messages, stream)
         except Exception as e:
             logger.error(f"Nebius API error: {e}")
             raise Exception(f"Nebius API error: {e}")
@@ -573,63 +995,48 @@ class OpenRouterClient(APIClient):
         self.name = "OpenRouter.ai"
         self.base_url = "https://openrouter.ai/api/v1"
         self.models = []
-        if api_key and OPENAI_AVAILABLE and openai:
+        if api_key:
             try:
-                self.client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-                self.refresh_models()
+                self.get_cached_models()
             except Exception as e:
-                logger.error(f"Failed to initialize OpenRouter client: {e}")
-                self.client = None
-        else:
-            if not OPENAI_AVAILABLE:
-                logger.warning("OpenAI library not available for OpenRouter client")
-            elif not openai:
-                logger.warning("OpenAI module not properly imported for OpenRouter client")
-            self.client = None
+                logger.error(f"Failed to load OpenRouter models: {e}")
+
+    def _create_client(self):
+        return self._openai_sdk_client(self.base_url)
+
+    def _catalog_fetcher(self, timeout=10):
+        """Fetch the OpenRouter model catalog"""
+        return self._http_catalog_fetcher(f"{self.base_url}/models",
+                                          headers={"Authorization": f"Bearer {self.api_key}"},
+                                          timeout=timeout)
 
     def refresh_models(self):
         """Refresh available models from OpenRouter"""
-        if not self.client:
-            logger.warning("OpenRouter client not initialized, cannot refresh models")
+        # The catalog is fetched over HTTP; checking the key avoids building the SDK client
+        if not self.api_key:
+            logger.warning("OpenRouter API key not set, cannot refresh models")
             return []
         try:
-            response = self.client.models.list()
-            self.models = [model.id for model in response.data]
-            return self.models
+            return self.refresh_cached_models()
         except Exception as e:
             logger.error(f"Failed to get OpenRouter models: {e}")
             return []
 
     def get_models(self):
         """Get available models"""
-        if not self.models:
-            self.refresh_models()
-        return self.models
+        if not self.api_key:
+            return self.models
+        return self.get_cached_models()
 
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from OpenRouter"""
         if not self.client:
             raise Exception("OpenRouter client not initialized. Check API key.")
 
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_message, history)
 
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=stream
-            )
-            
-            if stream:
-                for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
-            else:
-                yield response.choices[0].message.content
-                
+            yield from self._openai_chat_completion(model, messages, stream)
         except Exception as e:
             logger.error(f"OpenRouter API error: {e}")
             raise Exception(f"OpenRouter API error: {e}")
@@ -655,18 +1062,20 @@ class HuggingFacePlaygroundClient(APIClient):
         """Get available models"""
         return self.models
 
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Hugging Face Playground"""
         if not self.api_key:
             raise Exception("Hugging Face API key not provided.")
 
-        # Combine system message and prompt
+        # Combine system message, prior turns and prompt
         full_prompt = prompt
-        if system_message:
-            full_prompt = f"{system_message}\n\nUser: {prompt}\nAssistant:"
+        if system_message or history:
+            full_prompt = f"{self._build_transcript(prompt, history)}\nAssistant:"
+            if system_message:
+                full_prompt = f"{system_message}\n\n{full_prompt}"
 
         try:
-            response = requests.post(
+            response = self.http_pool.post(
                 f"{self.base_url}/models/{model}",
                 headers=self.headers,
                 json={"inputs": full_prompt}
@@ -689,27 +1098,29 @@ class GoogleAIStudioClient(APIClient):
         super().__init__(api_key)
         self.name = "Google AI Studio"
         self.models = ["gemini-2.5-flash", "gemini-2.5-pro", "gemini-1.5-pro", "gemini-1.5-flash"]
-        self.client = None
-        if api_key and GEMINI_AVAILABLE and genai:
-            try:
-                self.client = genai.Client(api_key=api_key)  # type: ignore
-            except Exception as e:
-                logger.error(f"Failed to initialize Google AI Studio client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        """Create the google-genai client"""
+        if not self.api_key:
+            return None
+        from google import genai
+        return genai.Client(api_key=self.api_key)
 
     def get_models(self):
         """Get available models"""
         return self.models
 
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Google AI Studio"""
         if not self.client:
             raise Exception("Google AI Studio client not initialized. Check API key.")
 
-        # Handle system message by prepending to prompt
+        # Handle system message and prior turns by prepending to prompt
         full_prompt = prompt
-        if system_message:
-            full_prompt = f"System: {system_message}\n\nUser: {prompt}"
+        if system_message or history:
+            full_prompt = self._build_transcript(prompt, history)
+            if system_message:
+                full_prompt = f"System: {system_message}\n\n{full_prompt}"
 
         try:
             if stream:
@@ -721,11 +1132,14 @@ class GoogleAIStudioClient(APIClient):
                 for chunk in response:
                     if hasattr(chunk, 'text') and chunk.text:
                         yield chunk.text
+                    # Usage is cumulative; the last chunk carries the totals
+                    self._record_gemini_usage(chunk)
             else:
                 response = self.client.models.generate_content(
                     model=model, 
                     contents=full_prompt
                 )
+                self._record_gemini_usage(response)
                 if hasattr(response, 'text') and response.text:
                     yield response.text
                 else:
@@ -737,39 +1151,37 @@ class GoogleAIStudioClient(APIClient):
 
 class VLLMClient(APIClient):
     """vLLM API client"""
-    def __init__(self, base_url="http://127.0.0.1:8000"):
+    EMBED_BATCH_SIZE = 256
+
+    def __init__(self, base_url="http://127.0.0.1:8000", auto_refresh=True):
         super().__init__()
         self.name = "vLLM"
         self.base_url = base_url
         self.models = []
-        self.refresh_models()
+        if auto_refresh:
+            self.refresh_models()
 
-    def refresh_models(self):
+    def _catalog_fetcher(self, timeout=None):
+        """Fetch the vLLM model list"""
+        return self._http_catalog_fetcher(f"{self.base_url}/v1/models", timeout=timeout)
+
+    def refresh_models(self, timeout=None):
         """Refresh available models from vLLM server"""
         try:
-            response = requests.get(f"{self.base_url}/v1/models")
-            response.raise_for_status()
-            data = response.json()
-            self.models = [model["id"] for model in data.get("data", [])]
-            return self.models
+            return self.refresh_cached_models(timeout)
         except Exception as e:
             logger.warning(f"Failed to get vLLM models: {e}")
             return []
 
     def get_models(self):
         """Get available models"""
-        if not self.models:
-            self.refresh_models()
-        return self.models
+        return self.get_cached_models()
 
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
-        """Generate response from vLLM server"""
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+    def _chat_payload(self, prompt, model, stream, system_message=None, history=None):
+        """Build the chat completion request body"""
+        messages = self._build_messages(prompt, system_message, history)
 
-        payload = {
+        return {
             "model": model,
             "messages": messages,
             "stream": stream,
@@ -777,8 +1189,12 @@ class VLLMClient(APIClient):
             "max_tokens": 2048
         }
 
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
+        """Generate response from vLLM server"""
+        payload = self._chat_payload(prompt, model, stream, system_message, history)
+
         try:
-            response = requests.post(
+            response = self.http_pool.post(
                 f"{self.base_url}/v1/chat/completions",
                 json=payload,
                 stream=stream
@@ -786,19 +1202,10 @@ class VLLMClient(APIClient):
             response.raise_for_status()
             
             if stream:
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            data = line[6:]
-                            if data != '[DONE]':
-                                try:
-                                    chunk = json.loads(data)
-                                    content = chunk.get('choices', [{}])[0].get('delta', {}).get('content', '')
-                                    if content:
-                                        yield content
-                                except json.JSONDecodeError:
-                                    continue
+                for chunk in iter_decoded(response):
+                    content = openai_delta_text(chunk)
+                    if content:
+                        yield content
             else:
                 data = response.json()
                 content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
@@ -808,6 +1215,31 @@ class VLLMClient(APIClient):
             logger.error(f"vLLM API error: {e}")
             raise Exception(f"vLLM API error: {e}")
 
+    async def agenerate_response(self, prompt, model, system_message=None, model_params=None, history=None):
+        """Stream a response from the vLLM server on the event loop"""
+        if not HTTPX_AVAILABLE:
+            async for chunk in super().agenerate_response(prompt, model, system_message, model_params, history):
+                yield chunk
+            return
+
+        payload = self._chat_payload(prompt, model, True, system_message, history)
+        try:
+            async for chunk in aiter_sse_json(f"{self.base_url}/v1/chat/completions", payload):
+                content = openai_delta_text(chunk)
+                if content:
+                    yield content
+        except Exception as e:
+            logger.error(f"vLLM API error: {e}")
+            raise Exception(f"vLLM API error: {e}")
+
+    def embed(self, texts, model=None):
+        """Embed a batch of texts with an embedding model served by vLLM"""
+        try:
+            return self._embed_openai_compatible(f"{self.base_url}/v1/embeddings", texts, model)
+        except Exception as e:
+            logger.error(f"vLLM embeddings error: {e}")
+            raise Exception(f"vLLM embeddings error: {e}")
+
 class MultiProviderClient:
     """Multi-provider API client manager"""
     def __init__(self):
@@ -822,7 +1254,9 @@ class MultiProviderClient:
         # Initialize Ollama client if available
         if OLLAMA_AVAILABLE:
             try:
-                self.providers["Ollama"]["client"] = OllamaClient(host="http://127.0.0.1:11434")
+                client = provider_registry.get(OllamaClient, host="http://127.0.0.1:11434", auto_refresh=False)
+                client.refresh_models()
+                self.providers["Ollama"]["client"] = client
             except Exception as e:
                 logger.warning(f"Failed to initialize Ollama client: {e}")
         
@@ -840,21 +1274,21 @@ class MultiProviderClient:
         deepseek_key = settings.value("deepseek_api_key", "")
         qwen_key = settings.value("qwen_api_key", "")
         
-        # Initialize clients
+        # Shared with the other provider managers; SDKs are built on first use
         if gemini_key:
-            self.providers["Gemini"]["client"] = GeminiClient(gemini_key)
+            self.providers["Gemini"]["client"] = provider_registry.get(GeminiClient, gemini_key)
             self.providers["Gemini"]["models"] = self.providers["Gemini"]["client"].get_models()
         
         if claude_key:
-            self.providers["Claude"]["client"] = ClaudeClient(claude_key)
+            self.providers["Claude"]["client"] = provider_registry.get(ClaudeClient, claude_key)
             self.providers["Claude"]["models"] = self.providers["Claude"]["client"].get_models()
         
         if deepseek_key:
-            self.providers["DeepSeek"]["client"] = DeepSeekClient(deepseek_key)
+            self.providers["DeepSeek"]["client"] = provider_registry.get(DeepSeekClient, deepseek_key)
             self.providers["DeepSeek"]["models"] = self.providers["DeepSeek"]["client"].get_models()
         
         if qwen_key:
-            self.providers["Qwen"]["client"] = QwenClient(qwen_key)
+            self.providers["Qwen"]["client"] = provider_registry.get(QwenClient, qwen_key)
             self.providers["Qwen"]["models"] = self.providers["Qwen"]["client"].get_models()
     
     def save_settings(self):
@@ -952,99 +1386,79 @@ class PerplexityClient(APIClient):
             "sonar-small-chat",
             "sonar-medium-chat"
         ]
-        if api_key:
-            try:
-                self.client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-            except Exception as e:
-                logger.error(f"Failed to initialize Perplexity client: {e}")
-                self.client = None
+
+    def _create_client(self):
+        return self._openai_sdk_client(self.base_url)
 
     def get_models(self):
         """Get available models"""
         return self.models
 
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
         """Generate response from Perplexity"""
         if not self.client:
             raise Exception("Perplexity client not initialized. Check API key.")
 
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(prompt, system_message, history)
 
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=stream
-            )
-            
-            if stream:
-                for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
-            else:
-                yield response.choices[0].message.content
-                
+            yield from self._openai_chat_completion(model, messages, stream)
         except Exception as e:
             logger.error(f"Perplexity API error: {e}")
             raise Exception(f"Perplexity API error: {e}")
 
 class OllamaClient(APIClient):
     """Ollama API client using ollama-python library"""
-    def __init__(self, host="http://127.0.0.1:11434"):
+    EMBED_BATCH_SIZE = 64
+    DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+
+    def __init__(self, host="http://127.0.0.1:11434", auto_refresh=True):
         super().__init__(None)  # Ollama doesn't use API keys
         self.name = "Ollama"
         self.host = host
         self.models = []
-        self.client = None
+        # Keep-alive policy, preloading and RAM-budget eviction for this host
+        self.residency = ollama_residency.for_host(host, http=self.http_pool)
         
-        try:
-            import ollama
-            self.client = ollama.Client(host=host)
+        if auto_refresh:
             self.refresh_models()
-        except ImportError:
-            logger.error("ollama-python library not available. Please install with: pip install ollama")
-            self.client = None
-        except Exception as e:
-            logger.error(f"Failed to initialize Ollama client: {e}")
-            self.client = None
 
-    def refresh_models(self):
+    def _create_client(self):
+        """Create the ollama-python client"""
+        import ollama
+        return ollama.Client(host=self.host)
+
+    def _catalog_fetcher(self, timeout=None):
+        """Fetch the installed Ollama models over the pooled HTTP session"""
+        return self._http_catalog_fetcher(
+            f"{self.host}/api/tags",
+            timeout=timeout,
+            parse=lambda data: [model.get('name', model.get('model', '')) for model in data.get('models', [])]
+        )
+
+    def refresh_models(self, timeout=None):
         """Refresh available models from Ollama"""
-        if not self.client:
+        # The catalog is fetched over HTTP; the ollama client is only built to chat
+        if not self.host:
             return []
         try:
-            models_response = self.client.list()
-            self.models = []
-            if hasattr(models_response, 'models') and models_response.models:
-                self.models = [model.model for model in models_response.models]
-            elif isinstance(models_response, dict) and 'models' in models_response:
-                self.models = [model.get('name', model.get('model', '')) for model in models_response['models']]
-            return self.models
+            return self.refresh_cached_models(timeout)
         except Exception as e:
             logger.error(f"Failed to get Ollama models: {e}")
             return []
 
     def get_models(self):
         """Get available models"""
-        if not self.models:
-            self.refresh_models()
-        return self.models
-
-    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None):
-        """Generate response from Ollama"""
-        if not self.client:
-            raise Exception("Ollama client not initialized. Check if Ollama is running.")
+        if not self.host:
+            return []
+        return self.get_cached_models()
 
-        # Prepare messages
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+    def _chat_messages(self, prompt, system_message=None, history=None):
+        """Build the chat message list"""
+        return self._build_messages(prompt, system_message, history)
 
-        # Prepare options
+    def _chat_options(self, model_params):
+        """Map common model parameters to Ollama options"""
         options = {}
         if model_params:
             # Map common parameters to Ollama options
@@ -1065,6 +1479,23 @@ class OllamaClient(APIClient):
             
             if 'stop' in model_params:
                 options['stop'] = model_params['stop']
+        return options
+
+    def _keep_alive(self, model, model_params):
+        """keep_alive for a request: an explicit model parameter, else the residency policy"""
+        if model_params and model_params.get('keep_alive') is not None:
+            return model_params['keep_alive']
+        return self.residency.keep_alive_for(model)
+
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
+        """Generate response from Ollama"""
+        if not self.client:
+            raise Exception("Ollama client not initialized. Check if Ollama is running.")
+
+        messages = self._chat_messages(prompt, system_message, history)
+        options = self._chat_options(model_params)
+        keep_alive = self._keep_alive(model, model_params)
+        self.residency.touch(model)
 
         try:
             if stream:
@@ -1072,7 +1503,8 @@ class OllamaClient(APIClient):
                     model=model,
                     messages=messages,
                     stream=True,
-                    options=options if options else None
+                    options=options if options else None,
+                    keep_alive=keep_alive
                 )
                 for chunk in response:
                     if isinstance(chunk, dict) and 'message' in chunk:
@@ -1086,7 +1518,8 @@ class OllamaClient(APIClient):
                 response = self.client.chat(
                     model=model,
                     messages=messages,
-                    options=options if options else None
+                    options=options if options else None,
+                    keep_alive=keep_alive
                 )
                 if isinstance(response, dict) and 'message' in response:
                     yield response['message'].get('content', '')
@@ -1099,6 +1532,55 @@ class OllamaClient(APIClient):
             logger.error(f"Ollama API error: {e}")
             raise Exception(f"Ollama API error: {e}")
 
+    async def agenerate_response(self, prompt, model, system_message=None, model_params=None, history=None):
+        """Stream a response from Ollama's /api/chat on the event loop"""
+        if not self.client:
+            raise Exception("Ollama client not initialized. Check if Ollama is running.")
+        if not HTTPX_AVAILABLE:
+            async for chunk in super().agenerate_response(prompt, model, system_message, model_params, history):
+                yield chunk
+            return
+
+        payload = {
+            "model": model,
+            "messages": self._chat_messages(prompt, system_message, history),
+            "stream": True,
+            "keep_alive": self._keep_alive(model, model_params)
+        }
+        options = self._chat_options(model_params)
+        if options:
+            payload["options"] = options
+        # May query /api/ps and unload models; keep that off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.residency.touch, model)
+
+        try:
+            async for chunk in aiter_ndjson(f"{self.host}/api/chat", payload):
+                if 'error' in chunk:
+                    raise Exception(chunk['error'])
+                content = chunk.get('message', {}).get('content', '')
+                if content:
+                    yield content
+                if chunk.get('done'):
+                    break
+        except Exception as e:
+            logger.error(f"Ollama API error: {e}")
+            raise Exception(f"Ollama API error: {e}")
+
+    def embed(self, texts, model=None):
+        """Embed a batch of texts with Ollama's /api/embed"""
+        model = model or self.DEFAULT_EMBEDDING_MODEL
+        self.residency.touch(model)
+        try:
+            response = self.http_pool.post(f"{self.host}/api/embed",
+                                           json={"model": model, "input": list(texts),
+                                                 "keep_alive": self.residency.keep_alive_for(model)},
+                                           timeout=120)
+            response.raise_for_status()
+            return response.json().get("embeddings", [])
+        except Exception as e:
+            logger.error(f"Ollama embeddings error: {e}")
+            raise Exception(f"Ollama embeddings error: {e}")
+
     def pull_model(self, model_name):
         """Pull a model from Ollama registry"""
         if not self.client:
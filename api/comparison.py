@@ -0,0 +1,183 @@
+"""
+Multi-model comparison: fan one prompt out to several provider/model pairs.
+
+Every target streams concurrently on the shared asyncio loop
+(api.async_streams), so a side-by-side comparison takes as long as the
+slowest model rather than the sum of all of them. Chunks from all targets
+arrive on one thread-safe queue, tagged with the target they came from.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.token_counter import token_counter
+from .async_streams import stream_loop
+from .metrics import LatencyTracker, StreamMetrics
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+CHUNK = "chunk"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+
+@dataclass(frozen=True)
+class ComparisonTarget:
+    """A provider/model pair taking part in a comparison."""
+    provider: str
+    model: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+@dataclass
+class ComparisonEvent:
+    """A chunk, completion, error or cancellation from one target."""
+    target: ComparisonTarget
+    kind: str
+    text: str = ""
+    error: Optional[str] = None
+
+
+class ComparisonRun:
+    """One prompt streamed to several targets at once, each cancellable on its own."""
+
+    def __init__(self, client, prompt: str, targets: Iterable[Tuple[str, str]],
+                 system_message: Optional[str] = None, model_params: Optional[Dict[str, Any]] = None,
+                 tracker: Optional[LatencyTracker] = None):
+        self.client = client
+        self.prompt = prompt
+        self.system_message = system_message
+        self.model_params = model_params or {}
+        self.tracker = tracker
+        self.targets: List[ComparisonTarget] = []
+        for provider, model in targets:
+            target = ComparisonTarget(provider, model)
+            if target not in self.targets:
+                self.targets.append(target)
+
+        self.metrics: Dict[str, StreamMetrics] = {}
+        self.responses: Dict[str, List[str]] = {}
+        self.status: Dict[str, str] = {}
+        self._futures: Dict[str, Future] = {}
+        self._events: "queue.Queue[ComparisonEvent]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def start(self) -> "ComparisonRun":
+        """Start streaming every target; returns immediately."""
+        for target in self.targets:
+            self.metrics[target.key] = StreamMetrics(target.provider, target.model)
+            self.responses[target.key] = []
+            self.status[target.key] = "running"
+            self._futures[target.key] = stream_loop.submit(self._run_target(target))
+        return self
+
+    async def _run_target(self, target: ComparisonTarget):
+        metrics = self.metrics[target.key]
+        chunks = self.responses[target.key]
+        usage = {}
+        stream = None
+        try:
+            stream = self.client.agenerate_response(
+                self.prompt,
+                provider_name=target.provider,
+                model_name=target.model,
+                system_message=self.system_message,
+                model_params=dict(self.model_params),
+                failover=False,
+                on_usage=usage.update
+            )
+            async for chunk in stream:
+                metrics.record_chunk(chunk)
+                if metrics.chunks == 1 and self.tracker is not None:
+                    self.tracker.record(target.key, metrics.time_to_first_token)
+                chunks.append(chunk)
+                self._events.put(ComparisonEvent(target, CHUNK, chunk))
+        except asyncio.CancelledError:
+            metrics.finish(error="cancelled")
+            self._finish(target, CANCELLED)
+            raise
+        except Exception as e:
+            logger.warning(f"Comparison target {target.key} failed: {e}")
+            metrics.finish(error=str(e))
+            self._finish(target, ERROR, error=str(e))
+        else:
+            self._count_tokens(target, usage)
+            metrics.finish()
+            self._finish(target, DONE, text="".join(chunks))
+        finally:
+            if stream is not None:
+                await stream.aclose()
+
+    def _count_tokens(self, target: ComparisonTarget, usage: Dict[str, Any]):
+        # Chunks are not tokens (Claude, Gemini and cache replays send many per chunk),
+        # so tokens/sec is only comparable across targets when counted in tokens
+        if usage.get("output_tokens"):
+            self.metrics[target.key].tokens = usage["output_tokens"]
+        else:
+            self.metrics[target.key].tokens = token_counter.count("".join(self.responses[target.key]), target.model)
+
+    def _finish(self, target: ComparisonTarget, kind: str, text: str = "", error: Optional[str] = None):
+        with self._lock:
+            if self.status[target.key] != "running":
+                return
+            self.status[target.key] = kind
+        self._events.put(ComparisonEvent(target, kind, text, error))
+
+    def cancel(self, provider: Optional[str] = None, model: Optional[str] = None):
+        """Cancel one target (by provider and/or model) or, with no arguments, all of them."""
+        for target in self.targets:
+            if provider is not None and target.provider != provider:
+                continue
+            if model is not None and target.model != model:
+                continue
+            future = self._futures.get(target.key)
+            if future is not None and future.cancel():
+                # A task cancelled before it started never reports back itself
+                self.metrics[target.key].finish(error="cancelled")
+                self._finish(target, CANCELLED)
+
+    def is_running(self) -> bool:
+        with self._lock:
+            return any(status == "running" for status in self.status.values())
+
+    def events(self, timeout: Optional[float] = None) -> Iterator[ComparisonEvent]:
+        """
+        Yield tagged events from all targets until every target has finished.
+        :param timeout: float, max seconds to wait for the next event
+        :raises queue.Empty: if no event arrived within the timeout
+        """
+        pending = {target.key for target in self.targets}
+        while pending:
+            event = self._events.get(timeout=timeout)
+            if event.kind != CHUNK:
+                pending.discard(event.target.key)
+            yield event
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Block until all targets finished, then return get_results()."""
+        for _ in self.events(timeout):
+            pass
+        return self.get_results()
+
+    def get_results(self) -> Dict[str, Dict[str, Any]]:
+        """Get the response text, status and metrics of each target so far."""
+        return {
+            target.key: {
+                "provider": target.provider,
+                "model": target.model,
+                "status": self.status.get(target.key),
+                "response": "".join(self.responses.get(target.key, [])),
+                "metrics": self.metrics[target.key].to_dict() if target.key in self.metrics else None,
+            }
+            for target in self.targets
+        }
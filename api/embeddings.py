@@ -0,0 +1,154 @@
+"""
+Batched, cached text embeddings on top of the provider clients.
+
+OpenAI, Gemini, Ollama (/api/embed), llama.cpp (/embedding) and vLLM can all
+embed text; each client's embed() sends one batch. EmbeddingService splits
+any number of texts into micro-batches of the provider's batch limit, sends
+them with bounded concurrency, and keeps vectors in a content-hash cache so
+unchanged texts are never embedded twice. Semantic features can use any of
+these backends instead of loading sentence-transformers (and torch) into
+the GUI process.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Vector = List[float]
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CACHE_SIZE = 20000
+
+
+class EmbeddingService:
+    """Embed texts through one provider client with micro-batching, concurrency limits and caching."""
+
+    def __init__(self, client, model: Optional[str] = None, batch_size: Optional[int] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param client: an api.clients.APIClient with embeddings support
+        :param model: str, embedding model (defaults to the client's DEFAULT_EMBEDDING_MODEL)
+        :param batch_size: int, texts per request, capped at the client's EMBED_BATCH_SIZE
+        :param concurrency: int, requests in flight at once
+        :param cache_size: int, vectors kept in the content-hash cache
+        """
+        if not getattr(client, "supports_embeddings", False):
+            raise ValueError(f"{getattr(client, 'name', client)} does not provide embeddings")
+        self.client = client
+        self.model = model or client.DEFAULT_EMBEDDING_MODEL
+        self.batch_size = max(1, min(batch_size or client.EMBED_BATCH_SIZE, client.EMBED_BATCH_SIZE))
+        self.concurrency = max(1, concurrency)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Vector]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"texts": 0, "hits": 0, "embedded": 0, "batches": 0, "errors": 0, "batch_time": 0.0}
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+        digest.update(str(self.model).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _lookup(self, key: str) -> Optional[Vector]:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _remember(self, key: str, vector: Vector):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _embed_batch(self, texts: List[str]) -> List[Vector]:
+        started = time.perf_counter()
+        try:
+            vectors = self.client.embed(texts, self.model)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        if len(vectors) != len(texts):
+            raise ValueError(f"{self.client.name} returned {len(vectors)} embeddings for {len(texts)} texts")
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["embedded"] += len(texts)
+            self._stats["batch_time"] += time.perf_counter() - started
+        return vectors
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                        thread_name_prefix="embeddings")
+        return self._executor
+
+    def embed(self, texts: Sequence[str]) -> List[Vector]:
+        """Embed texts; returns one vector per text, in order. Repeated texts are embedded once."""
+        texts = [text or "" for text in texts]
+        vectors: List[Optional[Vector]] = [None] * len(texts)
+        missing: "OrderedDict[str, Tuple[str, List[int]]]" = OrderedDict()
+        hits = 0
+        for index, text in enumerate(texts):
+            key = self._key(text)
+            vector = self._lookup(key)
+            if vector is not None:
+                vectors[index] = vector
+                hits += 1
+            else:
+                missing.setdefault(key, (text, []))[1].append(index)
+        with self._lock:
+            self._stats["texts"] += len(texts)
+            self._stats["hits"] += hits
+
+        if missing:
+            pending = list(missing.items())
+            batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+            if len(batches) == 1:
+                results = [self._embed_batch([text for _, (text, _) in batches[0]])]
+            else:
+                results = list(self._pool().map(
+                    lambda batch: self._embed_batch([text for _, (text, _) in batch]), batches))
+            for batch, batch_vectors in zip(batches, results):
+                for (key, (_, indices)), vector in zip(batch, batch_vectors):
+                    self._remember(key, vector)
+                    for index in indices:
+                        vectors[index] = vector
+        return vectors
+
+    def embed_one(self, text: str) -> Vector:
+        return self.embed([text])[0]
+
+    def __call__(self, texts: Sequence[str]) -> List[Vector]:
+        return self.embed(texts)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit rate, batch count and average batch latency."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_vectors"] = len(self._cache)
+        stats["hit_rate"] = stats["hits"] / stats["texts"] if stats["texts"] else 0.0
+        stats["average_batch_time"] = stats["batch_time"] / stats["batches"] if stats["batches"] else None
+        stats["provider"] = self.client.name
+        stats["model"] = self.model
+        stats["batch_size"] = self.batch_size
+        return stats
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,175 @@
+"""
+Hedged (raced) requests across providers.
+
+The same request goes to two or more backends; whichever produces a first
+token first keeps streaming and the others are cancelled. Backup requests
+can be held back by a hedge delay (by default the primary's observed p90
+time to first token), so the extra load is only paid when the primary is
+slower than usual, e.g. a cold local model or an overloaded endpoint.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from .comparison import ComparisonTarget
+from .metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class _RaceEntrant:
+    """One backend's stream, waiting for its first chunk."""
+
+    def __init__(self, target: ComparisonTarget, stream: AsyncIterator[str]):
+        self.target = target
+        self.stream = stream
+        self.started_at = time.perf_counter()
+        # Seconds from this entrant's own start to its first chunk, whether or not it wins
+        self.time_to_first_token: Optional[float] = None
+        self.first_chunk_task = asyncio.ensure_future(self._first_chunk())
+
+    async def _first_chunk(self) -> Optional[str]:
+        # None means the stream ended without producing anything
+        try:
+            chunk = await self.stream.__anext__()
+        except StopAsyncIteration:
+            return None
+        self.time_to_first_token = time.perf_counter() - self.started_at
+        return chunk
+
+    async def close(self):
+        if not self.first_chunk_task.done():
+            self.first_chunk_task.cancel()
+            try:
+                await self.first_chunk_task
+            except BaseException:
+                pass
+        try:
+            await self.stream.aclose()
+        except Exception as e:
+            logger.debug(f"Error closing raced stream for {self.target.key}: {e}")
+
+
+class HedgedRequest:
+    """Race one request across several provider/model targets and keep the fastest stream."""
+
+    def __init__(self, client, prompt: str, targets: Iterable[Tuple[str, str]],
+                 system_message: Optional[str] = None, model_params: Optional[Dict[str, Any]] = None,
+                 hedge_delay: Optional[float] = None, tracker: Optional[LatencyTracker] = None,
+                 hedge_percentile: float = 90):
+        """
+        :param targets: (provider, model) pairs; the first is the primary
+        :param hedge_delay: seconds to wait for the primary before starting the backups;
+                            None uses the primary's observed percentile TTFT (or races
+                            immediately while there is no history), 0 always races
+        """
+        self.client = client
+        self.prompt = prompt
+        self.system_message = system_message
+        self.model_params = model_params or {}
+        self.targets: List[ComparisonTarget] = [ComparisonTarget(provider, model) for provider, model in targets]
+        if not self.targets:
+            raise ValueError("A hedged request needs at least one target")
+        self.hedge_delay = hedge_delay
+        self.tracker = tracker
+        self.hedge_percentile = hedge_percentile
+
+        self.winner: Optional[ComparisonTarget] = None
+        self.time_to_first_token: Optional[float] = None
+        self.hedged = False
+        self.errors: Dict[str, str] = {}
+
+    def resolve_hedge_delay(self) -> float:
+        """Seconds to hold back the backup requests."""
+        if self.hedge_delay is not None:
+            return max(0.0, self.hedge_delay)
+        if self.tracker is not None:
+            observed = self.tracker.percentile(self.targets[0].key, self.hedge_percentile)
+            if observed is not None:
+                return observed
+        return 0.0
+
+    def _start(self, target: ComparisonTarget) -> _RaceEntrant:
+        stream = self.client.agenerate_response(
+            self.prompt,
+            provider_name=target.provider,
+            model_name=target.model,
+            system_message=self.system_message,
+            model_params=dict(self.model_params),
+            failover=False
+        )
+        return _RaceEntrant(target, stream)
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Stream the response of whichever target produces a first token first."""
+        started_at = time.perf_counter()
+        entrants = [self._start(self.targets[0])]
+        backups = self.targets[1:]
+        delay = self.resolve_hedge_delay() if backups else None
+        winner = None
+        first_chunk = None
+
+        try:
+            while winner is None:
+                running = [entrant for entrant in entrants if not entrant.first_chunk_task.done()]
+                finished = [entrant for entrant in entrants if entrant.first_chunk_task.done()]
+
+                for entrant in finished:
+                    error = entrant.first_chunk_task.exception()
+                    if error is None and entrant.first_chunk_task.result() is None:
+                        # An empty response loses the race rather than winning it
+                        error = "stream ended without a response"
+                    if error is not None:
+                        entrants.remove(entrant)
+                        self.errors[entrant.target.key] = str(error)
+                        logger.warning(f"Raced request to {entrant.target.key} failed: {error}")
+                    elif winner is None:
+                        winner, first_chunk = entrant, entrant.first_chunk_task.result()
+                if winner is not None:
+                    break
+
+                # Start the backups once the hedge delay passed, or as soon as everything failed
+                if backups and (not running or time.perf_counter() - started_at >= delay):
+                    self.hedged = True
+                    entrants.extend(self._start(target) for target in backups)
+                    backups = []
+                    continue
+                if not running:
+                    raise Exception("All raced providers failed: " +
+                                    "; ".join(f"{key}: {error}" for key, error in self.errors.items()))
+
+                timeout = None
+                if backups:
+                    timeout = max(0.0, delay - (time.perf_counter() - started_at))
+                await asyncio.wait([entrant.first_chunk_task for entrant in running],
+                                   timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            for entrant in entrants:
+                await entrant.close()
+            raise
+
+        # Cancel the losers before streaming the winner
+        for entrant in entrants:
+            if entrant is not winner:
+                await entrant.close()
+
+        self.winner = winner.target
+        self.time_to_first_token = time.perf_counter() - started_at
+        if self.tracker is not None:
+            # Losers that got a first token in are recorded too, or the tracker would only ever
+            # see the fast side of each target; times run from each target's own start, so
+            # backups are not charged for the hedge delay
+            for entrant in entrants:
+                if entrant.time_to_first_token is not None:
+                    self.tracker.record(entrant.target.key, entrant.time_to_first_token)
+        logger.debug(f"Race won by {winner.target.key} in {self.time_to_first_token:.3f}s"
+                     f"{' (hedged)' if self.hedged else ''}")
+
+        try:
+            yield first_chunk
+            async for chunk in winner.stream:
+                yield chunk
+        finally:
+            await winner.close()
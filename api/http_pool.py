@@ -0,0 +1,378 @@
+"""
+Shared HTTP connection pool for the requests-based API clients.
+
+One keep-alive session is kept per host (scheme://host:port) so repeated
+chat turns against LM Studio, llama.cpp, vLLM or a cloud endpoint reuse an
+already-open TCP/TLS connection instead of paying connection setup on every
+request. HTTP/2 multiplexing is used when enabled and httpx[http2] is
+installed; otherwise the pool falls back to HTTP/1.1 keep-alive.
+
+Changing the pool settings swaps in new sessions; a replaced session is
+closed once the last response it is still streaming has finished.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Optional HTTP/2 support
+try:
+    import httpx
+    import h2  # noqa: F401  (required by httpx for http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# requests keyword arguments an HTTP/2 (httpx) request can carry; others are rejected
+_HTTPX_REQUEST_KWARGS = {"json", "data", "headers", "params", "timeout", "files", "cookies", "auth",
+                         "allow_redirects", "verify"}
+
+
+def _httpx_timeout(timeout):
+    """Convert a requests timeout (seconds or a (connect, read) tuple) to an httpx timeout."""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return timeout
+
+
+def _requests_error(error):
+    """The requests exception matching an httpx error, so clients can keep catching requests errors."""
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(str(error))
+    if isinstance(error, httpx.ReadTimeout):
+        return requests.exceptions.ReadTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error))
+    if isinstance(error, (httpx.ConnectError, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return requests.exceptions.ConnectionError(str(error))
+    if isinstance(error, httpx.TooManyRedirects):
+        return requests.exceptions.TooManyRedirects(str(error))
+    if isinstance(error, httpx.InvalidURL):
+        return requests.exceptions.InvalidURL(str(error))
+    return requests.exceptions.RequestException(str(error))
+
+
+class _HTTPXResponse:
+    """Adapter giving an httpx response the subset of the requests API the clients use."""
+
+    def __init__(self, response, on_done=None):
+        self._response = response
+        self._on_done = on_done
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def _done(self):
+        on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done()
+
+    def _read(self):
+        if not self._response.is_stream_consumed:
+            try:
+                self._response.read()
+            except httpx.HTTPError as e:
+                raise _requests_error(e) from e
+        self._done()
+
+    @property
+    def text(self):
+        self._read()
+        return self._response.text
+
+    @property
+    def content(self):
+        self._read()
+        return self._response.content
+
+    def json(self):
+        self._read()
+        return self._response.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self._response.url}", response=self)
+
+    def iter_content(self, chunk_size=None):
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        except httpx.HTTPError as e:
+            raise _requests_error(e) from e
+        self._done()
+
+    def iter_lines(self, chunk_size=None):
+        try:
+            for line in self._response.iter_lines():
+                yield line.encode('utf-8')
+        except httpx.HTTPError as e:
+            raise _requests_error(e) from e
+        self._done()
+
+    def close(self):
+        self._response.close()
+        self._done()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that reports how often its connection pools reused a connection."""
+
+    def connection_counts(self) -> Tuple[int, int]:
+        """Return (connections opened, requests served) across this adapter's connection pools."""
+        opened = served = 0
+        pools = self.poolmanager.pools
+        # The container cannot be iterated directly; keys() takes a snapshot under its lock
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                served += pool.num_requests
+        return opened, served
+
+
+class HTTPSessionPool:
+    """Per-host pool of keep-alive HTTP sessions with reuse metrics."""
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 16,
+                 max_retries: int = 0, http2: bool = False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.http2 = http2
+        self._sessions: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._requests_sent = 0
+        # Responses still being read, per session; replaced sessions wait for theirs to finish
+        self._in_flight: Dict[Any, int] = {}
+        self._retired: Set[Any] = set()
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        """Return the scheme://host:port key used to select a session."""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        return f"{parts.scheme}://{parts.hostname}:{port}"
+
+    def _use_http2(self, host_key: str) -> bool:
+        return self.http2 and HTTP2_AVAILABLE and host_key.startswith("https://")
+
+    def _create_session(self, host_key: str):
+        """Create a new session for a host."""
+        if self._use_http2(host_key):
+            limits = httpx.Limits(max_connections=self.pool_maxsize,
+                                  max_keepalive_connections=self.pool_maxsize)
+            return httpx.Client(http2=True, limits=limits, timeout=None)
+
+        session = requests.Session()
+        adapter = PooledHTTPAdapter(pool_connections=self.pool_connections,
+                                    pool_maxsize=self.pool_maxsize,
+                                    max_retries=self.max_retries)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session_for(self, url: str):
+        """Get (or lazily create) the shared session for the host of a URL."""
+        host_key = self._host_key(url)
+        session = self._sessions.get(host_key)
+        if session is None:
+            with self._lock:
+                session = self._session_locked(host_key)
+        return session
+
+    def _session_locked(self, host_key: str):
+        session = self._sessions.get(host_key)
+        if session is None:
+            session = self._create_session(host_key)
+            self._sessions[host_key] = session
+            logger.debug(f"Opened pooled HTTP session for {host_key}")
+        return session
+
+    def _checkout(self, url: str):
+        """Get the session for a URL and count a response in flight on it."""
+        with self._lock:
+            session = self._session_locked(self._host_key(url))
+            self._requests_sent += 1
+            self._in_flight[session] = self._in_flight.get(session, 0) + 1
+        return session
+
+    def _release(self, session):
+        """A response finished; close its session if it was replaced and this was the last one."""
+        with self._lock:
+            remaining = self._in_flight.get(session, 1) - 1
+            if remaining > 0:
+                self._in_flight[session] = remaining
+                return
+            self._in_flight.pop(session, None)
+            retired = session in self._retired
+            self._retired.discard(session)
+        if retired:
+            self._close_session(session)
+
+    def _release_when_done(self, session, response):
+        """Release a streamed requests response once its body is read to the end or it is closed."""
+        raw = getattr(response, "raw", None)
+        release_conn = getattr(raw, "release_conn", None)
+        if release_conn is None:
+            self._release(session)
+            return
+        released = []
+
+        def release():
+            release_conn()
+            if not released:
+                released.append(True)
+                self._release(session)
+
+        # urllib3 calls release_conn at the end of the body and on close
+        raw.release_conn = release
+        if getattr(raw, "closed", False):
+            # An empty body is already read to its end
+            release()
+
+    def request(self, method: str, url: str, stream: bool = False, **kwargs):
+        """Send a request through the pooled session for the URL's host."""
+        session = self._checkout(url)
+        try:
+            if httpx is not None and isinstance(session, httpx.Client):
+                response = _HTTPXResponse(self._httpx_send(session, method, url, stream, kwargs),
+                                          on_done=lambda: self._release(session))
+                if not stream:
+                    response.close()
+                return response
+
+            response = session.request(method, url, stream=stream, **kwargs)
+        except BaseException:
+            self._release(session)
+            raise
+        if stream:
+            self._release_when_done(session, response)
+        else:
+            self._release(session)
+        return response
+
+    @staticmethod
+    def _httpx_send(session, method: str, url: str, stream: bool, kwargs: Dict[str, Any]):
+        """Send a requests-style request through an httpx client, raising requests exceptions."""
+        unsupported = set(kwargs) - _HTTPX_REQUEST_KWARGS
+        if kwargs.get("verify", True) is not True:
+            # Certificate verification is fixed per httpx client
+            unsupported.add("verify")
+        if unsupported:
+            raise TypeError(f"Unsupported arguments for an HTTP/2 request: {', '.join(sorted(unsupported))}")
+        try:
+            request = session.build_request(method, url, json=kwargs.get("json"),
+                                            data=kwargs.get("data"),
+                                            files=kwargs.get("files"),
+                                            headers=kwargs.get("headers"),
+                                            params=kwargs.get("params"),
+                                            cookies=kwargs.get("cookies"),
+                                            timeout=_httpx_timeout(kwargs.get("timeout")))
+            return session.send(request, stream=stream, auth=kwargs.get("auth"),
+                                follow_redirects=kwargs.get("allow_redirects", True))
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            raise _requests_error(e) from e
+
+    def get(self, url: str, **kwargs):
+        """Send a pooled GET request."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """Send a pooled POST request."""
+        return self.request("POST", url, **kwargs)
+
+    def configure(self, pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None,
+                  http2: Optional[bool] = None):
+        """
+        Change pool sizing. New sessions are created on next use; the old ones
+        are closed now if idle, otherwise when their last streamed response finishes.
+        """
+        current = (self.pool_connections, self.pool_maxsize, self.http2)
+        if pool_connections is not None:
+            self.pool_connections = int(pool_connections)
+        if pool_maxsize is not None:
+            self.pool_maxsize = int(pool_maxsize)
+        if http2 is not None:
+            if http2 and not HTTP2_AVAILABLE:
+                logger.warning("HTTP/2 requested but httpx[http2] is not installed; using HTTP/1.1 keep-alive")
+            self.http2 = bool(http2)
+        if (self.pool_connections, self.pool_maxsize, self.http2) != current:
+            self._retire_sessions()
+
+    def _retire_sessions(self):
+        idle = []
+        with self._lock:
+            for session in self._sessions.values():
+                if self._in_flight.get(session):
+                    self._retired.add(session)
+                else:
+                    idle.append(session)
+            self._sessions = {}
+        for session in idle:
+            self._close_session(session)
+
+    @staticmethod
+    def _close_session(session):
+        try:
+            session.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled session: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return pool usage statistics.
+
+        ``connections_opened`` counts new TCP connections; every other request
+        was served from an already-open keep-alive connection (a pool hit).
+        """
+        hosts = {}
+        with self._lock:
+            sessions = dict(self._sessions)
+            requests_sent = self._requests_sent
+
+        for host_key, session in sessions.items():
+            if httpx is not None and isinstance(session, httpx.Client):
+                hosts[host_key] = {"protocol": "HTTP/2"}
+                continue
+            opened = served = 0
+            # One adapter is mounted for both http:// and https://; count it once
+            adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+            for adapter in adapters.values():
+                if isinstance(adapter, PooledHTTPAdapter):
+                    adapter_opened, adapter_served = adapter.connection_counts()
+                    opened += adapter_opened
+                    served += adapter_served
+            hosts[host_key] = {
+                "protocol": "HTTP/1.1",
+                "connections_opened": opened,
+                "requests": served,
+                "pool_hits": max(served - opened, 0),
+            }
+
+        opened_total = sum(h.get("connections_opened", 0) for h in hosts.values())
+        served_total = sum(h.get("requests", 0) for h in hosts.values())
+        return {
+            "requests_sent": requests_sent,
+            "connections_opened": opened_total,
+            "pool_hits": max(served_total - opened_total, 0),
+            "hit_rate": (served_total - opened_total) / served_total if served_total else 0.0,
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "http2": self.http2 and HTTP2_AVAILABLE,
+            "hosts": hosts,
+        }
+
+    def close(self):
+        """Close all pooled sessions, including replaced ones still streaming."""
+        with self._lock:
+            sessions = list(self._sessions.values()) + list(self._retired)
+            self._sessions = {}
+            self._retired = set()
+            self._in_flight = {}
+        for session in sessions:
+            self._close_session(session)
@@ -0,0 +1,198 @@
+"""
+On-disk snapshots of llama.cpp context state, one per conversation.
+
+A resident model has a single context, so switching between two long
+conversations normally re-evaluates the whole prompt each time. After a
+turn, LocalModelManager saves the context (KV cache plus the evaluated
+tokens, via llama-cpp-python's save_state) here; when the conversation
+comes back it loads the snapshot, and llama-cpp-python evaluates only the
+tokens after the longest prefix the snapshot already holds. Snapshots are
+keyed by model load settings and conversation (an explicit id or the hash
+of its first turn), and the least recently used ones are deleted once the
+store exceeds its size limit.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 4 * 2**30
+SUFFIX = ".state"
+
+
+class KVStateStore:
+    """Size-bounded LRU store of pickled llama-cpp-python LlamaState snapshots."""
+
+    def __init__(self, directory: Optional[Path] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param directory: Path, where snapshots are kept (default ~/.oracle/kv_states)
+        :param max_bytes: int, total snapshot size kept on disk; 0 disables snapshots
+        """
+        self.directory = Path(directory) if directory else Path.home() / ".oracle" / "kv_states"
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        # key -> (size, last used); rebuilt from the directory so limits hold across restarts
+        self._index: Dict[str, Dict[str, float]] = {}
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._stats = {"saves": 0, "restores": 0, "misses": 0, "errors": 0, "evictions": 0,
+                       "save_time": 0.0, "restore_time": 0.0}
+        self._scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def configure(self, max_bytes: Optional[int] = None):
+        if max_bytes is not None:
+            with self._lock:
+                self.max_bytes = max(0, int(max_bytes))
+            self._evict()
+
+    @staticmethod
+    def state_key(model_key: Any, conversation: str) -> str:
+        """Snapshot key of a conversation on a model with particular load settings."""
+        seed = f"{model_key!r}\x00{conversation}"
+        return hashlib.blake2b(seed.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{SUFFIX}"
+
+    def _scan(self):
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.glob(f"*{SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            self._index[path.stem] = {"size": stat.st_size, "used": stat.st_mtime}
+
+    def load(self, key: str) -> Optional[Any]:
+        """The snapshot stored under key, or None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        started = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._index.pop(key, None)
+                self._stats["misses"] += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable context snapshot {path.name}: {e}")
+            self.discard(key)
+            with self._lock:
+                self._stats["errors"] += 1
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key]["used"] = time.time()
+            self._stats["restores"] += 1
+            self._stats["restore_time"] += time.perf_counter() - started
+        return state
+
+    def _write(self, key: str, state: Any):
+        started = time.perf_counter()
+        path = self._path(key)
+        temp = path.with_suffix(".tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(temp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+            size = path.stat().st_size
+        except Exception as e:
+            logger.warning(f"Failed to save context snapshot: {e}")
+            try:
+                temp.unlink()
+            except OSError:
+                pass
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+        with self._lock:
+            self._index[key] = {"size": size, "used": time.time()}
+            self._stats["saves"] += 1
+            self._stats["save_time"] += time.perf_counter() - started
+        self._evict(keep=key)
+
+    def save(self, key: str, state: Any, background: bool = True):
+        """
+        Store a snapshot, replacing the previous one of its key. By default
+        it is written on a background thread, so the caller is not held up by
+        disk I/O; the state must not be modified afterwards.
+        """
+        if not self.enabled:
+            return
+        if not background:
+            self._write(key, state)
+            return
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    # One writer keeps saves of a conversation in order
+                    self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kv-state")
+        self._writer.submit(self._write, key, state)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Delete least recently used snapshots until the store fits max_bytes."""
+        with self._lock:
+            used = sum(entry["size"] for entry in self._index.values())
+            victims = []
+            for key, entry in sorted(self._index.items(), key=lambda item: item[1]["used"]):
+                if used <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                victims.append(key)
+                used -= entry["size"]
+            for key in victims:
+                del self._index[key]
+                self._stats["evictions"] += 1
+        for key in victims:
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def discard(self, key: str):
+        with self._lock:
+            self._index.pop(key, None)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._index)
+        for key in keys:
+            self.discard(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get save/restore counts and times and the disk space used."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["snapshots"] = len(self._index)
+            stats["bytes"] = sum(entry["size"] for entry in self._index.values())
+        stats["max_bytes"] = self.max_bytes
+        stats["average_restore_time"] = stats["restore_time"] / stats["restores"] if stats["restores"] else None
+        stats["average_save_time"] = stats["save_time"] / stats["saves"] if stats["saves"] else None
+        return stats
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
@@ -10,14 +10,23 @@ import threading
 import logging
 import tempfile
 import shutil
+import weakref
+from collections import deque
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, Any
+from dataclasses import dataclass, fields
 from enum import Enum
 import requests
 from PyQt6.QtCore import QObject, pyqtSignal, QThread, QTimer
 from PyQt6.QtWidgets import QProgressDialog, QMessageBox
 
+from core.token_counter import token_counter
+from .clients import APIClient
+from .kv_state_store import KVStateStore
+from .metrics import LatencyTracker, StreamMetrics
+from .resident_models import ModelKey, ResidentModelCache, model_file_size
+from .slot_affinity import conversation_key
+
 logger = logging.getLogger(__name__)
 
 
@@ -129,6 +138,18 @@ class LocalModelManager(QObject):
         self.available_models = self._load_available_models()
         self.downloaded_models = self._scan_downloaded_models()
         self.active_models = {}  # model_name -> subprocess
+        # llama-cpp-python models stay loaded between requests
+        self.model_cache = ResidentModelCache()
+        # Context snapshots of conversations, and the conversation each loaded model's context holds
+        self.kv_states = KVStateStore()
+        self._context_owner = weakref.WeakKeyDictionary()
+        # Cancellation flags of the generations in progress
+        self._cancel_events = set()
+        self._cancel_lock = threading.Lock()
+        # Timing of recent generations
+        self.last_metrics: Optional[StreamMetrics] = None
+        self.recent_metrics = deque(maxlen=100)
+        self.ttft_tracker = LatencyTracker()
         self.backend_configs = self._get_backend_configs()
         
         # Initialize llama.cpp paths
@@ -503,6 +524,8 @@ class LocalModelManager(QObject):
         for model_file in self.models_dir.glob("*.gguf"):
             model_name = model_file.stem
             downloaded[model_name] = str(model_file)
+            # Count tokens for this model with its own vocabulary
+            token_counter.register_gguf(model_name, str(model_file))
         return downloaded
     
     def _get_backend_configs(self) -> Dict[BackendType, Dict[str, Any]]:
@@ -649,48 +672,189 @@ class LocalModelManager(QObject):
     
     def unload_model(self, model_name: str):
         """Unload a model."""
+        self.model_cache.evict(model_name)
         if model_name in self.active_models:
             process = self.active_models[model_name]
             process.terminate()
             del self.active_models[model_name]
             logger.info(f"Unloaded model {model_name}")
     
+    def _model_key(self, model_name: str, config: InferenceConfig) -> ModelKey:
+        """Settings fixed when llama-cpp-python loads a model; requests differing in them need another instance."""
+        return ModelKey(model_name, config.context_length, config.threads, config.gpu_layers)
+    
+    def _load_llama(self, model_name: str, config: InferenceConfig):
+        """Load a model with llama-cpp-python."""
+        import llama_cpp
+        
+        return llama_cpp.Llama(
+            model_path=self.downloaded_models[model_name],
+            n_ctx=config.context_length,
+            n_threads=config.threads if config.threads > 0 else None,
+            n_gpu_layers=config.gpu_layers,
+            n_batch=config.batch_size,
+            verbose=False
+        )
+    
     def generate_response(self, model_name: str, prompt: str, config: InferenceConfig = None) -> str:
         """Generate a response using a local model."""
-        if model_name not in self.active_models:
-            if not self.load_model(model_name):
-                raise RuntimeError(f"Failed to load model {model_name}")
-        
         if config is None:
             config = InferenceConfig()
         
         try:
             # Use llama-cpp-python for inference
-            import llama_cpp
-            
-            model_path = self.downloaded_models[model_name]
-            llm = llama_cpp.Llama(
-                model_path=model_path,
-                n_ctx=config.context_length,
-                n_threads=config.threads,
-                n_gpu_layers=config.gpu_layers,
-                temperature=config.temperature,
-                top_p=config.top_p,
-                top_k=config.top_k,
-                repeat_penalty=config.repeat_penalty,
-                max_tokens=config.max_tokens,
-                seed=config.seed
-            )
-            
-            response = llm(prompt, max_tokens=config.max_tokens, temperature=config.temperature)
-            return response["choices"][0]["text"]
-            
+            import llama_cpp  # noqa: F401
         except ImportError:
             # Fallback to subprocess if llama-cpp-python not available
+            if model_name not in self.active_models:
+                if not self.load_model(model_name):
+                    raise RuntimeError(f"Failed to load model {model_name}")
             return self._generate_response_subprocess(model_name, prompt, config)
+        
+        return "".join(self.stream_response(model_name, prompt, config))
+    
+    def stream_response(self, model_name: str, prompt: str, config: InferenceConfig = None,
+                        messages: Optional[List[Dict[str, str]]] = None,
+                        cancel_event: Optional[threading.Event] = None,
+                        conversation: Optional[str] = None) -> Iterator[str]:
+        """
+        Generate a response token by token as llama-cpp-python produces it.
+        With messages, the model's chat template formats them and prompt is unused.
+        Generation stops between tokens once cancel_event is set (see
+        cancel_generation) or the generator is closed. Timing is kept in
+        last_metrics (see get_inference_stats).
+        With a conversation key, the model context is restored from that
+        conversation's last snapshot (if another conversation used it since)
+        and saved again afterwards, so only the new turn is evaluated.
+        """
+        if config is None:
+            config = InferenceConfig()
+        
+        try:
+            import llama_cpp  # noqa: F401
+        except ImportError:
+            # The subprocess fallback only answers with complete responses
+            if messages:
+                prompt = "\n".join(f"{message['role'].capitalize()}: {message['content']}"
+                                   for message in messages) + "\nAssistant:"
+            yield self.generate_response(model_name, prompt, config)
+            return
+        
+        if not self.is_model_downloaded(model_name):
+            raise RuntimeError(f"Model {model_name} not downloaded")
+        
+        cancel_event = cancel_event or threading.Event()
+        with self._cancel_lock:
+            self._cancel_events.add(cancel_event)
+        metrics = StreamMetrics("Local Models", model_name)
+        pieces = []
+        self.inference_started.emit(model_name)
+        try:
+            model_path = self.downloaded_models[model_name]
+            model_key = self._model_key(model_name, config)
+            state_key = self.kv_states.state_key(model_key, conversation) \
+                if conversation and self.kv_states.enabled else None
+            with self.model_cache.acquire(model_key, lambda: self._load_llama(model_name, config),
+                                          model_file_size(model_path)) as llm:
+                self._restore_context(llm, state_key)
+                # Sampling settings are per request, so they never require a reload
+                sampling = {
+                    "max_tokens": config.max_tokens,
+                    "temperature": config.temperature,
+                    "top_p": config.top_p,
+                    "top_k": config.top_k,
+                    "repeat_penalty": config.repeat_penalty,
+                    "seed": config.seed if config.seed >= 0 else None,
+                }
+                if messages:
+                    stream = llm.create_chat_completion(messages=messages, stream=True, **sampling)
+                else:
+                    stream = llm(prompt, stream=True, **sampling)
+                try:
+                    # llama-cpp-python evaluates the next token only when asked for it
+                    for chunk in stream:
+                        if cancel_event.is_set():
+                            metrics.finish(error="cancelled")
+                            logger.info(f"Generation with {model_name} cancelled")
+                            break
+                        choice = chunk["choices"][0]
+                        text = (choice.get("delta") or {}).get("content") if messages else choice.get("text")
+                        if text:
+                            metrics.record_chunk(text)
+                            pieces.append(text)
+                            self.inference_chunk.emit(model_name, text)
+                            yield text
+                finally:
+                    stream.close()
+                self._snapshot_context(llm, state_key)
         except Exception as e:
+            metrics.finish(error=str(e))
             logger.error(f"Failed to generate response: {e}")
+            self.inference_error.emit(model_name, str(e))
             raise
+        finally:
+            with self._cancel_lock:
+                self._cancel_events.discard(cancel_event)
+            metrics.finish()
+            self._record_metrics(metrics)
+        
+        if metrics.error is None:
+            self.inference_complete.emit(model_name, "".join(pieces))
+    
+    def _restore_context(self, llm, state_key: Optional[str]):
+        """Load a conversation's snapshot unless the model context already holds that conversation."""
+        # Forget the owner first: if generation fails, the context is in an unknown state
+        owner = self._context_owner.pop(llm, None)
+        if state_key is None or owner == state_key:
+            return
+        state = self.kv_states.load(state_key)
+        if state is None:
+            return
+        try:
+            llm.load_state(state)
+            logger.debug(f"Restored context snapshot with {getattr(state, 'n_tokens', '?')} tokens")
+        except Exception as e:
+            logger.warning(f"Failed to restore context snapshot: {e}")
+            self.kv_states.discard(state_key)
+            llm.reset()
+    
+    def _snapshot_context(self, llm, state_key: Optional[str]):
+        """Save the context after a conversation's turn."""
+        if state_key is None:
+            return
+        try:
+            self.kv_states.save(state_key, llm.save_state())
+            self._context_owner[llm] = state_key
+        except Exception as e:
+            logger.warning(f"Failed to snapshot context: {e}")
+    
+    def get_kv_state_stats(self) -> Dict[str, Any]:
+        """Get context snapshot saves, restores and disk use."""
+        return self.kv_states.get_stats()
+    
+    def cancel_generation(self):
+        """Stop every generation in progress after its current token."""
+        with self._cancel_lock:
+            for event in self._cancel_events:
+                event.set()
+    
+    def _record_metrics(self, metrics: StreamMetrics):
+        self.last_metrics = metrics
+        self.recent_metrics.append(metrics)
+        if metrics.time_to_first_token is not None:
+            self.ttft_tracker.record(metrics.model, metrics.time_to_first_token)
+    
+    def get_inference_stats(self) -> Dict[str, Any]:
+        """Get time to first token and tokens per second of recent generations."""
+        return {
+            "last": self.last_metrics.to_dict() if self.last_metrics else None,
+            "recent": [metrics.to_dict() for metrics in list(self.recent_metrics)],
+            "ttft": self.ttft_tracker.get_stats(),
+        }
+    
+    def get_model_cache_stats(self) -> Dict[str, Any]:
+        """Get resident model hits, load times and memory use."""
+        return self.model_cache.get_stats()
     
     def _generate_response_subprocess(self, model_name: str, prompt: str, config: InferenceConfig) -> str:
         """Generate response using subprocess (fallback method)."""
@@ -851,6 +1015,8 @@ class LocalModelManager(QObject):
     
     def cleanup(self):
         """Cleanup resources."""
+        self.model_cache.clear()
+        self.kv_states.close()
         for model_name in list(self.active_models.keys()):
             self.unload_model(model_name)
 
@@ -896,10 +1062,11 @@ class ModelDownloadThread(QThread):
                 self.model_path.unlink()
 
 
-class LocalModelProvider:
+class LocalModelProvider(APIClient):
     """Provider interface for local models."""
     
     def __init__(self, manager: LocalModelManager):
+        super().__init__()
         self.manager = manager
         self.name = "Local Models"
         self.models = {}
@@ -923,11 +1090,30 @@ class LocalModelProvider:
         self._update_models()
         return self.models
     
-    def generate_response(self, model_name: str, prompt: str, **kwargs) -> str:
-        """Generate a response."""
-        config = InferenceConfig(**kwargs)
-        return self.manager.generate_response(model_name, prompt, config)
+    @staticmethod
+    def _inference_config(model_params: Optional[Dict[str, Any]]) -> InferenceConfig:
+        """InferenceConfig from request parameters, ignoring those it has no field for."""
+        names = {field.name for field in fields(InferenceConfig)}
+        return InferenceConfig(**{name: value for name, value in (model_params or {}).items()
+                                  if name in names and value is not None})
+    
+    def generate_response(self, prompt, model, stream=False, system_message=None, model_params=None, history=None):
+        """Generate a response; with stream, tokens are yielded as the model produces them."""
+        config = self._inference_config(model_params)
+        messages = self._build_messages(prompt, system_message, history)
+        # A new conversation is keyed by its first turn, which is this prompt
+        conversation = conversation_key(system_message, history or [{"role": "user", "content": prompt}],
+                                        (model_params or {}).get("conversation_id"))
+        chunks = self.manager.stream_response(model, prompt, config, messages=messages, conversation=conversation)
+        if stream:
+            yield from chunks
+        else:
+            yield "".join(chunks)
+    
+    def cancel(self):
+        """Stop the generations in progress."""
+        self.manager.cancel_generation()
     
     def is_available(self) -> bool:
         """Check if local models are available."""
-        return self.manager.llama_cpp_path is not None and len(self.manager.get_downloaded_models()) > 0 
+        return self.manager.llama_cpp_path is not None and len(self.manager.get_downloaded_models()) > 0
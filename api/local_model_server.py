@@ -25,7 +25,8 @@ import shutil
 import logging
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any, Union, Generator
-from dataclasses import dataclass, asdict
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, replace
 from enum import Enum
 import requests
 import psutil
@@ -34,6 +35,10 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from PyQt6.QtCore import QObject, pyqtSignal, QThread, QTimer, QMutex, QWaitCondition
 from PyQt6.QtWidgets import QApplication, QMessageBox, QProgressDialog
 
+from .rate_limiter import PRIORITY_INTERACTIVE
+from .slot_scheduler import SlotScheduler, SlotTimeout
+from .stream_decoder import iter_decoded, openai_delta_text
+
 logger = logging.getLogger(__name__)
 
 
@@ -135,6 +140,9 @@ class ServerConfig:
     enable_model_management: bool = True
     enable_batch_processing: bool = True
     max_batch_size: int = 4
+    max_queue_size: int = 64  # requests waiting for a slot before new ones are refused
+    threads: int = -1  # generation threads; -1 lets llama.cpp decide
+    cpu_affinity: Optional[List[int]] = None  # logical CPUs the server process is pinned to
     enable_streaming: bool = True
     enable_websocket: bool = True
     websocket_port: int = 8081
@@ -217,6 +225,9 @@ class InferenceRequest:
     stop: Optional[List[str]] = None
     stream: bool = False
     model: Optional[str] = None
+    conversation_id: Optional[str] = None  # keeps a conversation on the slot holding its prompt cache
+    priority: int = PRIORITY_INTERACTIVE
+    queue_timeout: Optional[float] = None  # seconds to wait for a slot; None waits indefinitely
 
 
 @dataclass
@@ -251,10 +262,13 @@ class LlamaCppServer(QObject):
         self.server_url = f"http://{self.config.host}:{self.config.port}"
         self.websocket_url = f"ws://{self.config.host}:{self.config.websocket_port}"
         self.is_running = False
+        # Result of the last health check; replica routing skips unhealthy servers
+        self.healthy = False
         self.loaded_models = {}
         self.model_configs = {}
-        self.request_queue = []
-        self.response_queue = []
+        # Requests share the server's --n-parallel slots through a fair queue
+        slots = self.config.max_connections if self.config.enable_batch_processing else 1
+        self.scheduler = SlotScheduler(slots=slots, max_queue=self.config.max_queue_size)
         self.mutex = QMutex()
         self.wait_condition = QWaitCondition()
         self.executor = ThreadPoolExecutor(max_workers=self.config.max_connections)
@@ -371,6 +385,9 @@ class LlamaCppServer(QObject):
                 "--n-parallel", str(self.config.max_connections)
             ]
             
+            if self.config.threads > 0:
+                cmd.extend(["--threads", str(self.config.threads)])
+            
             if self.config.enable_websocket:
                 cmd.extend(["--websocket", "--websocket-port", str(self.config.websocket_port)])
             
@@ -391,7 +408,9 @@ class LlamaCppServer(QObject):
             time.sleep(2)
             
             if self.server_process.poll() is None:
+                self._apply_cpu_affinity()
                 self.is_running = True
+                self.healthy = True
                 logger.info(f"Server started at {self.server_url}")
                 self.server_started.emit(self.server_url)
                 
@@ -422,6 +441,7 @@ class LlamaCppServer(QObject):
                 self.server_process.wait(timeout=10)
             
             self.is_running = False
+            self.healthy = False
             logger.info("Server stopped")
             self.server_stopped.emit()
             
@@ -432,6 +452,17 @@ class LlamaCppServer(QObject):
         except Exception as e:
             logger.error(f"Error stopping server: {e}")
     
+    def _apply_cpu_affinity(self):
+        """Pin the server process to its configured CPUs."""
+        if not self.config.cpu_affinity or not self.server_process:
+            return
+        try:
+            psutil.Process(self.server_process.pid).cpu_affinity(list(self.config.cpu_affinity))
+            logger.info(f"Server on port {self.config.port} pinned to CPUs {self.config.cpu_affinity}")
+        except (AttributeError, psutil.Error, OSError) as e:
+            # cpu_affinity is not available on macOS
+            logger.warning(f"Could not pin server to CPUs {self.config.cpu_affinity}: {e}")
+    
     def _monitor_server(self):
         """Monitor server process."""
         while self.is_running and self.server_process:
@@ -439,20 +470,25 @@ class LlamaCppServer(QObject):
                 logger.error("Server process terminated unexpectedly")
                 self.server_error.emit("Server process terminated unexpectedly")
                 self.is_running = False
+                self.healthy = False
                 break
             time.sleep(1)
     
-    def _health_check(self):
+    def _health_check(self) -> bool:
         """Perform health check on the server."""
         if not self.is_running:
-            return
+            self.healthy = False
+            return False
         
         try:
             response = requests.get(f"{self.server_url}/health", timeout=5)
-            if response.status_code != 200:
+            self.healthy = response.status_code == 200
+            if not self.healthy:
                 logger.warning("Server health check failed")
         except Exception as e:
+            self.healthy = False
             logger.warning(f"Server health check failed: {e}")
+        return self.healthy
     
     def load_model(self, model_path: str, config: ModelConfig = None) -> bool:
         """Load a model into the server."""
@@ -563,30 +599,42 @@ class LlamaCppServer(QObject):
             if request.stop:
                 payload["stop"] = request.stop
             
-            self.inference_started.emit(request.model)
+            # Reuse the KV cache of the slot's previous prompt
+            payload["cache_prompt"] = True
             
             if request.stream:
-                return self._generate_streaming_response(request.model, payload)
+                return self._generate_streaming_response(request, payload)
             else:
-                return self._generate_single_response(request.model, payload)
+                return self._generate_single_response(request, payload)
                 
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             self.inference_error.emit(request.model, str(e))
             raise
     
-    def _generate_single_response(self, model_name: str, payload: Dict[str, Any]) -> str:
+    def submit(self, request: InferenceRequest):
+        """Run a non-streaming request in the background; returns a Future of the response text."""
+        request.stream = False
+        return self.executor.submit(self.generate_response, request)
+    
+    def _generate_single_response(self, request: InferenceRequest, payload: Dict[str, Any]) -> str:
         """Generate a single response."""
-        start_time = time.time()
-        
-        response = requests.post(
-            f"{self.server_url}/v1/completions",
-            json=payload,
-            timeout=60
-        )
+        model_name = request.model
+        with self.scheduler.slot(request.conversation_id, request.priority, request.queue_timeout) as lease:
+            payload["id_slot"] = lease.slot
+            self.inference_started.emit(model_name)
+            start_time = time.time()
+            
+            response = requests.post(
+                f"{self.server_url}/v1/completions",
+                json=payload,
+                timeout=60
+            )
+            if response.status_code == 200:
+                data = response.json()
+                lease.tokens = data.get("usage", {}).get("completion_tokens", 0)
         
         if response.status_code == 200:
-            data = response.json()
             text = data["choices"][0]["text"]
             tokens_used = data.get("usage", {}).get("total_tokens", 0)
             time_taken = time.time() - start_time
@@ -600,46 +648,42 @@ class LlamaCppServer(QObject):
             self.inference_error.emit(model_name, error_msg)
             raise Exception(error_msg)
     
-    def _generate_streaming_response(self, model_name: str, payload: Dict[str, Any]) -> Generator[str, None, None]:
-        """Generate a streaming response."""
-        start_time = time.time()
-        
-        response = requests.post(
-            f"{self.server_url}/v1/completions",
-            json=payload,
-            stream=True,
-            timeout=60
-        )
-        
-        if response.status_code == 200:
-            full_text = ""
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        data = line[6:]
-                        if data.strip() == '[DONE]':
-                            break
-                        try:
-                            chunk_data = json.loads(data)
-                            if 'choices' in chunk_data and len(chunk_data['choices']) > 0:
-                                delta = chunk_data['choices'][0].get('delta', {})
-                                content = delta.get('content', '')
-                                if content:
-                                    full_text += content
-                                    self.inference_chunk.emit(model_name, content)
-                                    yield content
-                        except json.JSONDecodeError:
-                            continue
+    def _generate_streaming_response(self, request: InferenceRequest,
+                                     payload: Dict[str, Any]) -> Generator[str, None, None]:
+        """Generate a streaming response; the slot is held until the stream ends or is closed."""
+        model_name = request.model
+        with self.scheduler.slot(request.conversation_id, request.priority, request.queue_timeout) as lease:
+            payload["id_slot"] = lease.slot
+            self.inference_started.emit(model_name)
+            start_time = time.time()
             
-            time_taken = time.time() - start_time
-            logger.info(f"Generated streaming response in {time_taken:.2f}s")
-            self.inference_complete.emit(model_name, full_text)
-        else:
-            error_msg = f"API error: {response.status_code} - {response.text}"
-            logger.error(error_msg)
-            self.inference_error.emit(model_name, error_msg)
-            raise Exception(error_msg)
+            response = requests.post(
+                f"{self.server_url}/v1/completions",
+                json=payload,
+                stream=True,
+                timeout=60
+            )
+            
+            if response.status_code == 200:
+                chunks = []
+                for chunk_data in iter_decoded(response):
+                    content = openai_delta_text(chunk_data)
+                    if content:
+                        chunks.append(content)
+                        # One streamed chunk per generated token
+                        lease.tokens += 1
+                        self.inference_chunk.emit(model_name, content)
+                        yield content
+                full_text = "".join(chunks)
+                
+                time_taken = time.time() - start_time
+                logger.info(f"Generated streaming response in {time_taken:.2f}s")
+                self.inference_complete.emit(model_name, full_text)
+            else:
+                error_msg = f"API error: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                self.inference_error.emit(model_name, error_msg)
+                raise Exception(error_msg)
     
     def get_loaded_models(self) -> Dict[str, str]:
         """Get list of loaded models."""
@@ -662,13 +706,18 @@ class LlamaCppServer(QObject):
                     "url": self.server_url,
                     "websocket_url": self.websocket_url if self.config.enable_websocket else None,
                     "loaded_models": list(self.loaded_models.keys()),
-                    "available_backends": [b.value for b in self.available_backends]
+                    "available_backends": [b.value for b in self.available_backends],
+                    "scheduler": self.scheduler.get_stats()
                 }
             else:
                 return {"status": "error", "error": f"Health check failed: {response.status_code}"}
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Get queue depth, slot utilization and aggregate tokens per second."""
+        return self.scheduler.get_stats()
+    
     def cleanup(self):
         """Clean up resources."""
         self.stop_server()
@@ -678,6 +727,179 @@ class LlamaCppServer(QObject):
             self.health_timer.stop()
 
 
+class ReplicaGroup:
+    """
+    Several llama.cpp servers serving the same model, each pinned to its own
+    CPUs. Requests go to the healthy replica with the fewest requests in
+    flight per slot; a conversation stays on its replica while that replica
+    has a free slot, so its prompt cache is reused. A request that fails
+    before producing output is retried on another replica.
+    """
+    
+    # Conversations whose replica is remembered
+    MAX_CONVERSATIONS = 1024
+    
+    def __init__(self, name: str, servers: List[LlamaCppServer]):
+        self.name = name
+        self.servers = servers
+        self._lock = threading.Lock()
+        self._in_flight = [0] * len(servers)
+        self._stats = [{"routed": 0, "errors": 0, "retries": 0} for _ in servers]
+        self._conversations: "OrderedDict[str, int]" = OrderedDict()
+        self._next = 0
+        self._checking: set = set()  # replicas with a health check running
+    
+    @staticmethod
+    def plan_cpus(replicas: int, cpus: Optional[List[int]] = None) -> List[List[int]]:
+        """Split the CPUs this process may use into one contiguous set per replica."""
+        if cpus is None:
+            try:
+                cpus = sorted(psutil.Process().cpu_affinity())
+            except (AttributeError, psutil.Error, OSError):
+                cpus = list(range(psutil.cpu_count() or 1))
+        replicas = max(1, min(replicas, len(cpus)))
+        size, extra = divmod(len(cpus), replicas)
+        plan, start = [], 0
+        for index in range(replicas):
+            end = start + size + (1 if index < extra else 0)
+            plan.append(cpus[start:end])
+            start = end
+        return plan
+    
+    def _healthy(self, index: int) -> bool:
+        server = self.servers[index]
+        return server.is_running and server.healthy
+    
+    def _load(self, index: int) -> float:
+        return self._in_flight[index] / self.servers[index].scheduler.slots
+    
+    def _route(self, request: InferenceRequest, tried: set) -> int:
+        """Pick a replica for a request and count it as in flight."""
+        with self._lock:
+            candidates = [index for index in range(len(self.servers)) if index not in tried and self._healthy(index)]
+            if not candidates:
+                raise Exception(f"No healthy replica left in group {self.name}")
+            preferred = self._conversations.get(request.conversation_id) if request.conversation_id else None
+            if preferred in candidates and self._load(preferred) < 1:
+                index = preferred
+            else:
+                # Least loaded; ties go round-robin so idle replicas share the work
+                start = self._next
+                self._next = (self._next + 1) % len(self.servers)
+                index = min(candidates, key=lambda i: (self._load(i), (i - start) % len(self.servers)))
+            if request.conversation_id:
+                self._conversations[request.conversation_id] = index
+                self._conversations.move_to_end(request.conversation_id)
+                while len(self._conversations) > self.MAX_CONVERSATIONS:
+                    self._conversations.popitem(last=False)
+            self._in_flight[index] += 1
+            self._stats[index]["routed"] += 1
+            return index
+    
+    def _done(self, index: int):
+        with self._lock:
+            self._in_flight[index] -= 1
+    
+    def _failed(self, index: int, error: Exception, tried: set) -> bool:
+        """Record a failure; True if the request should be retried on another replica."""
+        with self._lock:
+            self._stats[index]["errors"] += 1
+        logger.warning(f"Replica {self.servers[index].server_url} of {self.name} failed: {error}")
+        tried.add(index)
+        # A slot wait that timed out already used up the caller's patience
+        if isinstance(error, SlotTimeout):
+            return False
+        self._suspect(index)
+        if len(tried) >= len(self.servers):
+            return False
+        with self._lock:
+            self._stats[index]["retries"] += 1
+        return True
+    
+    def _suspect(self, index: int):
+        """
+        Take a failed replica out of routing and health-check it in the background,
+        so a hung server does not add its health-check timeout to the failover.
+        """
+        server = self.servers[index]
+        with self._lock:
+            server.healthy = False
+            if index in self._checking:
+                return
+            self._checking.add(index)
+        
+        def check():
+            try:
+                if server._health_check():
+                    logger.info(f"Replica {server.server_url} of {self.name} is healthy again")
+            finally:
+                with self._lock:
+                    self._checking.discard(index)
+        
+        threading.Thread(target=check, daemon=True, name=f"replica-health-{self.name}-{index}").start()
+    
+    def generate_response(self, request: InferenceRequest) -> Union[str, Generator[str, None, None]]:
+        """Generate a response on the least loaded healthy replica."""
+        if request.stream:
+            return self._generate_streaming_response(request)
+        tried = set()
+        while True:
+            index = self._route(request, tried)
+            try:
+                return self.servers[index].generate_response(request)
+            except Exception as e:
+                if not self._failed(index, e, tried):
+                    raise
+            finally:
+                self._done(index)
+    
+    def _generate_streaming_response(self, request: InferenceRequest) -> Generator[str, None, None]:
+        tried = set()
+        while True:
+            index = self._route(request, tried)
+            started = False
+            try:
+                for chunk in self.servers[index].generate_response(request):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                # Output already shown cannot be taken back, so only retry before the first chunk
+                if started or not self._failed(index, e, tried):
+                    raise
+            finally:
+                self._done(index)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-replica health, load and queue metrics and the group's aggregate throughput."""
+        with self._lock:
+            in_flight = list(self._in_flight)
+            counts = [dict(stats) for stats in self._stats]
+        replicas = []
+        for index, server in enumerate(self.servers):
+            scheduler = server.scheduler.get_stats()
+            replicas.append(dict(
+                counts[index],
+                url=server.server_url,
+                healthy=self._healthy(index),
+                cpus=server.config.cpu_affinity,
+                in_flight=in_flight[index],
+                slots=scheduler["slots"],
+                busy_slots=scheduler["busy_slots"],
+                queue_depth=scheduler["queue_depth"],
+                utilization=scheduler["utilization"],
+                tokens_per_second=scheduler["tokens_per_second"],
+                wait_p90=scheduler["wait_p90"],
+            ))
+        return {
+            "replicas": replicas,
+            "healthy": sum(1 for replica in replicas if replica["healthy"]),
+            "in_flight": sum(in_flight),
+            "queue_depth": sum(replica["queue_depth"] for replica in replicas),
+            "tokens_per_second": sum(replica["tokens_per_second"] for replica in replicas),
+        }
+
+
 class LocalModelServerManager(QObject):
     """Manager for multiple local model servers."""
     
@@ -689,6 +911,7 @@ class LocalModelServerManager(QObject):
         self.servers = {}
         self.server_configs = {}
         self.model_registry = {}
+        self.replica_groups: Dict[str, ReplicaGroup] = {}
         
         # Load server configurations
         self._load_server_configs()
@@ -772,6 +995,69 @@ class LocalModelServerManager(QObject):
         else:
             return False
     
+    def create_replica_group(self, name: str, replicas: int, config: ServerConfig = None,
+                             model_path: str = None, model_config: ModelConfig = None) -> bool:
+        """
+        Start replicas of a server on consecutive ports (from config.port),
+        each pinned to its own share of the CPUs, and optionally load a model
+        on all of them. Replica servers are named "<name>-<index>".
+        """
+        if name in self.replica_groups:
+            logger.warning(f"Replica group {name} already exists")
+            return False
+        
+        base = config or self.server_configs.get(name) or ServerConfig()
+        cpu_sets = ReplicaGroup.plan_cpus(replicas)
+        if len(cpu_sets) < replicas:
+            logger.warning(f"Only {len(cpu_sets)} CPUs available; starting {len(cpu_sets)} replicas of {name}")
+        
+        servers = []
+        for index, cpus in enumerate(cpu_sets):
+            replica_name = f"{name}-{index}"
+            replica_config = replace(
+                base,
+                port=base.port + index,
+                # Websocket ports follow the block of server ports
+                websocket_port=base.port + len(cpu_sets) + index,
+                cpu_affinity=cpus,
+                threads=base.threads if base.threads > 0 else len(cpus)
+            )
+            started = self.create_server(replica_name, replica_config)
+            if started and model_path:
+                started = self.load_model(replica_name, model_path, model_config)
+            if not started:
+                logger.error(f"Failed to start replica {index} of {name}")
+                for server_name in [f"{name}-{i}" for i in range(index + 1)]:
+                    self.stop_server(server_name)
+                return False
+            servers.append(self.servers[replica_name])
+        
+        self.replica_groups[name] = ReplicaGroup(name, servers)
+        logger.info(f"Replica group {name} started with {len(servers)} replicas")
+        return True
+    
+    def stop_replica_group(self, name: str) -> bool:
+        """Stop every replica of a group."""
+        group = self.replica_groups.pop(name, None)
+        if group is None:
+            return False
+        for index in range(len(group.servers)):
+            self.stop_server(f"{name}-{index}")
+        return True
+    
+    def route_request(self, group_name: str, request: InferenceRequest) -> Union[str, Generator[str, None, None]]:
+        """Generate a response on the least loaded healthy replica of a group."""
+        if group_name not in self.replica_groups:
+            raise Exception(f"Replica group {group_name} not found")
+        return self.replica_groups[group_name].generate_response(request)
+    
+    def get_replica_group_stats(self, name: str = None) -> Dict[str, Any]:
+        """Get per-replica load and queue metrics of one group, or of all groups."""
+        if name is not None:
+            group = self.replica_groups.get(name)
+            return group.get_stats() if group else {}
+        return {group_name: group.get_stats() for group_name, group in self.replica_groups.items()}
+    
     def get_available_models(self) -> Dict[str, Dict[str, Any]]:
         """Get all available models across all servers."""
         models = {}
@@ -798,6 +1084,7 @@ class LocalModelServerManager(QObject):
         for name, server in self.servers.items():
             server.cleanup()
         self.servers.clear()
+        self.replica_groups.clear()
         logger.info("All servers cleaned up")
 
 
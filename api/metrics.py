@@ -0,0 +1,127 @@
+"""
+Timing metrics for streamed model responses.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+
+@dataclass
+class StreamMetrics:
+    """Timing of one streamed response: time to first token, throughput and total time.
+
+    Throughput is measured in tokens. Callers set ``tokens`` once the stream
+    ends, from the provider's reported usage or the shared token counter,
+    since a chunk may hold many tokens (Claude, Gemini, cache replays). Only
+    while ``tokens`` is unset is the chunk count used in its place.
+    """
+    provider: str
+    model: str
+    started_at: float = field(default_factory=time.perf_counter)
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: int = 0
+    characters: int = 0
+    tokens: Optional[int] = None
+    error: Optional[str] = None
+
+    def record_chunk(self, chunk: str):
+        """Record one streamed chunk."""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+        self.characters += len(chunk)
+
+    def finish(self, error: Optional[str] = None):
+        """Mark the stream as finished (or failed)."""
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        if error is not None:
+            self.error = error
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds from request start to the first chunk."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def total_time(self) -> float:
+        """Seconds from request start to the end of the stream (or now, if still running)."""
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Tokens per second generated after the first chunk (chunks per second while tokens is unset)."""
+        if self.first_token_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        generation_time = end - self.first_token_at
+        tokens = self.tokens if self.tokens is not None else self.chunks
+        if generation_time <= 0 or tokens <= 1:
+            return None
+        # The first token arrives at first_token_at, so it is not part of the rate
+        return (tokens - 1) / generation_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the metrics as a plain dict; "tokens" falls back to the chunk count while unset."""
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "time_to_first_token": self.time_to_first_token,
+            "tokens_per_second": self.tokens_per_second,
+            "total_time": self.total_time,
+            "chunks": self.chunks,
+            "characters": self.characters,
+            "tokens": self.tokens if self.tokens is not None else self.chunks,
+            "error": self.error,
+        }
+
+
+class LatencyTracker:
+    """Rolling window of latency samples per key with percentile queries."""
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        """Add one latency sample for a key."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+    def percentile(self, key: str, pct: float) -> Optional[float]:
+        """Nearest-rank percentile of the recorded samples, or None without data."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples))) - 1))
+        return samples[rank]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get sample count and p50/p90/p99 for every key."""
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            key: {
+                "count": self.count(key),
+                "p50": self.percentile(key, 50),
+                "p90": self.percentile(key, 90),
+                "p99": self.percentile(key, 99),
+            }
+            for key in keys
+        }
@@ -0,0 +1,232 @@
+"""
+Model catalog cache for provider model listings.
+
+Model lists are cached per (provider, endpoint) with a per-provider TTL.
+Stale entries are served immediately while a background thread revalidates
+them (using ETag / If-Modified-Since when the server supports it), and the
+whole cache is persisted to disk so the next launch can show models before
+any provider has answered.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CatalogEntry:
+    """A cached model listing for one provider endpoint."""
+    models: List[str]
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+# A fetcher receives the current entry (for conditional requests) and returns a
+# fresh CatalogEntry, or None when the server reports the listing is unchanged.
+CatalogFetcher = Callable[[Optional[CatalogEntry]], Optional[CatalogEntry]]
+
+
+class ModelCatalogCache:
+    """TTL cache of provider model lists with background revalidation and disk persistence."""
+
+    # Local servers change models often; remote catalogs rarely
+    DEFAULT_TTLS = {
+        "Ollama": 60,
+        "LM Studio": 60,
+        "llama.cpp": 60,
+        "vLLM": 120,
+        "OpenRouter.ai": 6 * 3600,
+        "Nebius AI Studio": 6 * 3600,
+    }
+
+    def __init__(self, cache_path: Optional[Path] = None, default_ttl: float = 300,
+                 ttls: Optional[Dict[str, float]] = None, persist: bool = True):
+        self.cache_path = cache_path or Path.home() / ".oracle" / "model_catalog_cache.json"
+        self.default_ttl = default_ttl
+        self.ttls = dict(self.DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.persist = persist
+
+        self._entries: Dict[Tuple[str, str], CatalogEntry] = {}
+        self._revalidating = set()
+        self._listeners: List[Callable[[str, str, List[str]], None]] = []
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "not_modified": 0, "fetches": 0, "errors": 0}
+
+        if self.persist:
+            self._load()
+
+    def get_ttl(self, provider: str) -> float:
+        """Get the TTL in seconds for a provider."""
+        return self.ttls.get(provider, self.default_ttl)
+
+    def set_ttl(self, provider: str, seconds: float):
+        """Set the TTL in seconds for a provider."""
+        self.ttls[provider] = seconds
+
+    def peek(self, provider: str, endpoint: str) -> List[str]:
+        """Return the cached models for an endpoint without fetching, fresh or not."""
+        with self._lock:
+            entry = self._entries.get((provider, endpoint or ""))
+            return list(entry.models) if entry else []
+
+    def get(self, provider: str, endpoint: str, fetch: Optional[CatalogFetcher],
+            force: bool = False) -> List[str]:
+        """
+        Get the model list for an endpoint.
+
+        Fresh entries are returned directly. Stale entries are returned
+        immediately and revalidated in the background. Missing entries, or any
+        entry when ``force`` is set, are fetched synchronously; with ``force``
+        fetch errors propagate to the caller.
+        """
+        key = (provider, endpoint or "")
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry and not force:
+            if time.time() - entry.fetched_at < self.get_ttl(provider):
+                self._count("hits")
+                return list(entry.models)
+            self._count("stale_hits")
+            if fetch is not None:
+                self._revalidate_async(key, fetch)
+            return list(entry.models)
+
+        if fetch is None:
+            return list(entry.models) if entry else []
+
+        self._count("misses")
+        try:
+            return self._fetch(key, fetch, entry)
+        except Exception as e:
+            self._count("errors")
+            if force:
+                raise
+            logger.warning(f"Failed to fetch model catalog for {provider}: {e}")
+            return []
+
+    def _fetch(self, key: Tuple[str, str], fetch: CatalogFetcher, entry: Optional[CatalogEntry]) -> List[str]:
+        """Run a fetcher and store its result."""
+        self._count("fetches")
+        result = fetch(entry)
+        with self._lock:
+            if result is None:
+                # Not modified: keep the listing, restart its TTL
+                self._count("not_modified")
+                if entry is None:
+                    return []
+                entry.fetched_at = time.time()
+                result = entry
+                changed = False
+            else:
+                changed = entry is None or entry.models != result.models
+                self._entries[key] = result
+            models = list(result.models)
+            listeners = list(self._listeners) if changed else []
+
+        self._save()
+        for listener in listeners:
+            try:
+                listener(key[0], key[1], models)
+            except Exception as e:
+                logger.warning(f"Model catalog listener failed: {e}")
+        return models
+
+    def _revalidate_async(self, key: Tuple[str, str], fetch: CatalogFetcher):
+        """Refresh a stale entry on a background thread (one in flight per key)."""
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            entry = self._entries.get(key)
+
+        def revalidate():
+            try:
+                self._fetch(key, fetch, entry)
+            except Exception as e:
+                self._count("errors")
+                logger.debug(f"Background model catalog refresh failed for {key[0]}: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=revalidate, name=f"catalog-refresh-{key[0]}", daemon=True).start()
+
+    def add_listener(self, callback: Callable[[str, str, List[str]], None]):
+        """Register callback(provider, endpoint, models), called when a listing changes."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, str, List[str]], None]):
+        """Unregister a change listener."""
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def invalidate(self, provider: Optional[str] = None, endpoint: Optional[str] = None):
+        """Mark entries stale so the next lookup revalidates them."""
+        with self._lock:
+            for (entry_provider, entry_endpoint), entry in self._entries.items():
+                if provider is not None and entry_provider != provider:
+                    continue
+                if endpoint is not None and entry_endpoint != endpoint:
+                    continue
+                entry.fetched_at = 0.0
+
+    def clear(self):
+        """Drop all cached listings, including the persisted snapshot."""
+        with self._lock:
+            self._entries.clear()
+        self._save()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache hit/miss counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _load(self):
+        """Load the persisted snapshot."""
+        try:
+            if not self.cache_path.exists():
+                return
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for item in data.get("entries", []):
+                key = (item.pop("provider"), item.pop("endpoint"))
+                self._entries[key] = CatalogEntry(**item)
+        except Exception as e:
+            logger.warning(f"Failed to load model catalog cache: {e}")
+
+    def _save(self):
+        """Persist the cache atomically."""
+        if not self.persist:
+            return
+        with self._lock:
+            entries = [dict(provider=provider, endpoint=endpoint, **asdict(entry))
+                       for (provider, endpoint), entry in self._entries.items()]
+        with self._save_lock:
+            try:
+                self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.cache_path.with_suffix(".tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"entries": entries}, f, indent=2)
+                os.replace(tmp_path, self.cache_path)
+            except Exception as e:
+                logger.warning(f"Failed to save model catalog cache: {e}")
@@ -1,11 +1,29 @@
 """
 Multi-provider client manager for various LLM providers
 """
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from core.config import OLLAMA_AVAILABLE, QSettings, logger
-from .clients import (GeminiClient, ClaudeClient, DeepSeekClient, QwenClient, 
+from core.token_counter import token_counter
+from utils.error_handler import recovery_manager
+from .async_streams import aiter_sync, iter_async
+from .comparison import ComparisonRun
+from .hedging import HedgedRequest
+from .embeddings import EmbeddingService
+from .metrics import LatencyTracker
+from .ollama_residency import ollama_residency
+from .provider_health import ProviderHealthTracker
+from .rate_limiter import PRIORITY_INTERACTIVE, RateLimiter, RateLimitTimeout, rate_limit_retry_after
+from .response_cache import ResponseCache
+from .clients import (APIClient, GeminiClient, ClaudeClient, DeepSeekClient, QwenClient, 
                      LMStudioClient, LlamaCppClient, NebiusClient, OpenRouterClient, 
                      HuggingFacePlaygroundClient, GoogleAIStudioClient, VLLMClient, PerplexityClient,
-                     OllamaClient)
+                     OllamaClient, OpenAIClient, GroqClient, RequestUsage)
+from .provider_registry import provider_registry
 
 # Local model support
 try:
@@ -21,6 +39,12 @@ try:
 except ImportError:
     LOCAL_SERVER_AVAILABLE = False
 
+# Local servers probed during startup discovery
+LOCAL_SERVER_PROVIDERS = ("Ollama", "LM Studio", "llama.cpp", "vLLM")
+
+# Embedding backends in order of preference: local servers need no network round trip
+EMBEDDING_PROVIDERS = ("Ollama", "llama.cpp", "vLLM", "OpenAI", "Google Gemini")
+
 
 class MultiProviderClient:
     """Multi-provider API client manager with organized categories"""
@@ -28,24 +52,62 @@ class MultiProviderClient:
         # Flat structure for easier access, but organized conceptually
         self.providers = {}
         
+        # Local server discovery state (probes run in the background)
+        self.discovery_deadline = 3.0  # seconds for all probes together
+        self.discovery_status = {}  # provider_name -> "pending" | "available" | "unavailable"
+        self._discovery_listeners = []
+        self._discovery_futures = {}
+        self._discovery_lock = threading.Lock()
+
+        # Observed time to first token per "provider:model", used to time hedged requests
+        self.ttft_tracker = LatencyTracker()
+        self.hedge_delay = None  # seconds; None = observed p90 TTFT of the primary
+        self.hedge_percentile = 90
+
+        # Circuit breakers per provider and the (provider, model) pairs to fail over to
+        self.health = ProviderHealthTracker()
+        self.fallback_chain = []
+        recovery_manager.register_api_handlers(self._recovery_retry, self._recovery_failover)
+
+        # Requests/tokens per minute budgets per provider and API key; 429s are retried after a pause
+        self.rate_limiter = RateLimiter()
+        self.rate_limit_retries = 3
+
+        # Opt-in cache of deterministic (temperature 0 / fixed seed) responses
+        self.response_cache = ResponseCache()
+
+        # Provider-reported token usage, including prompt cache reads and writes
+        self.last_usage = None
+        self.usage_totals = {}
+
+        # Batched, cached embedding services per (provider, model)
+        self.embedding_provider = None  # None = first available of EMBEDDING_PROVIDERS
+        self.embedding_model = None
+        self._embedders = {}
+        self._embedders_lock = threading.Lock()
+
         # Initialize all provider placeholders
         self._init_provider_structure()
-        
-        # Initialize local servers first
-        self._init_local_servers()
-        
+
         # Initialize local models
+        self.local_model_manager = None
         self._init_local_models()
-        
+
         # Initialize local model servers
-        self._init_local_servers()
-        
+        self._init_local_server_manager()
+
         # Set defaults
         self.current_provider = "Ollama"
         self.current_model = None
-        
-        # Load API keys and initialize commercial providers
+
+        # Follow model catalog changes found by background revalidation
+        APIClient.model_cache.add_listener(self._on_catalog_updated)
+
+        # Load API keys, create local server clients and initialize commercial providers
         self.load_settings()
+
+        # Probe local servers concurrently without blocking the caller
+        self.start_discovery()
     
     def _init_provider_structure(self):
         """Initialize the provider structure"""
@@ -82,45 +144,34 @@ class MultiProviderClient:
             "Perplexity": {"client": None, "models": [], "category": "Commercial APIs"}
         })
     
-    def _init_local_servers(self):
-        """Initialize local server clients"""
-        # Initialize Ollama client if available
+    def _init_local_servers(self, endpoints):
+        """Get local server clients for the configured endpoints without probing them"""
+        # The registry hands back the same client until its endpoint changes
         if OLLAMA_AVAILABLE:
             try:
-                self.providers["Ollama"]["client"] = OllamaClient()
-                models = self.providers["Ollama"]["client"].get_models()
-                if models:
-                    self.providers["Ollama"]["models"] = models
+                self.providers["Ollama"]["client"] = provider_registry.get(
+                    OllamaClient, host=endpoints["ollama_host"], auto_refresh=False)
             except Exception as e:
                 logger.warning(f"Failed to initialize Ollama client: {e}")
-        
-        # Initialize LM Studio client
-        try:
-            self.providers["LM Studio"]["client"] = LMStudioClient()
-            models = self.providers["LM Studio"]["client"].get_models()
-            if models:
-                self.providers["LM Studio"]["models"] = models
-        except Exception as e:
-            logger.warning(f"Failed to initialize LM Studio client: {e}")
-        
-        # Initialize llama.cpp client
-        try:
-            self.providers["llama.cpp"]["client"] = LlamaCppClient()
-            models = self.providers["llama.cpp"]["client"].get_models()
-            if models:
-                self.providers["llama.cpp"]["models"] = models
-        except Exception as e:
-            logger.warning(f"Failed to initialize llama.cpp client: {e}")
-        
-        # Initialize vLLM client
-        try:
-            self.providers["vLLM"]["client"] = VLLMClient()
-            models = self.providers["vLLM"]["client"].get_models()
-            if models:
-                self.providers["vLLM"]["models"] = models
-        except Exception as e:
-            logger.warning(f"Failed to initialize vLLM client: {e}")
-    
+
+        local_clients = {
+            "LM Studio": (LMStudioClient, endpoints["lm_studio_host"]),
+            "llama.cpp": (LlamaCppClient, endpoints["llama_cpp_host"]),
+            "vLLM": (VLLMClient, endpoints["vllm_host"])
+        }
+        for provider_name, (client_class, base_url) in local_clients.items():
+            try:
+                self.providers[provider_name]["client"] = provider_registry.get(
+                    client_class, base_url=base_url, auto_refresh=False)
+            except Exception as e:
+                logger.warning(f"Failed to initialize {provider_name} client: {e}")
+
+        # Show the last known models right away; discovery replaces them once probes answer
+        for provider_name in LOCAL_SERVER_PROVIDERS:
+            client = self.providers[provider_name]["client"]
+            if client is not None:
+                self.providers[provider_name]["models"] = client.get_cached_snapshot()
+
     def _init_local_models(self):
         """Initialize local model manager and provider"""
         if LOCAL_MODELS_AVAILABLE:
@@ -137,7 +188,7 @@ class MultiProviderClient:
             except Exception as e:
                 logger.warning(f"Failed to initialize local model manager: {e}")
     
-    def _init_local_servers(self):
+    def _init_local_server_manager(self):
         """Initialize local model server manager"""
         if LOCAL_SERVER_AVAILABLE:
             try:
@@ -182,89 +233,201 @@ class MultiProviderClient:
             "vllm_host": settings.value("vllm_host", "http://127.0.0.1:8000")
         }
         
+        # Configure the shared keep-alive HTTP pool used by the requests-based clients
+        APIClient.configure_http_pool(
+            pool_connections=settings.value("http_pool_connections", 4, type=int),
+            pool_maxsize=settings.value("http_pool_maxsize", 16, type=int),
+            http2=settings.value("http2_enabled", False, type=bool)
+        )
+
+        # Fallback chain, stored as a JSON list of "provider:model" strings
+        self.fallback_chain = self._parse_fallback_chain(settings.value("fallback_chain", "[]"))
+
+        # Response cache (off unless enabled in settings)
+        self.response_cache.enabled = settings.value("response_cache_enabled", False, type=bool)
+        self.response_cache.ttl = settings.value("response_cache_ttl_hours", 168, type=int) * 3600
+
+        # Rate limits, stored as JSON: {"provider": {"rpm": ..., "tpm": ...}}, over an optional preset ("free_tier")
+        try:
+            self.rate_limiter.set_limits(json.loads(settings.value("rate_limits", "{}") or "{}"),
+                                         preset=settings.value("rate_limit_preset", "") or None)
+        except (TypeError, ValueError, AttributeError):
+            logger.warning("Ignoring malformed rate_limits setting")
+
+        # Ollama residency: keep_alive values are Ollama durations ("5m") or seconds (-1 = forever)
+        ollama_residency.configure(
+            host=endpoints["ollama_host"],
+            keep_alive=settings.value("ollama_keep_alive", "5m"),
+            pinned_keep_alive=settings.value("ollama_pinned_keep_alive", "1h"),
+            ram_budget=int(settings.value("ollama_ram_budget_gb", 0, type=float) * 2**30)
+        )
+
+        # In-process local models; unset keeps half of system memory, 0 removes the limit
+        local_budget_gb = settings.value("local_model_ram_budget_gb", None)
+        if self.local_model_manager is not None and local_budget_gb not in (None, ""):
+            try:
+                self.local_model_manager.model_cache.configure(ram_budget=int(float(local_budget_gb) * 2**30))
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed local_model_ram_budget_gb setting")
+        if self.local_model_manager is not None:
+            # Disk space for per-conversation context snapshots; 0 turns them off
+            self.local_model_manager.kv_states.configure(
+                max_bytes=int(settings.value("local_kv_cache_gb", 4, type=float) * 2**30))
+
+        # Embeddings backend; empty means "pick the first available"
+        self.embedding_provider = settings.value("embedding_provider", "") or None
+        self.embedding_model = settings.value("embedding_model", "") or None
+
+        # Hedged requests: negative delay means "use the observed p90 time to first token"
+        hedge_delay_ms = settings.value("hedge_delay_ms", -1, type=int)
+        self.hedge_delay = hedge_delay_ms / 1000.0 if hedge_delay_ms >= 0 else None
+        
         # Initialize commercial API clients
         self._init_commercial_apis(api_keys)
         
         # Initialize AI Studios
         self._init_ai_studios(api_keys)
         
-        # Update local server endpoints
-        self._update_local_endpoints(endpoints)
+        # Create (or re-point) local server clients
+        self._init_local_servers(endpoints)
     
+    def _register_client(self, provider_name, client_class, api_key):
+        """Use the process-wide client for a provider; its SDK is only built on the first request"""
+        if not api_key:
+            return
+        try:
+            client = provider_registry.get(client_class, api_key)
+        except Exception as e:
+            logger.warning(f"Failed to initialize {provider_name} client: {e}")
+            return
+        self.providers[provider_name]["client"] = client
+        self.providers[provider_name]["models"] = client.get_models()
+
     def _init_commercial_apis(self, api_keys):
-        """Initialize commercial API clients"""
-        if api_keys["openai_api_key"]:
-            from .clients import OpenAIClient
-            self.providers["OpenAI"]["client"] = OpenAIClient(api_keys["openai_api_key"])
-            self.providers["OpenAI"]["models"] = self.providers["OpenAI"]["client"].get_models()
-        
-        if api_keys["anthropic_api_key"]:
-            self.providers["Anthropic"]["client"] = ClaudeClient(api_keys["anthropic_api_key"])
-            self.providers["Anthropic"]["models"] = self.providers["Anthropic"]["client"].get_models()
-        
-        if api_keys["google_api_key"]:
-            self.providers["Google Gemini"]["client"] = GeminiClient(api_keys["google_api_key"])
-            self.providers["Google Gemini"]["models"] = self.providers["Google Gemini"]["client"].get_models()
-        
-        if api_keys["deepseek_api_key"]:
-            self.providers["DeepSeek"]["client"] = DeepSeekClient(api_keys["deepseek_api_key"])
-            self.providers["DeepSeek"]["models"] = self.providers["DeepSeek"]["client"].get_models()
-        
-        if api_keys["qwen_api_key"]:
-            self.providers["Qwen"]["client"] = QwenClient(api_keys["qwen_api_key"])
-            self.providers["Qwen"]["models"] = self.providers["Qwen"]["client"].get_models()
-        
-        if api_keys["groq_api_key"]:
-            try:
-                from .clients import GroqClient
-                self.providers["Groq"]["client"] = GroqClient(api_keys["groq_api_key"])
-                self.providers["Groq"]["models"] = self.providers["Groq"]["client"].get_models()
-            except ImportError:
-                logger.warning("Groq library not available")
-        
-        if api_keys["perplexity_api_key"]:
-            try:
-                from .clients import PerplexityClient
-                self.providers["Perplexity"]["client"] = PerplexityClient(api_keys["perplexity_api_key"])
-                self.providers["Perplexity"]["models"] = self.providers["Perplexity"]["client"].get_models()
-            except Exception as e:
-                logger.warning(f"Failed to initialize Perplexity client: {e}")
+        """Register commercial API clients"""
+        self._register_client("OpenAI", OpenAIClient, api_keys["openai_api_key"])
+        self._register_client("Anthropic", ClaudeClient, api_keys["anthropic_api_key"])
+        self._register_client("Google Gemini", GeminiClient, api_keys["google_api_key"])
+        self._register_client("DeepSeek", DeepSeekClient, api_keys["deepseek_api_key"])
+        self._register_client("Qwen", QwenClient, api_keys["qwen_api_key"])
+        self._register_client("Groq", GroqClient, api_keys["groq_api_key"])
+        self._register_client("Perplexity", PerplexityClient, api_keys["perplexity_api_key"])
     
     def _init_ai_studios(self, api_keys):
-        """Initialize AI Studio clients"""
-        if api_keys["nebius_api_key"]:
-            self.providers["Nebius AI Studio"]["client"] = NebiusClient(api_keys["nebius_api_key"])
-            self.providers["Nebius AI Studio"]["models"] = self.providers["Nebius AI Studio"]["client"].get_models()
-        
-        if api_keys["openrouter_api_key"]:
-            self.providers["OpenRouter.ai"]["client"] = OpenRouterClient(api_keys["openrouter_api_key"])
-            self.providers["OpenRouter.ai"]["models"] = self.providers["OpenRouter.ai"]["client"].get_models()
-        
-        if api_keys["huggingface_api_key"]:
-            self.providers["Hugging Face Playground"]["client"] = HuggingFacePlaygroundClient(api_keys["huggingface_api_key"])
-            self.providers["Hugging Face Playground"]["models"] = self.providers["Hugging Face Playground"]["client"].get_models()
-        
-        if api_keys["google_ai_studio_key"]:
-            self.providers["Google AI Studio"]["client"] = GoogleAIStudioClient(api_keys["google_ai_studio_key"])
-            self.providers["Google AI Studio"]["models"] = self.providers["Google AI Studio"]["client"].get_models()
+        """Register AI Studio clients"""
+        self._register_client("Nebius AI Studio", NebiusClient, api_keys["nebius_api_key"])
+        self._register_client("OpenRouter.ai", OpenRouterClient, api_keys["openrouter_api_key"])
+        self._register_client("Hugging Face Playground", HuggingFacePlaygroundClient,
+                              api_keys["huggingface_api_key"])
+        self._register_client("Google AI Studio", GoogleAIStudioClient, api_keys["google_ai_studio_key"])
     
-    def _update_local_endpoints(self, endpoints):
-        """Update local server endpoints"""
-        if self.providers["LM Studio"]["client"]:
-            self.providers["LM Studio"]["client"].base_url = endpoints["lm_studio_host"]
-        
-        if self.providers["llama.cpp"]["client"]:
-            self.providers["llama.cpp"]["client"].base_url = endpoints["llama_cpp_host"]
-        
-        if self.providers["vLLM"]["client"]:
-            self.providers["vLLM"]["client"].base_url = endpoints["vllm_host"]
-        
-        # Reinitialize Ollama with new host if needed
-        if endpoints["ollama_host"] != "http://127.0.0.1:11434" and OLLAMA_AVAILABLE:
+    def start_discovery(self, deadline=None):
+        """
+        Probe all local servers concurrently under one overall deadline.
+        Returns immediately; providers are filled in as their probes answer.
+        :param deadline: float, seconds allowed for the whole discovery round
+        """
+        deadline = deadline or self.discovery_deadline
+        probes = {name: self.providers[name]["client"] for name in LOCAL_SERVER_PROVIDERS
+                  if self.providers.get(name, {}).get("client") is not None}
+        if not probes:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="provider-discovery")
+        with self._discovery_lock:
+            for provider_name, client in probes.items():
+                self.discovery_status[provider_name] = "pending"
+                future = executor.submit(self._probe_provider, provider_name, client, deadline)
+                self._discovery_futures[provider_name] = future
+        executor.shutdown(wait=False)
+
+    def _probe_provider(self, provider_name, client, timeout):
+        """Probe a single local server and publish its models (runs on a worker thread)"""
+        try:
+            models = client.refresh_models(timeout=timeout) or []
+        except Exception as e:
+            logger.debug(f"{provider_name} probe failed: {e}")
+            models = []
+
+        with self._discovery_lock:
+            # Ignore results from a client that was replaced while probing
+            if self.providers[provider_name]["client"] is not client:
+                return models
+            self.providers[provider_name]["models"] = models
+            self.discovery_status[provider_name] = "available" if models else "unavailable"
+            listeners = list(self._discovery_listeners)
+
+        if models:
+            logger.info(f"Discovered {provider_name} with {len(models)} models")
+        for listener in listeners:
             try:
-                self.providers["Ollama"]["client"] = OllamaClient(host=endpoints["ollama_host"])
+                listener(provider_name, models)
             except Exception as e:
-                logger.warning(f"Failed to reinitialize Ollama with new host: {e}")
+                logger.warning(f"Discovery listener failed for {provider_name}: {e}")
+        return models
+
+    def _on_catalog_updated(self, provider_name, endpoint, models):
+        """Apply a changed model catalog to the matching provider (runs on a worker thread)"""
+        with self._discovery_lock:
+            provider = self.providers.get(provider_name)
+            client = provider["client"] if provider else None
+            if client is None or client._catalog_endpoint() != endpoint:
+                return
+            provider["models"] = models
+            # Discovery probes publish their own results
+            if self.discovery_status.get(provider_name) == "pending":
+                return
+            listeners = list(self._discovery_listeners) if provider_name in LOCAL_SERVER_PROVIDERS else []
+
+        for listener in listeners:
+            try:
+                listener(provider_name, models)
+            except Exception as e:
+                logger.warning(f"Discovery listener failed for {provider_name}: {e}")
+
+    def add_discovery_listener(self, callback):
+        """
+        Register a callback invoked as callback(provider_name, models) when a probe answers.
+        Callbacks run on a discovery worker thread; UI code should marshal back to the
+        main thread (e.g. via a queued Qt signal) before touching widgets.
+        """
+        with self._discovery_lock:
+            self._discovery_listeners.append(callback)
+            answered = [(name, self.providers[name]["models"]) for name, status in self.discovery_status.items()
+                        if status == "available"]
+        # Replay providers that answered before the listener was registered
+        for provider_name, models in answered:
+            callback(provider_name, models)
+
+    def remove_discovery_listener(self, callback):
+        """Unregister a discovery callback"""
+        with self._discovery_lock:
+            if callback in self._discovery_listeners:
+                self._discovery_listeners.remove(callback)
+
+    def cleanup(self):
+        """Stop following the shared model catalog, drop discovery listeners and release the recovery hooks"""
+        APIClient.model_cache.remove_listener(self._on_catalog_updated)
+        recovery_manager.unregister_api_handlers(self._recovery_retry, self._recovery_failover)
+        # Queued Ollama preloads are pointless once the app shuts down
+        ollama_residency.close()
+        with self._discovery_lock:
+            self._discovery_listeners.clear()
+
+    def wait_for_discovery(self, timeout=None):
+        """
+        Block until all pending probes answered or the timeout elapsed.
+        :return: dict of provider_name -> discovery status
+        """
+        with self._discovery_lock:
+            futures = list(self._discovery_futures.values())
+        wait(futures, timeout=timeout if timeout is not None else self.discovery_deadline)
+        return self.get_discovery_status()
+
+    def get_discovery_status(self):
+        """Get the discovery status of each local server"""
+        with self._discovery_lock:
+            return dict(self.discovery_status)
 
     def get_providers_by_category(self):
         """Get providers organized by category"""
@@ -303,11 +466,10 @@ class MultiProviderClient:
                 logger.error(f"Failed to refresh models for {provider_name}: {e}")
         return []
 
-    def generate_response(self, prompt, provider_name=None, model_name=None, system_message=None, stream=False, model_params=None):
-        """Generate response using specified provider and model"""
+    def _resolve_target(self, provider_name=None, model_name=None):
+        """Resolve the provider name, client and model to use for a request"""
         provider_name = provider_name or self.current_provider
         model_name = model_name or self.current_model
-        model_params = model_params or {}
         
         if provider_name not in self.providers:
             raise Exception(f"Provider {provider_name} not found")
@@ -323,13 +485,437 @@ class MultiProviderClient:
                 model_name = available_models[0]
             else:
                 raise Exception(f"No model specified and no models available for {provider_name}")
-        
-        # Handle Ollama separately as it has a different interface
-        if provider_name == "Ollama":
-            # Use the OllamaClient's generate_response method directly
-            return client.generate_response(prompt, model_name, stream, system_message, model_params)
+        return provider_name, client, model_name
+
+    @staticmethod
+    def _parse_fallback_chain(value):
+        """Parse a stored fallback chain into (provider, model) tuples"""
+        try:
+            entries = json.loads(value) if isinstance(value, str) else (value or [])
+        except ValueError:
+            logger.warning("Ignoring malformed fallback_chain setting")
+            return []
+        chain = []
+        for entry in entries:
+            # Model names may contain ':' (e.g. Ollama tags), provider names never do
+            provider_name, _, model_name = str(entry).partition(":")
+            chain.append((provider_name, model_name or None))
+        return chain
+
+    def set_fallback_chain(self, chain):
+        """
+        Set and persist the providers to fail over to, in order.
+        :param chain: list of (provider_name, model_name) tuples; model_name may be None
+                      to use the provider's first model
+        """
+        self.fallback_chain = [(provider_name, model_name) for provider_name, model_name in chain]
+        settings = QSettings("TheOracle", "TheOracle")
+        settings.setValue("fallback_chain", json.dumps(
+            [f"{provider_name}:{model_name or ''}" for provider_name, model_name in self.fallback_chain]))
+
+    def _failover_candidates(self, provider_name=None, model_name=None, failover=True):
+        """The requested target followed by the usable entries of the fallback chain"""
+        provider_name = provider_name or self.current_provider
+        candidates = [(provider_name, model_name)]
+        if not failover:
+            return candidates
+        for fallback_provider, fallback_model in self.fallback_chain:
+            if fallback_provider == provider_name and fallback_model in (None, model_name):
+                continue
+            provider = self.providers.get(fallback_provider)
+            if not provider or not provider["client"]:
+                continue
+            if not fallback_model:
+                if not provider.get("models"):
+                    continue
+                fallback_model = provider["models"][0]
+            candidates.append((fallback_provider, fallback_model))
+        return candidates
+
+    def _open_circuit_error(self, provider_name):
+        return Exception(f"Provider {provider_name} is unavailable after repeated failures; "
+                         f"retrying in {self.health.retry_in(provider_name):.0f}s")
+
+    def generate_response(self, prompt, provider_name=None, model_name=None, system_message=None, stream=False, model_params=None,
+                          failover=True, priority=PRIORITY_INTERACTIVE, history=None):
+        """
+        Generate response using specified provider and model.
+        history is the list of prior {"role", "content"} turns, e.g. from
+        core.conversation_context.ConversationContext.history().
+        If the provider fails before producing its first chunk, or its circuit is open,
+        the request moves on to the fallback chain; failures after the first chunk raise.
+        Deterministic requests are answered from the response cache when it is enabled.
+        Requests wait for the provider's rate limit, lower priority values first
+        (PRIORITY_INTERACTIVE before PRIORITY_BACKGROUND).
+        """
+        model_params = model_params or {}
+        candidates = self._failover_candidates(provider_name, model_name, failover)
+        return self._generate_with_failover(prompt, candidates, system_message, stream, model_params, priority, history)
+
+    @staticmethod
+    def _prompt_tokens(model_name, prompt, system_message, history=None):
+        return token_counter.count_messages(APIClient._build_messages(prompt, system_message, history), model_name)
+
+    def _request_tokens(self, model_name, prompt, system_message, history, model_params):
+        """Tokens a request may use: its messages plus the requested completion length"""
+        max_tokens = int(model_params.get("max_tokens") or 0)
+        return self._prompt_tokens(model_name, prompt, system_message, history) + max(0, max_tokens)
+
+    @staticmethod
+    def _history_kwargs(history):
+        # Only pass history when there is some, for clients that predate the parameter
+        return {"history": history} if history else {}
+
+    def _open_stream(self, client, provider_name, model_name, prompt, system_message, stream, model_params, priority,
+                     history=None):
+        """
+        Start a request within the provider's rate limit, retrying after 429 responses.
+        :return: tuple, (rate permit, RequestUsage, response iterator, first chunk or None)
+        """
+        tokens = self._request_tokens(model_name, prompt, system_message, history, model_params)
+        api_key = getattr(client, "api_key", None)
+        for attempt in range(self.rate_limit_retries + 1):
+            permit = self.rate_limiter.acquire(provider_name, api_key, tokens, priority)
+            # Clients are shared across threads, so usage is captured per request rather than read off the client
+            usage = RequestUsage()
+            try:
+                response = usage.wrap(client.generate_response(prompt, model_name, stream, system_message,
+                                                               model_params, **self._history_kwargs(history)))
+                return permit, usage, response, next(response, None)
+            except Exception as e:
+                retry_after = rate_limit_retry_after(e)
+                if retry_after is None or attempt == self.rate_limit_retries:
+                    raise
+                self.rate_limiter.penalize(permit, retry_after)
+
+    async def _aopen_stream(self, client, provider_name, model_name, prompt, system_message, model_params, priority,
+                            history=None):
+        """Async version of _open_stream; returns (rate permit, RequestUsage, async stream, first chunk or None)"""
+        tokens = self._request_tokens(model_name, prompt, system_message, history, model_params)
+        api_key = getattr(client, "api_key", None)
+        for attempt in range(self.rate_limit_retries + 1):
+            permit = await self.rate_limiter.aacquire(provider_name, api_key, tokens, priority)
+            if hasattr(client, "agenerate_response"):
+                stream = client.agenerate_response(prompt, model_name, system_message, model_params,
+                                                   **self._history_kwargs(history))
+            else:
+                stream = aiter_sync(lambda: client.generate_response(
+                    prompt, model_name, True, system_message, model_params, **self._history_kwargs(history)))
+            usage = RequestUsage()
+            stream = usage.awrap(stream)
+            try:
+                try:
+                    first_chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    first_chunk = None
+                return permit, usage, stream, first_chunk
+            except BaseException as e:
+                await stream.aclose()
+                retry_after = rate_limit_retry_after(e) if isinstance(e, Exception) else None
+                if retry_after is None or attempt == self.rate_limit_retries:
+                    raise
+                self.rate_limiter.penalize(permit, retry_after)
+
+    def _settle_rate_limit(self, permit, model_name, prompt, system_message, history, chunks, usage=None):
+        if usage:
+            self.rate_limiter.settle(permit, usage["input_tokens"] + usage["output_tokens"])
         else:
-            return client.generate_response(prompt, model_name, stream, system_message, model_params)
+            self.rate_limiter.settle(permit, self._prompt_tokens(model_name, prompt, system_message, history) +
+                                     token_counter.count("".join(chunks), model_name))
+
+    def _record_usage(self, provider_name, model_name, request_usage, text=None):
+        """
+        Keep the usage the client reported for a finished request and add it to the provider totals.
+        The reported output tokens of text also calibrate the token estimate for models without a tokenizer.
+        """
+        usage = request_usage.usage
+        if not usage:
+            return None
+        if text:
+            token_counter.calibrate(text, usage.get("output_tokens"), model_name)
+        self.last_usage = dict(usage, provider=provider_name, model=model_name)
+        totals = self.usage_totals.setdefault(provider_name, dict.fromkeys(usage, 0))
+        totals["requests"] = totals.get("requests", 0) + 1
+        for name, tokens in usage.items():
+            totals[name] = totals.get(name, 0) + tokens
+        if usage.get("cache_read_tokens") or usage.get("cache_write_tokens"):
+            logger.debug(f"{provider_name} prompt cache: {usage['cache_read_tokens']} tokens read, "
+                         f"{usage['cache_write_tokens']} written")
+        return usage
+
+    def _generate_with_failover(self, prompt, candidates, system_message, stream, model_params,
+                                priority=PRIORITY_INTERACTIVE, history=None):
+        errors = []
+        for provider_name, model_name in candidates:
+            try:
+                provider_name, client, model_name = self._resolve_target(provider_name, model_name)
+            except Exception as e:
+                errors.append(e)
+                continue
+
+            cache_key = self.response_cache.key_for(provider_name, model_name, system_message, model_params, prompt,
+                                                    history)
+            cached = self.response_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                yield from self.response_cache.replay(cached, stream)
+                return
+
+            if not self.health.allow_request(provider_name):
+                errors.append(self._open_circuit_error(provider_name))
+                continue
+
+            started = time.perf_counter()
+            try:
+                permit, request_usage, response, first_chunk = self._open_stream(
+                    client, provider_name, model_name, prompt, system_message, stream, model_params, priority, history)
+            except RateLimitTimeout as e:
+                # Our own queue gave up; says nothing about the provider's health
+                self.health.release(provider_name)
+                errors.append(e)
+                continue
+            except Exception as e:
+                self.health.record_failure(provider_name, e)
+                errors.append(e)
+                logger.warning(f"{provider_name} failed before responding: {e}")
+                continue
+            self.health.record_success(provider_name, time.perf_counter() - started - permit.wait_time)
+            if len(errors) > 0:
+                logger.info(f"Failed over to {provider_name} ({model_name})")
+
+            chunks = []
+            if first_chunk is not None:
+                chunks.append(first_chunk)
+                yield first_chunk
+            try:
+                for chunk in response:
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                # Too late to fail over once part of the answer was delivered
+                self.health.record_failure(provider_name, e)
+                raise
+            usage = self._record_usage(provider_name, model_name, request_usage, "".join(chunks))
+            self._settle_rate_limit(permit, model_name, prompt, system_message, history, chunks, usage)
+            if cache_key:
+                self.response_cache.put(cache_key, "".join(chunks), provider=provider_name, model=model_name)
+            return
+        raise self._failover_error(errors)
+
+    @staticmethod
+    def _failover_error(errors):
+        if len(errors) == 1:
+            return errors[0]
+        return Exception("All providers failed: " + "; ".join(str(error) for error in errors))
+
+    async def agenerate_response(self, prompt, provider_name=None, model_name=None, system_message=None, model_params=None,
+                                 failover=True, priority=PRIORITY_INTERACTIVE, history=None, on_usage=None):
+        """
+        Stream a response as an async iterator of text chunks, with the same
+        failover rules as generate_response.
+        Run it on the shared stream loop (api.async_streams.stream_loop) so
+        concurrent streams share one event loop instead of one thread each.
+        :param on_usage: callable, called with this request's usage dict when the provider reported one
+        """
+        model_params = model_params or {}
+        errors = []
+        for provider_name, model_name in self._failover_candidates(provider_name, model_name, failover):
+            try:
+                provider_name, client, model_name = self._resolve_target(provider_name, model_name)
+            except Exception as e:
+                errors.append(e)
+                continue
+
+            cache_key = self.response_cache.key_for(provider_name, model_name, system_message, model_params, prompt,
+                                                    history)
+            cached = self.response_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                for chunk in self.response_cache.replay(cached):
+                    yield chunk
+                return
+
+            if not self.health.allow_request(provider_name):
+                errors.append(self._open_circuit_error(provider_name))
+                continue
+
+            started = time.perf_counter()
+            try:
+                permit, request_usage, stream, first_chunk = await self._aopen_stream(
+                    client, provider_name, model_name, prompt, system_message, model_params, priority, history)
+            except (asyncio.CancelledError, RateLimitTimeout) as e:
+                self.health.release(provider_name)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                errors.append(e)
+                continue
+            except Exception as e:
+                self.health.record_failure(provider_name, e)
+                errors.append(e)
+                logger.warning(f"{provider_name} failed before responding: {e}")
+                continue
+            self.health.record_success(provider_name, time.perf_counter() - started - permit.wait_time)
+
+            chunks = []
+            try:
+                if first_chunk is not None:
+                    chunks.append(first_chunk)
+                    yield first_chunk
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                        yield chunk
+            except Exception as e:
+                self.health.record_failure(provider_name, e)
+                raise
+            finally:
+                await stream.aclose()
+            usage = self._record_usage(provider_name, model_name, request_usage, "".join(chunks))
+            self._settle_rate_limit(permit, model_name, prompt, system_message, history, chunks, usage)
+            if usage and on_usage is not None:
+                on_usage(dict(usage, provider=provider_name, model=model_name))
+            if cache_key:
+                self.response_cache.put(cache_key, "".join(chunks), provider=provider_name, model=model_name)
+            return
+        raise self._failover_error(errors)
+
+    def compare_models(self, prompt, targets, system_message=None, model_params=None):
+        """
+        Stream one prompt to several provider/model pairs concurrently.
+        :param targets: list of (provider_name, model_name) tuples
+        :return: ComparisonRun; iterate run.events() for chunks tagged by target,
+                 cancel a single target with run.cancel(provider, model)
+        """
+        for provider_name, _ in targets:
+            if provider_name not in self.providers:
+                raise ValueError(f"Provider '{provider_name}' not found.")
+        return ComparisonRun(self, prompt, targets, system_message, model_params,
+                             tracker=self.ttft_tracker).start()
+
+    def arace_response(self, prompt, targets, system_message=None, model_params=None, hedge_delay=None):
+        """
+        Race one request across several backends and stream whichever answers first.
+        :param targets: list of (provider_name, model_name) tuples; the first is the primary
+        :param hedge_delay: seconds before the backups are sent; defaults to self.hedge_delay,
+                            i.e. the primary's observed p90 time to first token
+        :return: async iterator of text chunks
+        """
+        for provider_name, _ in targets:
+            if provider_name not in self.providers:
+                raise ValueError(f"Provider '{provider_name}' not found.")
+        request = HedgedRequest(
+            self, prompt, targets, system_message, model_params,
+            hedge_delay=hedge_delay if hedge_delay is not None else self.hedge_delay,
+            tracker=self.ttft_tracker,
+            hedge_percentile=self.hedge_percentile
+        )
+        return request.stream()
+
+    def race_response(self, prompt, targets, system_message=None, model_params=None, hedge_delay=None):
+        """Blocking generator form of arace_response, for use from worker threads"""
+        return iter_async(self.arace_response(prompt, targets, system_message, model_params, hedge_delay))
+
+    def get_provider_health(self):
+        """Get the health scoreboard: circuit state, error rate and latency per provider"""
+        return self.health.get_stats()
+
+    def _recovery_retry(self, error, context):
+        """RecoveryManager hook: retrying is worthwhile while the provider's circuit accepts requests"""
+        provider_name = context.user_data.get("provider") or self.current_provider
+        return provider_name in self.providers and self.health.is_available(provider_name)
+
+    def _recovery_failover(self, error, context):
+        """RecoveryManager hook: switch the current provider to the first healthy fallback"""
+        provider_name = context.user_data.get("provider") or self.current_provider
+        candidates = self._failover_candidates(provider_name, context.user_data.get("model"))
+        for fallback_provider, fallback_model in candidates[1:]:
+            if self.health.is_available(fallback_provider):
+                self.current_provider = fallback_provider
+                self.current_model = fallback_model
+                context.user_data["alternative_provider"] = fallback_provider
+                context.user_data["alternative_model"] = fallback_model
+                logger.info(f"Switched from {provider_name} to {fallback_provider} after error: {error}")
+                return True
+        return False
+
+    def get_usage_stats(self):
+        """Token usage of the last request and totals per provider, with prompt cache reads/writes"""
+        return {"last": self.last_usage, "providers": {name: dict(totals) for name, totals in self.usage_totals.items()}}
+
+    def get_rate_limit_stats(self):
+        """Queue depth, wait time percentiles and 429 counts per provider"""
+        return self.rate_limiter.get_stats()
+
+    def get_response_cache_stats(self):
+        """Get hit rate and size of the deterministic response cache"""
+        return self.response_cache.get_stats()
+
+    def _embedding_provider_available(self, provider_name):
+        client = self.providers.get(provider_name, {}).get("client")
+        if client is None or not getattr(client, "supports_embeddings", False):
+            return False
+        # Local servers only count once discovery found them running
+        return provider_name not in LOCAL_SERVER_PROVIDERS or self.discovery_status.get(provider_name) == "available"
+
+    def get_embedder(self, provider_name=None, model_name=None):
+        """
+        Get the shared EmbeddingService of a provider/model.
+        Without a provider, the configured one or the first available of EMBEDDING_PROVIDERS is used.
+        """
+        provider_name = provider_name or self.embedding_provider or next(
+            (name for name in EMBEDDING_PROVIDERS if self._embedding_provider_available(name)), None)
+        if provider_name is None:
+            raise Exception("No embeddings provider available")
+        if model_name is None and provider_name == self.embedding_provider:
+            model_name = self.embedding_model
+
+        client = self.providers.get(provider_name, {}).get("client")
+        if client is None:
+            raise Exception(f"Provider {provider_name} not available")
+        key = (provider_name, model_name)
+        with self._embedders_lock:
+            embedder = self._embedders.get(key)
+            # A new client (changed key or endpoint) gets a fresh service
+            if embedder is None or embedder.client is not client:
+                embedder = self._embedders[key] = EmbeddingService(client, model_name)
+        return embedder
+
+    def embed(self, texts, provider_name=None, model_name=None):
+        """Embed texts with micro-batching and caching; returns one vector per text"""
+        return self.get_embedder(provider_name, model_name).embed(texts)
+
+    def get_embedding_stats(self):
+        """Get cache hit rates and batch latencies of the embedding services"""
+        with self._embedders_lock:
+            embedders = dict(self._embedders)
+        return {f"{provider}:{model or 'default'}": embedder.get_stats()
+                for (provider, model), embedder in embedders.items()}
+
+    def get_provider_registry_stats(self):
+        """Get which shared provider clients exist and whether their SDK clients were built"""
+        return provider_registry.get_stats()
+
+    def get_ollama_residency_stats(self):
+        """Get Ollama preload/eviction counts and the models it holds in memory"""
+        return ollama_residency.get_stats()
+
+    def get_local_model_cache_stats(self):
+        """Get resident local model hits, load times and memory use"""
+        return self.local_model_manager.get_model_cache_stats() if self.local_model_manager else {}
+
+    def get_local_kv_state_stats(self):
+        """Get local model context snapshot saves, restores and disk use"""
+        return self.local_model_manager.get_kv_state_stats() if self.local_model_manager else {}
+
+    def get_local_inference_stats(self):
+        """Get time to first token and tokens per second of recent local model generations"""
+        return self.local_model_manager.get_inference_stats() if self.local_model_manager else {}
+
+    def get_llama_cpp_slot_stats(self):
+        """Get llama.cpp slot affinity hits and prompt tokens reused from its cache"""
+        client = self.providers["llama.cpp"]["client"]
+        return client.get_slot_stats() if client else {}
+
+    def get_ttft_stats(self):
+        """Get observed time-to-first-token percentiles per provider:model"""
+        return self.ttft_tracker.get_stats()
     
     def _generate_ollama_response(self, client, prompt, model_name, system_message, stream, model_params=None):
         """Generate response using Ollama client"""
@@ -433,6 +1019,10 @@ class MultiProviderClient:
         self.current_provider = provider_name
         logger.info(f"Switched to provider: {provider_name}")
 
+    def get_http_pool_metrics(self):
+        """Get connection reuse statistics for the shared HTTP pool"""
+        return APIClient.get_http_pool_metrics()
+
     def get_models_for_provider(self, provider_name: str):
         """
         Return the list of models for the specified provider.
@@ -0,0 +1,358 @@
+"""
+Ollama model residency: keep-alive policy, preloading and RAM-budget eviction.
+
+Ollama unloads a model five minutes after its last request, and loading one
+takes seconds to minutes, so the first message after switching models is
+slow. The residency manager preloads a model as soon as it is selected,
+sends a longer keep_alive for pinned (favorite) models, and, when a RAM
+budget is set, unloads the least recently used models before loading
+another one. Which models are actually resident is read from /api/ps.
+
+Each Ollama host has its own manager, since residency and memory are per
+server; the policy (keep_alive, pinned models, RAM budget) is shared.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from .http_pool import HTTPSessionPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "http://127.0.0.1:11434"
+# Ollama's own default
+DEFAULT_KEEP_ALIVE = "5m"
+DEFAULT_PINNED_KEEP_ALIVE = "1h"
+
+KeepAlive = Union[str, int]
+
+
+def parse_keep_alive(value: Any, default: KeepAlive = DEFAULT_KEEP_ALIVE) -> KeepAlive:
+    """
+    Normalize a keep_alive setting: numbers (seconds, -1 = forever, 0 = unload
+    now) become ints, durations such as "10m" or "2h" are passed through.
+    """
+    if value is None or value == "":
+        return default
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        return int(float(text))
+    except ValueError:
+        return text
+
+
+@dataclass
+class ResidentModel:
+    """A model Ollama currently holds in memory, as reported by /api/ps."""
+    name: str
+    size: int = 0
+    size_vram: int = 0
+    expires_at: Optional[str] = None
+    pinned: bool = False
+    last_used: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "size": self.size,
+            "size_vram": self.size_vram,
+            "expires_at": self.expires_at,
+            "pinned": self.pinned,
+            "last_used": self.last_used,
+        }
+
+
+class OllamaResidencyManager:
+    """Decides how long Ollama keeps models loaded and which ones to unload."""
+
+    def __init__(self, host: str = DEFAULT_HOST, http: Optional[HTTPSessionPool] = None,
+                 keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE, pinned_keep_alive: KeepAlive = DEFAULT_PINNED_KEEP_ALIVE,
+                 ram_budget: int = 0, timeout: float = 5.0, load_timeout: float = 300.0):
+        """
+        :param keep_alive: keep_alive sent with requests for unpinned models
+        :param pinned_keep_alive: keep_alive for pinned models (-1 keeps them until evicted)
+        :param ram_budget: int, bytes resident models may use in total; 0 disables eviction
+        :param timeout: float, seconds for /api/ps and unload requests
+        :param load_timeout: float, seconds a preload may take
+        """
+        self.host = host
+        self.http = http or HTTPSessionPool(pool_connections=1, pool_maxsize=2)
+        self.keep_alive = keep_alive
+        self.pinned_keep_alive = pinned_keep_alive
+        self.ram_budget = ram_budget
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self.pinned: set = set()
+        self._last_used: Dict[str, float] = {}
+        # Models believed resident; refreshed from /api/ps whenever it is queried
+        self._resident: Dict[str, ResidentModel] = {}
+        self._model_sizes: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        # One preload at a time: loading two models at once only makes both slower. Created on first use
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"preloads": 0, "preload_failures": 0, "evictions": 0, "load_time": 0.0}
+
+    def configure(self, http: Optional[HTTPSessionPool] = None,
+                  keep_alive: Optional[KeepAlive] = None, pinned_keep_alive: Optional[KeepAlive] = None,
+                  ram_budget: Optional[int] = None):
+        """Update the HTTP pool and policy; None leaves a value unchanged."""
+        with self._lock:
+            if http is not None:
+                self.http = http
+            if keep_alive is not None:
+                self.keep_alive = parse_keep_alive(keep_alive)
+            if pinned_keep_alive is not None:
+                self.pinned_keep_alive = parse_keep_alive(pinned_keep_alive, DEFAULT_PINNED_KEEP_ALIVE)
+            if ram_budget is not None:
+                self.ram_budget = max(0, int(ram_budget))
+
+    def set_pinned(self, models: Iterable[str]):
+        """Replace the pinned models (e.g. with the Ollama favorites)."""
+        with self._lock:
+            self.pinned = set(models)
+
+    def pin(self, model: str):
+        with self._lock:
+            self.pinned.add(model)
+
+    def unpin(self, model: str):
+        with self._lock:
+            self.pinned.discard(model)
+
+    def keep_alive_for(self, model: str) -> KeepAlive:
+        """keep_alive to send with a request for a model."""
+        return self.pinned_keep_alive if model in self.pinned else self.keep_alive
+
+    def touch(self, model: str):
+        """
+        Record a request for a model. The first request for a model that is
+        not known to be resident makes room for it within the RAM budget.
+        """
+        with self._lock:
+            self._last_used[model] = time.time()
+            resident = model in self._resident
+        if not resident:
+            self.make_room(model)
+            with self._lock:
+                # The request about to be sent loads it
+                self._resident.setdefault(model, ResidentModel(model, self._model_sizes.get(model, 0)))
+
+    def hot_models(self) -> List[ResidentModel]:
+        """Query /api/ps for the models Ollama has loaded, most recently used first."""
+        response = self.http.get(f"{self.host}/api/ps", timeout=self.timeout)
+        response.raise_for_status()
+        resident = {}
+        for entry in response.json().get("models", []):
+            name = entry.get("name") or entry.get("model", "")
+            resident[name] = ResidentModel(
+                name=name,
+                size=int(entry.get("size") or 0),
+                size_vram=int(entry.get("size_vram") or 0),
+                expires_at=entry.get("expires_at")
+            )
+        with self._lock:
+            for name, model in resident.items():
+                model.pinned = name in self.pinned
+                model.last_used = self._last_used.get(name)
+                self._model_sizes[name] = model.size
+            self._resident = resident
+        return sorted(resident.values(), key=lambda model: model.last_used or 0.0, reverse=True)
+
+    def _model_size(self, model: str) -> int:
+        """Memory a model needs: its last resident size, else its size on disk from /api/tags."""
+        with self._lock:
+            size = self._model_sizes.get(model)
+        if size:
+            return size
+        try:
+            response = self.http.get(f"{self.host}/api/tags", timeout=self.timeout)
+            response.raise_for_status()
+            with self._lock:
+                for entry in response.json().get("models", []):
+                    name = entry.get("name") or entry.get("model", "")
+                    self._model_sizes.setdefault(name, int(entry.get("size") or 0))
+                return self._model_sizes.get(model, 0)
+        except Exception as e:
+            logger.debug(f"Could not get the size of Ollama model {model}: {e}")
+            return 0
+
+    def unload(self, model: str) -> bool:
+        """Ask Ollama to unload a model now."""
+        try:
+            response = self.http.post(f"{self.host}/api/generate",
+                                      json={"model": model, "keep_alive": 0}, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Failed to unload Ollama model {model}: {e}")
+            return False
+        with self._lock:
+            self._resident.pop(model, None)
+            self._stats["evictions"] += 1
+        logger.info(f"Unloaded Ollama model {model} to stay within the RAM budget")
+        return True
+
+    def make_room(self, model: str) -> List[str]:
+        """
+        Unload least recently used models until model fits the RAM budget.
+        Unpinned models go first; pinned ones only if that is not enough.
+        :return: the unloaded model names
+        """
+        if not self.ram_budget:
+            return []
+        try:
+            resident = self.hot_models()
+        except Exception as e:
+            logger.debug(f"Could not query resident Ollama models: {e}")
+            return []
+        if any(entry.name == model for entry in resident):
+            return []
+
+        needed = self._model_size(model)
+        used = sum(entry.size for entry in resident)
+        # Least recently used first, unpinned before pinned
+        candidates = sorted(resident, key=lambda entry: (entry.pinned, entry.last_used or 0.0))
+        evicted = []
+        for entry in candidates:
+            if used + needed <= self.ram_budget:
+                break
+            if self.unload(entry.name):
+                used -= entry.size
+                evicted.append(entry.name)
+        if used + needed > self.ram_budget:
+            logger.warning(f"Ollama model {model} ({needed / 2**30:.1f} GiB) exceeds the RAM budget "
+                           f"of {self.ram_budget / 2**30:.1f} GiB")
+        return evicted
+
+    def _load(self, model: str) -> float:
+        self.make_room(model)
+        started = time.perf_counter()
+        # A generate request without a prompt only loads the model
+        response = self.http.post(f"{self.host}/api/generate",
+                                  json={"model": model, "keep_alive": self.keep_alive_for(model)},
+                                  timeout=self.load_timeout)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._resident.setdefault(model, ResidentModel(model, self._model_sizes.get(model, 0)))
+            self._stats["preloads"] += 1
+            self._stats["load_time"] += elapsed
+        logger.info(f"Preloaded Ollama model {model} in {elapsed:.1f}s")
+        return elapsed
+
+    def preload(self, model: str) -> Future:
+        """
+        Load a model in the background so the next request does not wait for it.
+        :return: Future resolving to the load time in seconds
+        """
+        with self._lock:
+            self._last_used[model] = time.time()
+
+        def run():
+            try:
+                return self._load(model)
+            except Exception as e:
+                with self._lock:
+                    self._stats["preload_failures"] += 1
+                logger.warning(f"Failed to preload Ollama model {model}: {e}")
+                raise
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ollama-preload")
+            return self._executor.submit(run)
+
+    def close(self):
+        """Cancel queued preloads and stop the preload thread (a later preload starts a new one)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get preload and eviction counts plus the resident models (queried live)."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["average_load_time"] = stats["load_time"] / stats["preloads"] if stats["preloads"] else None
+        stats["ram_budget"] = self.ram_budget
+        try:
+            hot = self.hot_models()
+            stats["resident"] = [model.to_dict() for model in hot]
+            stats["resident_bytes"] = sum(model.size for model in hot)
+        except Exception as e:
+            stats["resident"] = None
+            stats["error"] = str(e)
+        return stats
+
+
+class OllamaResidency:
+    """The residency managers of all Ollama hosts, sharing one policy."""
+
+    def __init__(self, host: str = DEFAULT_HOST):
+        # Host of the configured Ollama provider; used when no host is given
+        self.host = host
+        self._policy: Dict[str, Any] = {}
+        self._pinned: set = set()
+        self._managers: Dict[str, OllamaResidencyManager] = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, host: Optional[str] = None, http: Optional[HTTPSessionPool] = None) -> OllamaResidencyManager:
+        """Get the manager of a host (the configured one if None), creating it on first use."""
+        host = (host or self.host).rstrip("/")
+        with self._lock:
+            manager = self._managers.get(host)
+            if manager is None:
+                manager = self._managers[host] = OllamaResidencyManager(host, http=http)
+                manager.configure(**self._policy)
+                manager.set_pinned(self._pinned)
+            elif http is not None:
+                manager.configure(http=http)
+        return manager
+
+    def configure(self, host: Optional[str] = None, keep_alive: Optional[KeepAlive] = None,
+                  pinned_keep_alive: Optional[KeepAlive] = None, ram_budget: Optional[int] = None):
+        """Set the configured host and the policy of every host; None leaves a value unchanged."""
+        policy = {name: value for name, value in (("keep_alive", keep_alive),
+                                                  ("pinned_keep_alive", pinned_keep_alive),
+                                                  ("ram_budget", ram_budget)) if value is not None}
+        with self._lock:
+            if host:
+                self.host = host.rstrip("/")
+            self._policy.update(policy)
+            managers = list(self._managers.values())
+        for manager in managers:
+            manager.configure(**policy)
+
+    def set_pinned(self, models: Iterable[str]):
+        """Replace the pinned models of every host."""
+        with self._lock:
+            self._pinned = set(models)
+            managers = list(self._managers.values())
+        for manager in managers:
+            manager.set_pinned(self._pinned)
+
+    def preload(self, model: str, host: Optional[str] = None) -> Future:
+        """Preload a model on a host (the configured one if None)."""
+        return self.for_host(host).preload(model)
+
+    def get_stats(self, host: Optional[str] = None) -> Dict[str, Any]:
+        """Get the residency stats of a host (the configured one if None)."""
+        stats = self.for_host(host).get_stats()
+        stats["host"] = (host or self.host).rstrip("/")
+        return stats
+
+    def close(self):
+        """Stop the preload threads of all hosts."""
+        with self._lock:
+            managers = list(self._managers.values())
+        for manager in managers:
+            manager.close()
+
+
+# Shared by OllamaClient (one manager per host) and the quick switch menu (the configured host)
+ollama_residency = OllamaResidency()
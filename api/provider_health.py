@@ -0,0 +1,233 @@
+"""
+Provider health scoreboard with circuit breakers.
+
+Each provider keeps a rolling window of request outcomes and time-to-first-
+token latencies. Repeated failures (or a high error rate) open the
+provider's circuit: requests are refused immediately instead of waiting for
+another timeout. After a cool-down the circuit goes half-open and lets a
+single probe request through; success closes it, failure re-opens it with a
+longer cool-down.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class ProviderHealth:
+    """Rolling outcome window and breaker state of one provider."""
+    outcomes: Deque[Tuple[float, bool]]
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    cooldown: float = 0.0
+    probes_in_flight: int = 0
+    total_requests: int = 0
+    total_failures: int = 0
+    last_error: Optional[str] = None
+    last_state_change: float = field(default_factory=time.time)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ProviderHealthTracker:
+    """Per-provider circuit breakers fed by request outcomes."""
+
+    def __init__(self, failure_threshold: int = 3, error_rate_threshold: float = 0.5,
+                 min_samples: int = 5, window: int = 50, open_duration: float = 30.0,
+                 max_open_duration: float = 300.0, half_open_probes: int = 1):
+        """
+        :param failure_threshold: consecutive failures that open the circuit
+        :param error_rate_threshold: error rate over the window that opens the circuit
+                                     (once at least min_samples outcomes were seen)
+        :param open_duration: initial cool-down in seconds, doubled after each failed probe
+        """
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.window = window
+        self.open_duration = open_duration
+        self.max_open_duration = max_open_duration
+        self.half_open_probes = half_open_probes
+        self.latency = LatencyTracker(window)
+
+        self._providers: Dict[str, ProviderHealth] = {}
+        self._listeners: List[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+
+    def _health(self, provider: str) -> ProviderHealth:
+        health = self._providers.get(provider)
+        if health is None:
+            health = self._providers[provider] = ProviderHealth(outcomes=deque(maxlen=self.window))
+        return health
+
+    def _set_state(self, health: ProviderHealth, state: str) -> Optional[str]:
+        if health.state == state:
+            return None
+        health.state = state
+        health.last_state_change = time.time()
+        if state == OPEN:
+            health.opened_at = time.monotonic()
+        return state
+
+    def _notify(self, provider: str, state: Optional[str]):
+        if state is None:
+            return
+        if state == OPEN:
+            logger.warning(f"Circuit opened for {provider}")
+        else:
+            logger.info(f"Circuit for {provider} is now {state}")
+        for listener in list(self._listeners):
+            try:
+                listener(provider, state)
+            except Exception as e:
+                logger.warning(f"Provider health listener failed: {e}")
+
+    def allow_request(self, provider: str) -> bool:
+        """
+        Check whether a request may be sent to a provider. While half-open this
+        admits a limited number of probe requests, so every allowed request must
+        end in record_success, record_failure or release.
+        """
+        changed = None
+        with self._lock:
+            health = self._health(provider)
+            if health.state == OPEN:
+                if time.monotonic() - health.opened_at < health.cooldown:
+                    return False
+                changed = self._set_state(health, HALF_OPEN)
+            if health.state == HALF_OPEN:
+                if health.probes_in_flight >= self.half_open_probes:
+                    allowed = False
+                else:
+                    health.probes_in_flight += 1
+                    allowed = True
+            else:
+                allowed = True
+        self._notify(provider, changed)
+        return allowed
+
+    def is_available(self, provider: str) -> bool:
+        """Whether a provider would currently accept requests (no side effects)."""
+        with self._lock:
+            health = self._providers.get(provider)
+            if health is None or health.state == CLOSED:
+                return True
+            if health.state == OPEN:
+                return time.monotonic() - health.opened_at >= health.cooldown
+            return health.probes_in_flight < self.half_open_probes
+
+    def record_success(self, provider: str, latency: Optional[float] = None):
+        """Record a successful request (latency = time to first token, in seconds)."""
+        if latency is not None:
+            self.latency.record(provider, latency)
+        with self._lock:
+            health = self._health(provider)
+            if health.state == HALF_OPEN:
+                # Recovered: judge the provider on fresh outcomes from here on
+                health.probes_in_flight = max(0, health.probes_in_flight - 1)
+                health.cooldown = 0.0
+                health.outcomes.clear()
+            health.outcomes.append((time.time(), True))
+            health.total_requests += 1
+            health.consecutive_failures = 0
+            changed = self._set_state(health, CLOSED)
+        self._notify(provider, changed)
+
+    def record_failure(self, provider: str, error: Optional[Any] = None):
+        """Record a failed request; may open the provider's circuit."""
+        changed = None
+        with self._lock:
+            health = self._health(provider)
+            health.outcomes.append((time.time(), False))
+            health.total_requests += 1
+            health.total_failures += 1
+            health.consecutive_failures += 1
+            if error is not None:
+                health.last_error = str(error)
+
+            if health.state == HALF_OPEN:
+                # Failed probe: back off further
+                health.probes_in_flight = max(0, health.probes_in_flight - 1)
+                health.cooldown = min(max(health.cooldown * 2, self.open_duration), self.max_open_duration)
+                changed = self._set_state(health, OPEN)
+            elif health.state == CLOSED:
+                too_many_failures = health.consecutive_failures >= self.failure_threshold
+                too_many_errors = (len(health.outcomes) >= self.min_samples and
+                                   health.error_rate >= self.error_rate_threshold)
+                if too_many_failures or too_many_errors:
+                    health.cooldown = self.open_duration
+                    changed = self._set_state(health, OPEN)
+        self._notify(provider, changed)
+
+    def release(self, provider: str):
+        """Give back a half-open probe slot for a request that ended without an outcome."""
+        with self._lock:
+            health = self._providers.get(provider)
+            if health is not None and health.state == HALF_OPEN:
+                health.probes_in_flight = max(0, health.probes_in_flight - 1)
+
+    def retry_in(self, provider: str) -> float:
+        """Seconds until an open circuit admits a probe (0 if it accepts requests now)."""
+        with self._lock:
+            health = self._providers.get(provider)
+            if health is None or health.state != OPEN:
+                return 0.0
+            return max(0.0, health.cooldown - (time.monotonic() - health.opened_at))
+
+    def get_state(self, provider: str) -> str:
+        with self._lock:
+            health = self._providers.get(provider)
+            return health.state if health else CLOSED
+
+    def reset(self, provider: Optional[str] = None):
+        """Forget the history of one provider, or of all of them."""
+        with self._lock:
+            if provider is None:
+                self._providers.clear()
+            else:
+                self._providers.pop(provider, None)
+
+    def add_listener(self, callback: Callable[[str, str], None]):
+        """Register callback(provider, state), called when a circuit changes state."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, str], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get the scoreboard: state, error rate and latency percentiles per provider."""
+        with self._lock:
+            providers = list(self._providers.items())
+        stats = {}
+        for provider, health in providers:
+            stats[provider] = {
+                "state": health.state,
+                "error_rate": health.error_rate,
+                "requests": health.total_requests,
+                "failures": health.total_failures,
+                "consecutive_failures": health.consecutive_failures,
+                "last_error": health.last_error,
+                "retry_in": self.retry_in(provider),
+                "latency_p50": self.latency.percentile(provider, 50),
+                "latency_p90": self.latency.percentile(provider, 90),
+                "latency_p99": self.latency.percentile(provider, 99),
+            }
+        return stats
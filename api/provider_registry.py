@@ -0,0 +1,90 @@
+"""
+Process-wide registry of provider API clients.
+
+Every component that talks to a provider (both MultiProviderClient classes,
+batch runs, dialogs) gets its client from here, so each provider is
+configured once per process. Clients are cheap to create: their SDK is
+imported and constructed only when a request first needs it (see
+APIClient.client), so configuring many API keys costs neither startup time
+nor memory until those providers are used.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderRegistry:
+    """Shared API clients, one per client class, rebuilt when their configuration changes."""
+
+    def __init__(self):
+        # client class -> (configuration fingerprint, client)
+        self._clients: Dict[type, Tuple[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _fingerprint(args: tuple, kwargs: Dict[str, Any]) -> str:
+        # Hashed, so API keys are not kept around as dictionary keys
+        config = repr((args, sorted(kwargs.items())))
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+    def get(self, client_class: Type, *args, **kwargs):
+        """
+        Get the shared client of a class for this configuration, creating it
+        if there is none yet or the configuration (e.g. API key) changed.
+        """
+        fingerprint = self._fingerprint(args, kwargs)
+        name = client_class.__name__
+        with self._lock:
+            entry = self._clients.get(client_class)
+            stats = self._stats.setdefault(name, {"created": 0, "reused": 0, "created_at": None})
+            if entry is not None and entry[0] == fingerprint:
+                stats["reused"] += 1
+                return entry[1]
+
+        # Construct outside the lock: local server clients may probe their endpoint
+        client = client_class(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.get(client_class)
+            if entry is not None and entry[0] == fingerprint:
+                # Another thread registered the same configuration first
+                stats["reused"] += 1
+                return entry[1]
+            self._clients[client_class] = (fingerprint, client)
+            stats["created"] += 1
+            stats["created_at"] = time.time()
+        logger.debug(f"Registered {name}")
+        return client
+
+    def peek(self, client_class: Type) -> Optional[Any]:
+        """The registered client of a class, without creating one."""
+        with self._lock:
+            entry = self._clients.get(client_class)
+        return entry[1] if entry else None
+
+    def remove(self, client_class: Type):
+        """Forget a client, e.g. after its API key was removed."""
+        with self._lock:
+            self._clients.pop(client_class, None)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get per-client creation/reuse counts and whether each SDK client was built yet."""
+        with self._lock:
+            clients = {client_class.__name__: client for client_class, (_, client) in self._clients.items()}
+            stats = {name: dict(counts) for name, counts in self._stats.items()}
+        for name, client in clients.items():
+            stats.setdefault(name, {})["sdk_initialized"] = getattr(client, "client_initialized", None)
+        return stats
+
+
+# The registry shared by the whole process
+provider_registry = ProviderRegistry()
@@ -0,0 +1,361 @@
+"""
+Client-side rate limiting for cloud providers.
+
+Each provider (and API key) gets token buckets for requests per minute and
+tokens per minute. Requests that would exceed a budget wait in a priority
+queue instead of being sent and rejected with a 429, so interactive chat
+goes ahead of background work such as summarization or tagging. When a
+provider still answers 429, its buckets are paused for the Retry-After
+period (or an exponential backoff) and the request is retried.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Request priorities; lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# No client-side budgets by default: 429 responses still pause a provider through penalize().
+# Free-tier budgets are an opt-in preset (the "rate_limit_preset" setting); "rate_limits" overrides either.
+FREE_TIER_RATE_LIMITS = {
+    "Groq": {"rpm": 30, "tpm": 6000},
+    "Perplexity": {"rpm": 50},
+    "OpenRouter.ai": {"rpm": 20},
+    "Google Gemini": {"rpm": 15, "tpm": 1000000},
+    "Google AI Studio": {"rpm": 15, "tpm": 1000000},
+    "Hugging Face Playground": {"rpm": 30},
+}
+
+RATE_LIMIT_PRESETS = {
+    "none": {},
+    "free_tier": FREE_TIER_RATE_LIMITS,
+}
+
+_RETRY_AFTER = re.compile(r"retry[- ]after[^0-9]*([0-9]+(?:\.[0-9]+)?)", re.IGNORECASE)
+# "429" as a status code (not inside "4290 tokens"), or the usual rate-limit wording
+_RATE_LIMITED = re.compile(r"\b429\b|\btoo many requests\b|\brate[ _-]?limit", re.IGNORECASE)
+
+
+class RateLimitTimeout(Exception):
+    """A request waited longer than allowed for its provider's rate limit."""
+
+
+@dataclass
+class RateLimit:
+    """Budget of one provider: requests and tokens per minute (None = unlimited)."""
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rpm is None and self.tpm is None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to its capacity."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount tokens are available (0 if they are now)."""
+        self._refill(now)
+        # Requests bigger than the whole bucket go through once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+
+@dataclass
+class RatePermit:
+    """Admission of one request, used to settle its actual token usage."""
+    key: Tuple[str, str]
+    estimated_tokens: int
+    wait_time: float
+
+
+class _Lane:
+    """Buckets, waiting queue and backoff state of one provider/API key pair."""
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.requests = TokenBucket(limit.rpm, limit.rpm / 60.0) if limit.rpm else None
+        self.tokens = TokenBucket(limit.tpm, limit.tpm / 60.0) if limit.tpm else None
+        self.queue: List[Tuple[int, int]] = []  # heap of (priority, ticket)
+        self.paused_until = 0.0
+        self.backoff = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self.paused_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def consume(self, tokens: int, now: float):
+        if self.requests is not None:
+            self.requests.consume(1, now)
+        if self.tokens is not None:
+            self.tokens.consume(tokens, now)
+
+
+def _error_chain(error: BaseException):
+    """The error and the exceptions it was raised from or while handling."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(error, "status", None),
+                   getattr(response, "status_code", None), getattr(response, "status", None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def rate_limit_retry_after(error: Exception) -> Optional[float]:
+    """
+    If an error is a 429 / rate-limit response, return the seconds to wait
+    before retrying (0 when the provider did not say); otherwise None.
+    Clients re-wrap SDK errors as plain exceptions, so the status code is
+    read from the chained cause before falling back to the error text.
+    """
+    chain = list(_error_chain(error))
+    status = next((code for code in map(_status_code, chain) if code is not None), None)
+    if status is not None and status != 429:
+        return None
+    message = " ".join(str(e) for e in chain)
+    if status is None and not _RATE_LIMITED.search(message):
+        return None
+
+    retry_after = None
+    for e in chain:
+        headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        if retry_after is not None:
+            break
+    if retry_after is None:
+        match = _RETRY_AFTER.search(message)
+        retry_after = match.group(1) if match else None
+    try:
+        return max(0.0, float(retry_after)) if retry_after is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RateLimiter:
+    """Per-provider, per-API-key request scheduler with priority queueing."""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, max_wait: float = 120.0,
+                 max_backoff: float = 60.0):
+        """
+        :param limits: provider -> {"rpm": ..., "tpm": ...}; providers not listed are unlimited
+        :param max_wait: float, seconds a request may queue before RateLimitTimeout
+        :param max_backoff: float, upper bound of the 429 backoff in seconds
+        """
+        self.max_wait = max_wait
+        self.max_backoff = max_backoff
+        self.queue_wait = LatencyTracker()
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.limits: Dict[str, RateLimit] = {}
+        self.set_limits(limits or {})
+
+    def set_limits(self, limits: Dict[str, Dict[str, float]], preset: Optional[str] = None):
+        """
+        Replace the configured budgets.
+        :param limits: provider -> {"rpm": ..., "tpm": ...}, merged over the preset
+        :param preset: str, name in RATE_LIMIT_PRESETS to start from (default: no budgets)
+        """
+        if preset and preset not in RATE_LIMIT_PRESETS:
+            logger.warning(f"Unknown rate limit preset {preset!r}; using no preset")
+        base = RATE_LIMIT_PRESETS.get(preset or "none", {})
+        merged = {provider: dict(limit) for provider, limit in base.items()}
+        for provider, limit in limits.items():
+            merged.setdefault(provider, {}).update(limit or {})
+        with self._condition:
+            self.limits = {provider: RateLimit(limit.get("rpm"), limit.get("tpm"))
+                           for provider, limit in merged.items()}
+            self._lanes = {}
+
+    def _lane(self, key: Tuple[str, str]) -> Optional[_Lane]:
+        lane = self._lanes.get(key)
+        if lane is None:
+            limit = self.limits.get(key[0])
+            if limit is None or limit.unlimited:
+                return None
+            lane = self._lanes[key] = _Lane(limit)
+        return lane
+
+    @staticmethod
+    def _key(provider: str, api_key: Optional[str]) -> Tuple[str, str]:
+        # Never keep API keys around in plain text
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else ""
+        return provider, digest
+
+    def _count(self, provider: str, name: str, amount: int = 1):
+        stats = self._stats.setdefault(provider, {"requests": 0, "queued": 0, "rate_limited": 0, "timeouts": 0})
+        stats[name] += amount
+
+    def _try_admit(self, lane: _Lane, entry: Tuple[int, int], tokens: int) -> float:
+        """Admit the entry if it is first in line and the buckets allow it; else return the wait."""
+        now = time.monotonic()
+        if lane.queue[0] != entry:
+            return lane.wait_time(tokens, now) or 0.05
+        wait = lane.wait_time(tokens, now)
+        if wait <= 0:
+            heapq.heappop(lane.queue)
+            lane.consume(tokens, now)
+            self._condition.notify_all()
+        return wait
+
+    def _enqueue(self, provider: str, api_key: Optional[str], priority: int):
+        key = self._key(provider, api_key)
+        lane = self._lane(key)
+        self._count(provider, "requests")
+        if lane is None:
+            return key, None, None
+        entry = (priority, next(self._tickets))
+        heapq.heappush(lane.queue, entry)
+        return key, lane, entry
+
+    def _abandon(self, lane: _Lane, entry: Tuple[int, int]):
+        if entry in lane.queue:
+            lane.queue.remove(entry)
+            heapq.heapify(lane.queue)
+            self._condition.notify_all()
+
+    def _admitted(self, provider: str, key, tokens: int, started: float) -> RatePermit:
+        wait = time.monotonic() - started
+        self.queue_wait.record(provider, wait)
+        if wait > 0.01:
+            self._count(provider, "queued")
+            logger.debug(f"{provider} request waited {wait:.2f}s for its rate limit")
+        return RatePermit(key, tokens, wait)
+
+    def acquire(self, provider: str, api_key: Optional[str] = None, tokens: int = 0,
+                priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> RatePermit:
+        """
+        Block until the provider's budget admits a request of about `tokens` tokens.
+        :raises RateLimitTimeout: if the request waited longer than timeout (default max_wait)
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        started = time.monotonic()
+        with self._condition:
+            key, lane, entry = self._enqueue(provider, api_key, priority)
+            if lane is None:
+                return RatePermit(key, tokens, 0.0)
+            while True:
+                wait = self._try_admit(lane, entry, tokens)
+                if wait <= 0:
+                    return self._admitted(provider, key, tokens, started)
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._abandon(lane, entry)
+                    self._count(provider, "timeouts")
+                    raise RateLimitTimeout(f"Rate limit of {provider} not available within {timeout:.0f}s")
+                self._condition.wait(min(wait, remaining))
+
+    async def aacquire(self, provider: str, api_key: Optional[str] = None, tokens: int = 0,
+                       priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> RatePermit:
+        """Async version of acquire; waits without blocking the event loop."""
+        timeout = self.max_wait if timeout is None else timeout
+        started = time.monotonic()
+        with self._condition:
+            key, lane, entry = self._enqueue(provider, api_key, priority)
+        if lane is None:
+            return RatePermit(key, tokens, 0.0)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(lane, entry, tokens)
+                    if wait <= 0:
+                        return self._admitted(provider, key, tokens, started)
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._abandon(lane, entry)
+                        self._count(provider, "timeouts")
+                        raise RateLimitTimeout(f"Rate limit of {provider} not available within {timeout:.0f}s")
+                # Poll, so that requests queued behind this one notice when it leaves
+                await asyncio.sleep(min(wait, remaining, 0.25))
+        except asyncio.CancelledError:
+            with self._condition:
+                self._abandon(lane, entry)
+            raise
+
+    def settle(self, permit: RatePermit, actual_tokens: int):
+        """Charge the difference between a request's estimated and actual token usage."""
+        with self._condition:
+            lane = self._lanes.get(permit.key)
+            if lane is None:
+                return
+            lane.backoff = 0.0
+            if lane.tokens is not None and actual_tokens != permit.estimated_tokens:
+                lane.tokens.consume(actual_tokens - permit.estimated_tokens, time.monotonic())
+
+    def penalize(self, permit: RatePermit, retry_after: Optional[float] = None) -> float:
+        """
+        Pause a provider/key after a 429 response.
+        :return: float, seconds until requests are admitted again
+        """
+        with self._condition:
+            self._count(permit.key[0], "rate_limited")
+            lane = self._lanes.get(permit.key)
+            if lane is None:
+                # Provider without a configured budget: keep a lane just for its backoff
+                lane = self._lanes[permit.key] = _Lane(self.limits.get(permit.key[0]) or RateLimit())
+            lane.backoff = min(max(lane.backoff * 2, 1.0), self.max_backoff)
+            delay = retry_after if retry_after else lane.backoff
+            lane.paused_until = max(lane.paused_until, time.monotonic() + delay)
+            self._condition.notify_all()
+        logger.warning(f"{permit.key[0]} is rate limiting requests; pausing for {delay:.1f}s")
+        return delay
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get per-provider request counts, queue depth and queue wait percentiles."""
+        with self._condition:
+            stats = {provider: dict(counts) for provider, counts in self._stats.items()}
+            for (provider, _), lane in self._lanes.items():
+                entry = stats.setdefault(provider, {})
+                entry["queue_depth"] = entry.get("queue_depth", 0) + len(lane.queue)
+                entry["paused_for"] = max(entry.get("paused_for", 0.0), lane.paused_until - time.monotonic(), 0.0)
+        for provider, entry in stats.items():
+            entry.setdefault("queue_depth", 0)
+            entry["wait_p50"] = self.queue_wait.percentile(provider, 50)
+            entry["wait_p90"] = self.queue_wait.percentile(provider, 90)
+            entry["wait_max"] = self.queue_wait.percentile(provider, 100)
+        return stats
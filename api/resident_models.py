@@ -0,0 +1,231 @@
+"""
+Resident in-process models for LocalModelManager.
+
+Loading a GGUF model with llama-cpp-python reads (or maps) gigabytes of
+weights and allocates its context, so a model is loaded once and kept for
+later requests. Models are keyed by everything fixed at load time (model,
+context length, threads, GPU layers); the least recently used ones are
+unloaded when a new model would not fit the RAM budget. Concurrent requests
+for a model that is still loading wait for that one load.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Share of system memory models may use unless a budget is configured
+DEFAULT_RAM_SHARE = 0.5
+
+
+class ModelKey(NamedTuple):
+    """Load-time settings that identify one resident model instance."""
+    model: str
+    context_length: int
+    threads: int
+    gpu_layers: int
+
+
+@dataclass
+class ResidentModel:
+    """A loaded model and its usage."""
+    key: ModelKey
+    model: Any
+    size: int
+    load_time: float
+    loaded_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    uses: int = 0
+    in_use: int = 0
+    # A llama.cpp context runs one evaluation at a time
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def default_ram_budget() -> int:
+    """Half of the system memory, or 0 (no limit) when it cannot be read."""
+    if not PSUTIL_AVAILABLE:
+        return 0
+    try:
+        return int(psutil.virtual_memory().total * DEFAULT_RAM_SHARE)
+    except Exception:
+        return 0
+
+
+def model_file_size(path: str) -> int:
+    """Approximate memory of a model by its file size (weights dominate; the KV cache is extra)."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ResidentModelCache:
+    """LRU cache of loaded models bounded by a RAM budget, with single-flight loading."""
+
+    def __init__(self, ram_budget: Optional[int] = None):
+        """
+        :param ram_budget: int, bytes loaded models may use in total; 0 disables eviction,
+                           None uses half of the system memory
+        """
+        self.ram_budget = default_ram_budget() if ram_budget is None else max(0, int(ram_budget))
+        self._models: Dict[ModelKey, ResidentModel] = {}
+        self._loading: Dict[ModelKey, Future] = {}
+        # Requests waiting for a load in progress; the loaded entry is counted in use for each of them
+        self._waiters: Dict[ModelKey, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "loads": 0, "load_errors": 0, "evictions": 0,
+                       "load_time": 0.0}
+
+    def configure(self, ram_budget: Optional[int] = None):
+        """Change the RAM budget; resident models over it are unloaded on the next load."""
+        if ram_budget is not None:
+            with self._lock:
+                self.ram_budget = max(0, int(ram_budget))
+
+    @property
+    def used(self) -> int:
+        with self._lock:
+            return sum(entry.size for entry in self._models.values())
+
+    def _get(self, key: ModelKey, loader: Callable[[], Any], size: int) -> ResidentModel:
+        """The resident model for key, loading it (once, however many callers ask) if needed."""
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._stats["hits"] += 1
+                entry.in_use += 1
+                return entry
+            pending = self._loading.get(key)
+            if pending is None:
+                pending = self._loading[key] = Future()
+                owner = True
+                self._stats["misses"] += 1
+            else:
+                owner = False
+                self._stats["waits"] += 1
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+
+        if not owner:
+            # Another request is loading this model; its result (or error) is ours. The loader
+            # already counted this request in use, so the entry cannot be unloaded in between
+            return pending.result()
+
+        try:
+            self._make_room(size, key)
+            started = time.perf_counter()
+            model = loader()
+            load_time = time.perf_counter() - started
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(key, None)
+                self._waiters.pop(key, None)
+                self._stats["load_errors"] += 1
+            pending.set_exception(e)
+            raise
+
+        entry = ResidentModel(key=key, model=model, size=size, load_time=load_time)
+        with self._lock:
+            # Published in use by this request and every request waiting for it
+            entry.in_use = 1 + self._waiters.pop(key, 0)
+            self._models[key] = entry
+            self._loading.pop(key, None)
+            self._stats["loads"] += 1
+            self._stats["load_time"] += load_time
+        logger.info(f"Loaded {key.model} (ctx {key.context_length}) in {load_time:.1f}s, "
+                    f"{size / 2**30:.1f} GiB")
+        pending.set_result(entry)
+        return entry
+
+    @contextmanager
+    def acquire(self, key: ModelKey, loader: Callable[[], Any], size: int = 0) -> Iterator[Any]:
+        """
+        Use a model, loading it with loader() if it is not resident. The model
+        is held exclusively for the duration of the block and is never
+        unloaded while in use.
+        """
+        entry = self._get(key, loader, size)
+        try:
+            with entry.lock:
+                entry.last_used = time.time()
+                entry.uses += 1
+                yield entry.model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def _make_room(self, needed: int, key: ModelKey):
+        """Unload least recently used idle models until needed bytes fit the budget."""
+        evicted: List[ResidentModel] = []
+        with self._lock:
+            if not self.ram_budget:
+                return
+            used = sum(entry.size for entry in self._models.values())
+            for entry in sorted(self._models.values(), key=lambda entry: entry.last_used):
+                if used + needed <= self.ram_budget:
+                    break
+                if entry.in_use:
+                    continue
+                del self._models[entry.key]
+                used -= entry.size
+                evicted.append(entry)
+                self._stats["evictions"] += 1
+        for entry in evicted:
+            logger.info(f"Unloading {entry.key.model} to make room for {key.model}")
+            self._close(entry)
+        if used + needed > self.ram_budget:
+            logger.warning(f"Loading {key.model} ({needed / 2**30:.1f} GiB) exceeds the local model RAM budget "
+                           f"of {self.ram_budget / 2**30:.1f} GiB")
+
+    @staticmethod
+    def _close(entry: ResidentModel):
+        close = getattr(entry.model, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"Error closing {entry.key.model}: {e}")
+        entry.model = None
+
+    def evict(self, model: Optional[str] = None) -> int:
+        """Unload idle resident instances of a model (all models if None); returns how many."""
+        with self._lock:
+            entries = [entry for key, entry in self._models.items()
+                       if (model is None or key.model == model) and not entry.in_use]
+            for entry in entries:
+                del self._models[entry.key]
+        for entry in entries:
+            self._close(entry)
+        return len(entries)
+
+    def clear(self):
+        self.evict()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit rate, load times and the resident models."""
+        with self._lock:
+            stats = dict(self._stats)
+            models = [{"model": entry.key.model, "context_length": entry.key.context_length,
+                       "threads": entry.key.threads, "gpu_layers": entry.key.gpu_layers,
+                       "size": entry.size, "load_time": entry.load_time, "uses": entry.uses,
+                       "in_use": entry.in_use, "idle": time.time() - entry.last_used}
+                      for entry in self._models.values()]
+            stats["ram_budget"] = self.ram_budget
+        requests = stats["hits"] + stats["misses"] + stats["waits"]
+        stats["hit_rate"] = (stats["hits"] + stats["waits"]) / requests if requests else 0.0
+        stats["average_load_time"] = stats["load_time"] / stats["loads"] if stats["loads"] else None
+        stats["used"] = sum(model["size"] for model in models)
+        stats["models"] = models
+        return stats
@@ -0,0 +1,219 @@
+"""
+Exact-match response cache for deterministic generations.
+
+Only requests that are reproducible (temperature 0 or a fixed seed) are
+cached, keyed by provider, model, system message, model parameters and
+prompt. Entries live in an in-memory LRU backed by a size-bounded disk
+tier, both subject to a TTL. Hits are replayed as a simulated stream so the
+UI's streaming path does not change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Words plus their trailing whitespace, roughly the granularity models stream at
+_REPLAY_CHUNK = re.compile(r"\S+\s*|\s+")
+
+
+class ResponseCache:
+    """In-memory LRU plus disk tier for deterministic responses."""
+
+    def __init__(self, cache_dir: Optional[Path] = None, enabled: bool = False,
+                 max_entries: int = 256, max_memory_bytes: int = 32 * 1024 * 1024,
+                 max_disk_bytes: int = 256 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir or Path.home() / ".oracle" / "response_cache"
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None
+        self._lock = threading.RLock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def is_deterministic(model_params: Optional[Dict[str, Any]]) -> bool:
+        """Whether a request with these parameters always produces the same answer."""
+        if not model_params:
+            return False
+        if model_params.get("temperature") == 0:
+            return True
+        seed = model_params.get("seed")
+        return seed is not None and seed != -1
+
+    @staticmethod
+    def make_key(provider: str, model: str, system_message: Optional[str],
+                 model_params: Optional[Dict[str, Any]], prompt: str,
+                 history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Hash the full request into a cache key."""
+        request = json.dumps([provider, model, system_message or "", model_params or {}, prompt, history or []],
+                             sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def key_for(self, provider: str, model: str, system_message: Optional[str],
+                model_params: Optional[Dict[str, Any]], prompt: str,
+                history: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+        """Cache key for a request, or None if caching does not apply to it."""
+        if not self.enabled or not self.is_deterministic(model_params):
+            return None
+        return self.make_key(provider, model, system_message, model_params, prompt, history)
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response, promoting disk hits into memory."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, response = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                self._drop_memory(key)
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if now - data["created"] >= self.ttl:
+                self._remove_file(path)
+                with self._lock:
+                    self._disk_bytes = None
+                raise FileNotFoundError
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._store_memory(key, data["created"], data["response"])
+        return data["response"]
+
+    def put(self, key: str, response: str, **metadata):
+        """Store a completed response in memory and on disk."""
+        created = time.time()
+        with self._lock:
+            self._store_memory(key, created, response)
+            self._stats["stores"] += 1
+
+        path = self._path(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(dict(metadata, created=created, response=response), f, ensure_ascii=False)
+            previous = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            with self._lock:
+                # An unknown total is scanned on first use, and that scan already sees this file
+                if self._disk_bytes is not None:
+                    self._disk_bytes += path.stat().st_size - previous
+            self._enforce_disk_limit()
+        except OSError as e:
+            logger.warning(f"Failed to write response cache entry: {e}")
+
+    def replay(self, response: str, stream: bool = True) -> Iterator[str]:
+        """Yield a cached response the way a live stream would deliver it."""
+        if not stream:
+            yield response
+            return
+        for match in _REPLAY_CHUNK.finditer(response):
+            yield match.group(0)
+
+    def clear(self):
+        """Remove all cached responses from memory and disk."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.cache_dir.exists():
+                for path in self.cache_dir.glob("*.json"):
+                    self._remove_file(path)
+            self._disk_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and tier sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            hits = stats["memory_hits"] + stats["disk_hits"]
+            lookups = hits + stats["misses"]
+            stats.update({
+                "enabled": self.enabled,
+                "hits": hits,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_usage(),
+            })
+        return stats
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _store_memory(self, key: str, created: float, response: str):
+        if key in self._memory:
+            self._drop_memory(key)
+        self._memory[key] = (created, response)
+        self._memory_bytes += len(response)
+        while self._memory and (len(self._memory) > self.max_entries or
+                                self._memory_bytes > self.max_memory_bytes):
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop_memory(self, key: str):
+        _, response = self._memory.pop(key)
+        self._memory_bytes -= len(response)
+
+    def _disk_usage(self) -> int:
+        with self._lock:
+            if self._disk_bytes is None:
+                total = 0
+                if self.cache_dir.exists():
+                    for path in self.cache_dir.glob("*.json"):
+                        try:
+                            total += path.stat().st_size
+                        except OSError:
+                            pass
+                self._disk_bytes = total
+            return self._disk_bytes
+
+    def _enforce_disk_limit(self):
+        """Delete the least recently written files until the disk tier fits its budget."""
+        with self._lock:
+            if self._disk_usage() <= self.max_disk_bytes:
+                return
+            files = []
+            for path in self.cache_dir.glob("*.json"):
+                try:
+                    stat = path.stat()
+                    files.append((stat.st_mtime, stat.st_size, path))
+                except OSError:
+                    pass
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                self._remove_file(path)
+                total -= size
+            self._disk_bytes = total
+
+    def _remove_file(self, path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,115 @@
+"""
+Conversation-to-slot affinity for llama.cpp server prompt caching.
+
+A llama.cpp server keeps the KV cache of the last prompt in each of its
+slots. With cache_prompt enabled, a request sent to the slot that last
+served the same conversation only evaluates the new turn; sent anywhere
+else, the whole conversation is evaluated again. SlotAffinity pins each
+conversation to a slot, hands the least recently used slot to a new
+conversation when all are taken, and tracks how many prompt tokens the
+server reused from cache versus evaluated.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def conversation_key(system_message: Optional[str] = None, history: Optional[Iterable[Dict[str, str]]] = None,
+                     conversation_id: Optional[str] = None) -> Optional[str]:
+    """
+    Identify a conversation across turns: an explicit id, else the system
+    message and first turn (which stay the same as the conversation grows).
+    None for single-turn requests, which gain nothing from a fixed slot.
+    """
+    if conversation_id:
+        return str(conversation_id)
+    history = list(history or [])
+    if not history:
+        return None
+    first = history[0]
+    seed = f"{system_message or ''}\x00{first.get('role', '')}\x00{first.get('content', '')}"
+    return hashlib.blake2b(seed.encode("utf-8"), digest_size=12).hexdigest()
+
+
+class SlotAffinity:
+    """LRU assignment of conversations to server slots, with prompt cache reuse statistics."""
+
+    def __init__(self, slots: int = 1):
+        self._lock = threading.Lock()
+        # conversation key -> slot id, least recently used first
+        self._assignments: "OrderedDict[str, int]" = OrderedDict()
+        self.slots = max(1, slots)
+        self._stats = {"requests": 0, "affinity_hits": 0, "assignments": 0, "evictions": 0,
+                       "tokens_cached": 0, "tokens_evaluated": 0}
+
+    def resize(self, slots: int):
+        """Change the slot count (e.g. after reading the server's /props)."""
+        with self._lock:
+            slots = max(1, slots)
+            if slots != self.slots:
+                self.slots = slots
+                self._assignments = OrderedDict((key, slot) for key, slot in self._assignments.items()
+                                                if slot < slots)
+
+    def assign(self, key: Optional[str]) -> int:
+        """
+        Slot for a conversation; -1 lets the server pick for requests without one.
+        A new conversation gets a free slot, else the least recently used one.
+        """
+        with self._lock:
+            self._stats["requests"] += 1
+            if key is None:
+                return -1
+            slot = self._assignments.get(key)
+            if slot is not None:
+                self._assignments.move_to_end(key)
+                self._stats["affinity_hits"] += 1
+                return slot
+
+            used = set(self._assignments.values())
+            free = [slot for slot in range(self.slots) if slot not in used]
+            if free:
+                slot = free[0]
+            else:
+                # The slot's cached prompt belongs to the conversation idle the longest
+                _, slot = self._assignments.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._assignments[key] = slot
+            self._stats["assignments"] += 1
+            return slot
+
+    def release(self, key: Optional[str]):
+        """Forget a conversation (e.g. when it is deleted)."""
+        with self._lock:
+            self._assignments.pop(key, None)
+
+    def record(self, tokens_cached: Optional[int], tokens_evaluated: Optional[int]):
+        """Record the prompt tokens a response reports as reused from cache and as evaluated."""
+        with self._lock:
+            self._stats["tokens_cached"] += int(tokens_cached or 0)
+            self._stats["tokens_evaluated"] += int(tokens_evaluated or 0)
+
+    def record_response(self, data: Dict[str, Any]):
+        """Record cache reuse from a llama.cpp /completion response (or its final stream chunk)."""
+        timings = data.get("timings") or {}
+        evaluated = timings.get("prompt_n")
+        if evaluated is None:
+            return
+        # tokens_evaluated is the whole prompt; whatever prompt_n did not process came from the cache
+        prompt_tokens = data.get("tokens_evaluated")
+        cached = max(0, int(prompt_tokens) - int(evaluated)) if prompt_tokens is not None else 0
+        self.record(cached, evaluated)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get affinity hit rate and the share of prompt tokens served from cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["slots"] = self.slots
+            stats["conversations"] = len(self._assignments)
+        prompt_tokens = stats["tokens_cached"] + stats["tokens_evaluated"]
+        stats["cache_reuse"] = stats["tokens_cached"] / prompt_tokens if prompt_tokens else 0.0
+        keyed = stats["affinity_hits"] + stats["assignments"]
+        stats["affinity_hit_rate"] = stats["affinity_hits"] / keyed if keyed else 0.0
+        return stats
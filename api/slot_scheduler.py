@@ -0,0 +1,222 @@
+"""
+Continuous-batching admission for a llama.cpp server's parallel slots.
+
+A llama.cpp server started with --parallel N decodes up to N sequences in
+one batch; extra requests sent to it stall in its own queue with no
+fairness or visibility. SlotScheduler admits at most N requests at a time
+and queues the rest client-side: lower priority values first, and within
+a priority round-robin across conversations, so one long background job
+cannot starve the chats. Requests are handed a slot id, preferring the
+slot that last served their conversation so its cached prompt is reused.
+When the queue is full, new requests are refused instead of piling up.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from .metrics import LatencyTracker
+from .rate_limiter import PRIORITY_INTERACTIVE
+
+DEFAULT_MAX_QUEUE = 64
+# Seconds of completed work the aggregate throughput is measured over
+THROUGHPUT_WINDOW = 60.0
+
+
+class SchedulerFull(Exception):
+    """The server's slots and its waiting queue are all taken."""
+
+
+class SlotTimeout(Exception):
+    """A request waited longer than allowed for a free slot."""
+
+
+@dataclass
+class SlotLease:
+    """Admission of one request to a server slot."""
+    slot: int
+    key: Optional[Hashable]
+    priority: int
+    queued_at: float
+    started_at: float = field(default_factory=time.monotonic)
+    tokens: int = 0
+
+    @property
+    def wait_time(self) -> float:
+        return self.started_at - self.queued_at
+
+
+class _Waiter:
+    """A queued request, woken once a slot is handed to it."""
+
+    def __init__(self, key: Hashable, priority: int):
+        self.key = key
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.event = threading.Event()
+        self.lease: Optional[SlotLease] = None
+
+
+class SlotScheduler:
+    """Admission control for a fixed number of server slots with a fair waiting queue."""
+
+    def __init__(self, slots: int = 1, max_queue: int = DEFAULT_MAX_QUEUE):
+        """
+        :param slots: int, parallel sequences the server decodes (its --parallel)
+        :param max_queue: int, requests allowed to wait for a slot; 0 for no limit
+        """
+        self._lock = threading.Lock()
+        self.slots = max(1, slots)
+        self.max_queue = max(0, max_queue)
+        self._free: List[int] = list(range(self.slots))
+        self._busy: Dict[int, SlotLease] = {}
+        # Slot -> conversation it last served
+        self._last_key: Dict[int, Hashable] = {}
+        # Priority -> conversation -> waiting requests; conversations rotate round-robin
+        self._queues: Dict[int, "OrderedDict[Hashable, Deque[_Waiter]]"] = {}
+        self._queued = 0
+        self._anonymous = itertools.count()
+        self._created = time.monotonic()
+        self._busy_time = 0.0
+        self._completions: Deque[Tuple[float, int]] = deque()
+        self.wait_tracker = LatencyTracker()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0, "completed": 0,
+                       "affinity_hits": 0, "tokens": 0, "max_queue_depth": 0}
+
+    def resize(self, slots: int):
+        """Change the slot count, e.g. after the server was restarted with another --parallel."""
+        with self._lock:
+            slots = max(1, slots)
+            self.slots = slots
+            self._free = [slot for slot in range(slots) if slot not in self._busy]
+            self._last_key = {slot: key for slot, key in self._last_key.items() if slot < slots}
+            self._dispatch()
+
+    def _pick_slot(self, key: Hashable) -> int:
+        """A free slot, preferring the one that last served this conversation."""
+        for slot in self._free:
+            if self._last_key.get(slot) == key:
+                self._stats["affinity_hits"] += 1
+                self._free.remove(slot)
+                return slot
+        # The front of the free list has been idle the longest
+        return self._free.pop(0)
+
+    def _grant(self, key: Hashable, priority: int, queued_at: float) -> SlotLease:
+        slot = self._pick_slot(key)
+        lease = SlotLease(slot=slot, key=key, priority=priority, queued_at=queued_at)
+        self._busy[slot] = lease
+        self._last_key[slot] = key
+        self._stats["admitted"] += 1
+        return lease
+
+    def _dispatch(self):
+        """Hand free slots to waiting requests: best priority, then the next conversation in turn."""
+        while self._free and self._queued:
+            priority = min(priority for priority, queue in self._queues.items() if queue)
+            conversations = self._queues[priority]
+            key, waiters = next(iter(conversations.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                conversations.move_to_end(key)
+            else:
+                del conversations[key]
+            self._queued -= 1
+            waiter.lease = self._grant(key, priority, waiter.queued_at)
+            waiter.event.set()
+
+    def _abandon(self, waiter: _Waiter):
+        conversations = self._queues.get(waiter.priority) or {}
+        waiters = conversations.get(waiter.key)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del conversations[waiter.key]
+
+    def acquire(self, key: Optional[Hashable] = None, priority: int = PRIORITY_INTERACTIVE,
+                timeout: Optional[float] = None) -> SlotLease:
+        """
+        Wait for a slot. key identifies the conversation (None: a one-off request).
+        :raises SchedulerFull: if every slot is busy and the queue is full
+        :raises SlotTimeout: if no slot was free within timeout seconds
+        """
+        if key is None:
+            key = ("request", next(self._anonymous))
+        with self._lock:
+            if self._free and not self._queued:
+                lease = self._grant(key, priority, time.monotonic())
+                self.wait_tracker.record("all", 0.0)
+                return lease
+            if self.max_queue and self._queued >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise SchedulerFull(f"All {self.slots} slots busy and {self._queued} requests waiting")
+            waiter = _Waiter(key, priority)
+            self._queues.setdefault(priority, OrderedDict()).setdefault(key, deque()).append(waiter)
+            self._queued += 1
+            self._stats["queued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+            self._dispatch()
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if waiter.lease is None:
+                    self._abandon(waiter)
+                    self._stats["timeouts"] += 1
+                    raise SlotTimeout(f"No free slot within {timeout:g}s")
+        self.wait_tracker.record("all", waiter.lease.wait_time)
+        return waiter.lease
+
+    def release(self, lease: SlotLease):
+        """Free a lease's slot for the next waiting request."""
+        now = time.monotonic()
+        with self._lock:
+            if self._busy.get(lease.slot) is not lease:
+                return
+            del self._busy[lease.slot]
+            self._busy_time += now - lease.started_at
+            self._stats["completed"] += 1
+            self._stats["tokens"] += lease.tokens
+            self._completions.append((now, lease.tokens))
+            if lease.slot < self.slots:
+                self._free.append(lease.slot)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, key: Optional[Hashable] = None, priority: int = PRIORITY_INTERACTIVE,
+             timeout: Optional[float] = None) -> Iterator[SlotLease]:
+        """Hold a slot for the duration of the block."""
+        lease = self.acquire(key, priority, timeout)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._queued
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, slot utilization, wait times and aggregate tokens per second."""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["slots"] = self.slots
+            stats["busy_slots"] = len(self._busy)
+            stats["queue_depth"] = self._queued
+            busy_time = self._busy_time + sum(now - lease.started_at for lease in self._busy.values())
+            while self._completions and now - self._completions[0][0] > THROUGHPUT_WINDOW:
+                self._completions.popleft()
+            window_tokens = sum(tokens for _, tokens in self._completions)
+            window = min(THROUGHPUT_WINDOW, now - self._created)
+        stats["utilization"] = busy_time / (stats["slots"] * (now - self._created)) if now > self._created else 0.0
+        stats["tokens_per_second"] = window_tokens / window if window > 0 else 0.0
+        waits = self.wait_tracker.get_stats().get("all", {})
+        stats["wait_p50"] = waits.get("p50")
+        stats["wait_p90"] = waits.get("p90")
+        return stats
@@ -0,0 +1,219 @@
+"""
+Incremental decoder for streamed model responses.
+
+Handles Server-Sent Events (OpenAI-compatible servers, llama.cpp) and
+newline-delimited JSON (Ollama) at the byte level. Incoming network chunks
+are appended to one bytearray; all complete lines are split out in a single
+pass and only the trailing partial frame stays behind (tracked by offset and
+compacted lazily), so frames are not re-copied line by line. Payloads are
+decoded with orjson when it is installed.
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# Optional fast JSON decoding
+try:
+    import orjson
+    _loads = orjson.loads
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    _loads = json.loads
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SSE = "sse"
+NDJSON = "ndjson"
+
+# Compact the buffer only once this many consumed bytes have piled up
+_COMPACT_THRESHOLD = 64 * 1024
+
+
+class StreamDecoder:
+    """Byte-level SSE / NDJSON frame decoder yielding parsed JSON payloads."""
+
+    def __init__(self, framing: str = SSE):
+        if framing not in (SSE, NDJSON):
+            raise ValueError(f"Unknown stream framing: {framing}")
+        self.framing = framing
+        self.done = False
+        self.events = 0
+        self.errors = 0
+        self._buffer = bytearray()
+        self._offset = 0
+        self._data_lines: List[bytes] = []
+
+    def feed(self, data: bytes) -> List[Any]:
+        """Append raw bytes and return the payloads of every frame they complete."""
+        events: List[Any] = []
+        if self.done or not data:
+            return events
+
+        buffer = self._buffer
+        buffer += data
+        start = self._offset
+        end = buffer.rfind(b"\n", start)
+        if end == -1:
+            return events
+
+        # Split every complete line in one pass; only the trailing partial line stays buffered
+        block = bytes(buffer[start:end])
+        if b"\r" in block:
+            block = block.replace(b"\r\n", b"\n").rstrip(b"\r")
+        if self.framing == NDJSON:
+            self._decode_ndjson(block.split(b"\n"), events)
+        else:
+            self._decode_sse(block.split(b"\n"), events)
+
+        start = end + 1
+        if start >= len(buffer):
+            buffer.clear()
+            start = 0
+        elif start > _COMPACT_THRESHOLD and start > len(buffer) // 2:
+            del buffer[:start]
+            start = 0
+        self._offset = start
+        return events
+
+    def flush(self) -> List[Any]:
+        """Decode whatever is left once the stream has ended."""
+        events: List[Any] = []
+        if not self.done:
+            tail = bytes(self._buffer[self._offset:]).rstrip(b"\r")
+            if self.framing == NDJSON:
+                self._decode_ndjson([tail], events)
+            else:
+                # End of stream also terminates a pending event
+                self._decode_sse([tail, b""], events)
+        self._buffer.clear()
+        self._offset = 0
+        return events
+
+    def _decode_ndjson(self, lines: List[bytes], events: List[Any]):
+        loads = _loads
+        for line in lines:
+            if not line or line.isspace():
+                continue
+            try:
+                events.append(loads(line))
+            except ValueError:
+                self.errors += 1
+        self.events += len(events)
+
+    def _decode_sse(self, lines: List[bytes], events: List[Any]):
+        loads = _loads
+        data_lines = self._data_lines
+        decoded = 0
+        for line in lines:
+            if line:
+                if line.startswith(b"data:"):
+                    data_lines.append(line[6:] if line.startswith(b"data: ") else line[5:])
+                # Comments and event/id/retry fields carry nothing the clients use
+                continue
+            if not data_lines:
+                continue
+
+            # A blank line terminates the event
+            payload = data_lines[0] if len(data_lines) == 1 else b"\n".join(data_lines)
+            data_lines.clear()
+            if payload == b"[DONE]" or payload.strip() == b"[DONE]":
+                self.done = True
+                break
+            try:
+                events.append(loads(payload))
+                decoded += 1
+            except ValueError:
+                self.errors += 1
+        self.events += decoded
+
+
+# Fallback read size for bodies that are neither chunked nor readable with read1
+_FALLBACK_CHUNK_SIZE = 512
+
+
+def _network_chunks(response, chunk_size: Optional[int]) -> Iterator[bytes]:
+    """
+    Bytes of a requests streaming response as the network delivers them.
+    ``iter_content(None)`` only streams chunked bodies; for a body with a
+    Content-Length (or one ended by closing the connection) urllib3 reads
+    to EOF and returns the whole reply at once.
+    """
+    raw = getattr(response, "raw", None)
+    if chunk_size is not None or raw is None:
+        yield from response.iter_content(chunk_size)
+        return
+    if getattr(raw, "chunked", False) and getattr(raw, "supports_chunked_reads", lambda: False)():
+        yield from raw.read_chunked(decode_content=True)
+    elif hasattr(raw, "read1"):
+        # read1 returns what is buffered or a single socket read, without waiting for the rest
+        while True:
+            data = raw.read1(decode_content=True)
+            if not data:
+                break
+            yield data
+    else:
+        yield from response.iter_content(_FALLBACK_CHUNK_SIZE)
+
+
+def iter_decoded(response, framing: str = SSE, chunk_size: Optional[int] = None) -> Iterator[Any]:
+    """
+    Yield decoded payloads from a streaming HTTP response.
+    With ``chunk_size=None`` bytes are consumed as they arrive, in whatever
+    sizes the network delivers them, whether or not the body is chunked.
+    A stream read to its end releases its connection back to the pool; one
+    abandoned early or failing is closed.
+    """
+    decoder = StreamDecoder(framing)
+    completed = False
+    try:
+        chunks = _network_chunks(response, chunk_size)
+        for data in chunks:
+            for event in decoder.feed(data):
+                yield event
+            if decoder.done:
+                break
+        if decoder.done:
+            # Read past [DONE] to the end of the body (the chunked terminator);
+            # a connection closed mid-body cannot be kept alive
+            for _ in chunks:
+                pass
+        else:
+            for event in decoder.flush():
+                yield event
+        completed = True
+    finally:
+        if not completed:
+            response.close()
+
+
+async def aiter_decoded(response, framing: str = SSE, chunk_size: Optional[int] = None) -> AsyncIterator[Any]:
+    """Async counterpart of iter_decoded for httpx streaming responses."""
+    decoder = StreamDecoder(framing)
+    chunks = response.aiter_bytes(chunk_size)
+    async for data in chunks:
+        for event in decoder.feed(data):
+            yield event
+        if decoder.done:
+            break
+    if decoder.done:
+        # Consume the rest of the body so httpx can reuse the connection
+        async for _ in chunks:
+            pass
+        return
+    for event in decoder.flush():
+        yield event
+
+
+def openai_delta_text(event: Dict[str, Any]) -> str:
+    """Extract the text of an OpenAI-compatible streaming chunk (chat or completion)."""
+    choices = event.get("choices")
+    if not choices:
+        return ""
+    choice = choices[0]
+    delta = choice.get("delta")
+    if delta is not None:
+        return delta.get("content") or ""
+    return choice.get("text") or ""
@@ -2,41 +2,133 @@
 Threading module for handling API responses
 """
 
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
 from core.config import QThread
+from .async_streams import stream_loop
+from .token_coalescer import DEFAULT_FRAME_INTERVAL, DEFAULT_MAX_CHUNKS_PER_FRAME, TokenCoalescer
+
+
+class FrameDispatcher(QObject):
+    """
+    Delivers a streamed response to the GUI thread in coalesced frames.
+    Producers on any thread call push/finish/fail; frames are emitted from
+    the GUI thread on a timer, or early once a frame is full.
+    """
+    frame_ready = pyqtSignal(str)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    # Internal hops from the producer thread to the GUI thread
+    _frame_due = pyqtSignal()
+    _stream_finished = pyqtSignal()
+    _stream_failed = pyqtSignal(str)
+
+    def __init__(self, frame_interval=DEFAULT_FRAME_INTERVAL,
+                 max_chunks_per_frame=DEFAULT_MAX_CHUNKS_PER_FRAME, parent=None):
+        super().__init__(parent)
+        self.coalescer = TokenCoalescer(frame_interval, max_chunks_per_frame)
+        self._timer = QTimer(self)
+        self._timer.setInterval(max(1, int(frame_interval * 1000)))
+        self._timer.timeout.connect(self._deliver_frame)
+        self._frame_due.connect(self._deliver_frame)
+        self._stream_finished.connect(self._on_finished)
+        self._stream_failed.connect(self._on_failed)
+
+    def start(self):
+        """Reset the buffers and start the frame timer; call from the GUI thread."""
+        self.coalescer.reset()
+        self._timer.start()
+
+    def push(self, chunk):
+        if self.coalescer.push(chunk):
+            self._frame_due.emit()
+
+    def finish(self, *_):
+        self._stream_finished.emit()
+
+    def fail(self, message):
+        self._stream_failed.emit(str(message))
+
+    def stop(self):
+        """Stop delivering frames, e.g. after the stream was cancelled."""
+        self._timer.stop()
+
+    def get_metrics(self):
+        return self.coalescer.get_metrics()
+
+    def _deliver_frame(self):
+        frame = self.coalescer.take_frame()
+        if frame is not None:
+            self.frame_ready.emit(frame)
+
+    def _on_finished(self):
+        # Flush the tail so every chunk is shown before the response completes
+        self._timer.stop()
+        self._deliver_frame()
+        self.finished.emit(self.coalescer.text())
+
+    def _on_failed(self, message):
+        self._timer.stop()
+        self._deliver_frame()
+        self.failed.emit(message)
 
 
 class ModelResponseThread(QThread):
+    response_chunk = pyqtSignal(str)
+    response_finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
 
-    def __init__(self, ollama_client, model, prompt, model_params=None, system_message=None):
+    def __init__(self, ollama_client, model, prompt, model_params=None, system_message=None,
+                 frame_interval=DEFAULT_FRAME_INTERVAL, max_chunks_per_frame=DEFAULT_MAX_CHUNKS_PER_FRAME,
+                 history=None):
         super().__init__()
         self.ollama_client = ollama_client
         self.model = model
         self.prompt = prompt
         self.model_params = model_params or {}
         self.system_message = system_message
+        # Prior turns, e.g. core.conversation_context.ConversationContext.history(prompt)
+        self.history = history
+        self.frames = FrameDispatcher(frame_interval, max_chunks_per_frame, self)
+        self.frames.frame_ready.connect(self.response_chunk)
+        self.frames.finished.connect(self.response_finished)
+        self.frames.failed.connect(self.error_occurred)
+
+    def start(self, *args, **kwargs):
+        self.frames.start()
+        super().start(*args, **kwargs)
+
+    def get_stream_metrics(self):
+        """Frame rate and queue depth of the chunk delivery to the UI"""
+        return self.frames.get_metrics()
 
     def run(self):
         try:
             # Use the OllamaClient's generate_response method
-            full_response = ""
             for chunk in self.ollama_client.generate_response(
                 self.prompt,
                 self.model,
                 stream=True,
                 system_message=self.system_message,
-                model_params=self.model_params
+                model_params=self.model_params,
+                history=self.history
             ):
-                full_response += chunk
-                self.response_chunk.emit(chunk)
-            self.response_finished.emit(full_response)
+                self.frames.push(chunk)
+            self.frames.finish()
         except Exception as e:
-            self.error_occurred.emit(str(e))
+            self.frames.fail(str(e))
 
 
 class MultiProviderResponseThread(QThread):
     """Thread for handling multi-provider responses"""
+    response_chunk = pyqtSignal(str)
+    response_finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
 
-    def __init__(self, client, prompt, provider=None, model=None, system_message=None, model_params=None):
+    def __init__(self, client, prompt, provider=None, model=None, system_message=None, model_params=None,
+                 frame_interval=DEFAULT_FRAME_INTERVAL, max_chunks_per_frame=DEFAULT_MAX_CHUNKS_PER_FRAME,
+                 history=None):
         super().__init__()
         self.client = client
         self.prompt = prompt
@@ -44,20 +136,88 @@ class MultiProviderResponseThread(QThread):
         self.model = model
         self.system_message = system_message
         self.model_params = model_params or {}
+        # Prior turns, e.g. core.conversation_context.ConversationContext.history(prompt)
+        self.history = history
+        self.frames = FrameDispatcher(frame_interval, max_chunks_per_frame, self)
+        self.frames.frame_ready.connect(self.response_chunk)
+        self.frames.finished.connect(self.response_finished)
+        self.frames.failed.connect(self.error_occurred)
+
+    def start(self, *args, **kwargs):
+        self.frames.start()
+        super().start(*args, **kwargs)
+
+    def get_stream_metrics(self):
+        """Frame rate and queue depth of the chunk delivery to the UI"""
+        return self.frames.get_metrics()
 
     def run(self):
         try:
-            full_response = ""
             for chunk in self.client.generate_response(
                 self.prompt,
                 provider_name=self.provider,
                 model_name=self.model,
                 system_message=self.system_message, 
                 stream=True,
-                model_params=self.model_params
+                model_params=self.model_params,
+                history=self.history
             ):
-                full_response += chunk
-                self.response_chunk.emit(chunk)
-            self.response_finished.emit(full_response)
+                self.frames.push(chunk)
+            self.frames.finish()
         except Exception as e:
-            self.error_occurred.emit(str(e))
+            self.frames.fail(str(e))
+
+
+class AsyncResponseStream(QObject):
+    """Streams a multi-provider response on the shared asyncio loop instead of a dedicated thread"""
+    response_chunk = pyqtSignal(str)
+    response_finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, client, prompt, provider=None, model=None, system_message=None, model_params=None, parent=None,
+                 frame_interval=DEFAULT_FRAME_INTERVAL, max_chunks_per_frame=DEFAULT_MAX_CHUNKS_PER_FRAME,
+                 history=None):
+        super().__init__(parent)
+        self.client = client
+        self.prompt = prompt
+        self.provider = provider
+        self.model = model
+        self.system_message = system_message
+        self.model_params = model_params or {}
+        # Prior turns, e.g. core.conversation_context.ConversationContext.history(prompt)
+        self.history = history
+        self._future = None
+        self.frames = FrameDispatcher(frame_interval, max_chunks_per_frame, self)
+        self.frames.frame_ready.connect(self.response_chunk)
+        self.frames.finished.connect(self.response_finished)
+        self.frames.failed.connect(self.error_occurred)
+
+    def start(self):
+        # Frames are emitted on the GUI thread whichever thread the loop runs on
+        stream = self.client.agenerate_response(
+            self.prompt,
+            provider_name=self.provider,
+            model_name=self.model,
+            system_message=self.system_message,
+            model_params=self.model_params,
+            history=self.history
+        )
+        self.frames.start()
+        self._future = stream_loop.stream(
+            stream,
+            self.frames.push,
+            self.frames.finish,
+            self.frames.fail
+        )
+
+    def cancel(self):
+        if self._future is not None:
+            self._future.cancel()
+        self.frames.stop()
+
+    def isRunning(self):
+        return self._future is not None and not self._future.done()
+
+    def get_stream_metrics(self):
+        """Frame rate and queue depth of the chunk delivery to the UI"""
+        return self.frames.get_metrics()
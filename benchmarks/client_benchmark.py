@@ -0,0 +1,256 @@
+"""
+Throughput benchmark for the API clients.
+
+Starts benchmarks/mock_servers.py in a subprocess (so its CPU time is not
+counted) and streams responses through each client in api/clients.py that
+speaks one of its wire formats, synchronously (generate_response) and on
+the event loop (agenerate_response). Reports time to first token, tokens
+per second, client CPU time per token and peak Python memory per request.
+
+Results can be saved and compared against a previous run to catch
+regressions in the client layer.
+
+Usage:
+    python benchmarks/client_benchmark.py [--requests 20] [--tokens 512] [--token-rate 0]
+                                          [--latency 0] [--mode sync|async|both]
+                                          [--save results.json] [--baseline results.json --tolerance 0.15]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.async_streams import aclose_async_http_client  # noqa: E402
+from api.clients import (ClaudeClient, LlamaCppClient, LMStudioClient, OllamaClient,  # noqa: E402
+                         OpenAIClient, VLLMClient)
+from api.metrics import StreamMetrics  # noqa: E402
+from benchmarks.mock_servers import MOCK_MODEL  # noqa: E402
+
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_servers.py")
+
+# Metrics compared against a baseline, and whether higher is better
+REGRESSION_METRICS = {
+    "ttft_ms": False,
+    "tokens_per_second": True,
+    "cpu_us_per_token": False,
+    "peak_memory_kb": False,
+}
+
+
+def start_mock_server(args):
+    """Run the mock servers in a subprocess; returns (process, base_url)."""
+    command = [sys.executable, MOCK_SERVER, "--tokens", str(args.tokens), "--token-rate", str(args.token_rate),
+               "--latency", str(args.latency), "--error-rate", str(args.error_rate),
+               "--rate-limit-rate", str(args.rate_limit_rate), "--disconnect-rate", str(args.disconnect_rate),
+               "--seed", "0"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("listening on "):
+        process.kill()
+        raise RuntimeError(f"Mock server did not start: {line!r}")
+    return process, line[len("listening on "):]
+
+
+def build_clients(base_url):
+    """Clients pointed at the mock server; SDK-based ones only if their SDK is installed."""
+    clients = [
+        ("vLLM", VLLMClient(base_url=base_url, auto_refresh=False)),
+        ("LM Studio", LMStudioClient(base_url=base_url, auto_refresh=False)),
+        ("llama.cpp", LlamaCppClient(base_url=base_url, auto_refresh=False)),
+        ("Ollama", OllamaClient(host=base_url, auto_refresh=False)),
+    ]
+    try:
+        import openai
+        client = OpenAIClient("mock-key")
+        client.client = openai.OpenAI(api_key="mock-key", base_url=f"{base_url}/v1")
+        clients.append(("OpenAI", client))
+    except ImportError:
+        print("openai SDK not installed; skipping OpenAIClient")
+    try:
+        import anthropic
+        client = ClaudeClient("mock-key")
+        client.client = anthropic.Anthropic(api_key="mock-key", base_url=base_url)
+        clients.append(("Anthropic", client))
+    except ImportError:
+        print("anthropic SDK not installed; skipping ClaudeClient")
+    return clients
+
+
+def stream_sync(client, metrics):
+    for chunk in client.generate_response("Benchmark prompt", MOCK_MODEL, stream=True):
+        metrics.record_chunk(chunk)
+
+
+async def stream_async(client, metrics):
+    async for chunk in client.agenerate_response("Benchmark prompt", MOCK_MODEL):
+        metrics.record_chunk(chunk)
+
+
+def run_request(name, client):
+    """Stream one response; returns (metrics, cpu seconds)."""
+    metrics = StreamMetrics(name, MOCK_MODEL)
+    cpu_started = time.process_time()
+    try:
+        stream_sync(client, metrics)
+        metrics.finish()
+    except Exception as e:
+        metrics.finish(error=str(e))
+    return metrics, time.process_time() - cpu_started
+
+
+async def arun_request(name, client):
+    """Async version of run_request, on the running event loop."""
+    metrics = StreamMetrics(name, MOCK_MODEL)
+    cpu_started = time.process_time()
+    try:
+        await stream_async(client, metrics)
+        metrics.finish()
+    except Exception as e:
+        metrics.finish(error=str(e))
+    return metrics, time.process_time() - cpu_started
+
+
+def benchmark(name, client, mode, requests):
+    """Run requests sequentially and summarize them."""
+    if mode == "async":
+        return asyncio.run(abenchmark(name, client, requests))
+
+    # One warm-up request opens connections and imports lazily loaded SDKs
+    run_request(name, client)
+    results = [run_request(name, client) for _ in range(requests)]
+
+    # Memory in a separate request: tracing allocations slows everything down
+    tracemalloc.start()
+    run_request(name, client)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, mode, requests, results, peak)
+
+
+async def abenchmark(name, client, requests):
+    """
+    benchmark for agenerate_response: all requests share one event loop (and so
+    its pooled connections), as they would in the application.
+    """
+    try:
+        await arun_request(name, client)
+        results = [await arun_request(name, client) for _ in range(requests)]
+
+        tracemalloc.start()
+        await arun_request(name, client)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        await aclose_async_http_client()
+    return summarize(name, "async", requests, results, peak)
+
+
+def summarize(name, mode, requests, results, peak):
+    """Summary of (metrics, cpu seconds) results and the peak memory of one request."""
+    succeeded = [(metrics, cpu) for metrics, cpu in results if metrics.error is None]
+    errors = len(results) - len(succeeded)
+    if not succeeded:
+        return {"client": name, "mode": mode, "requests": requests, "errors": errors,
+                "error": results[-1][0].error}
+
+    tokens = sum(metrics.chunks for metrics, _ in succeeded)
+    ttfts = [metrics.time_to_first_token for metrics, _ in succeeded if metrics.time_to_first_token is not None]
+    rates = [metrics.tokens_per_second for metrics, _ in succeeded if metrics.tokens_per_second is not None]
+    cpu = sum(cpu for _, cpu in succeeded)
+    return {
+        "client": name,
+        "mode": mode,
+        "requests": requests,
+        "errors": errors,
+        "ttft_ms": statistics.median(ttfts) * 1000 if ttfts else None,
+        "tokens_per_second": statistics.median(rates) if rates else None,
+        "cpu_us_per_token": cpu / tokens * 1e6 if tokens else None,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def _format(value, width, digits=1):
+    return f"{value:>{width}.{digits}f}" if isinstance(value, (int, float)) else f"{'-':>{width}}"
+
+
+def print_results(results):
+    print(f"{'client':<12} {'mode':<6} {'ttft ms':>9} {'tok/s':>10} {'cpu us/tok':>11} {'peak KiB':>9} {'errors':>7}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['client']:<12} {result['mode']:<6} failed: {result['error']}")
+            continue
+        print(f"{result['client']:<12} {result['mode']:<6} {_format(result['ttft_ms'], 9, 2)} "
+              f"{_format(result['tokens_per_second'], 10, 0)} {_format(result['cpu_us_per_token'], 11)} "
+              f"{_format(result['peak_memory_kb'], 9, 0)} {result['errors']:>7}")
+
+
+def compare(results, baseline_path, tolerance):
+    """Print metrics that got worse than the baseline by more than tolerance; returns their count."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(entry["client"], entry["mode"]): entry for entry in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        previous = baseline.get((result["client"], result["mode"]))
+        if previous is None or "error" in result:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions += 1
+                print(f"REGRESSION {result['client']} {result['mode']} {metric}: {old:.2f} -> {new:.2f} "
+                      f"({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API clients against local mock servers")
+    parser.add_argument("--requests", type=int, default=20, help="measured requests per client and mode")
+    parser.add_argument("--tokens", type=int, default=512, help="tokens per response")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="server tokens per second (0 = unthrottled)")
+    parser.add_argument("--latency", type=float, default=0.0, help="server seconds before the first token")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--clients", help="comma-separated subset of clients to run")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    process, base_url = start_mock_server(args)
+    print(f"Mock server at {base_url}: {args.tokens} tokens/response, token rate "
+          f"{args.token_rate or 'unthrottled'}, latency {args.latency * 1000:.0f} ms")
+    try:
+        clients = build_clients(base_url)
+        if args.clients:
+            wanted = {name.strip().lower() for name in args.clients.split(",")}
+            clients = [(name, client) for name, client in clients if name.lower() in wanted]
+        modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+        results = [benchmark(name, client, mode, args.requests) for name, client in clients for mode in modes]
+    finally:
+        process.terminate()
+        process.wait()
+
+    print_results(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "config": vars(args), "results": results}, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
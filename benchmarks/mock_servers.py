@@ -0,0 +1,400 @@
+"""
+Local stand-in servers for the provider APIs.
+
+One HTTP server speaks the streaming wire formats the clients consume:
+
+    POST /v1/chat/completions   OpenAI SSE (also LM Studio, vLLM, DeepSeek, ...)
+    POST /v1/messages           Anthropic SSE events
+    POST /api/chat              Ollama NDJSON (plus /api/generate, /api/tags, /api/ps)
+    POST /completion            llama.cpp server SSE (plus /health)
+
+Responses are a fixed number of tokens sent at a configurable rate after a
+configurable first-token latency, with optional injected errors (HTTP 500),
+rate limiting (HTTP 429 with Retry-After) and mid-stream disconnects.
+
+Usage:
+    python benchmarks/mock_servers.py [--port 0] [--tokens 256] [--token-rate 200] [--latency 0.05]
+                                      [--error-rate 0] [--rate-limit-rate 0] [--disconnect-rate 0]
+
+The first line printed is "listening on http://127.0.0.1:<port>".
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional
+
+MOCK_MODEL = "mock-model"
+
+
+@dataclass
+class MockConfig:
+    """Behavior of the mock servers; may be changed while they run."""
+    tokens: int = 256
+    token_rate: float = 200.0  # tokens per second; 0 sends as fast as possible
+    latency: float = 0.05  # seconds before the first token
+    error_rate: float = 0.0  # share of requests answered with error_status
+    error_status: int = 500
+    rate_limit_rate: float = 0.0  # share of requests answered with 429
+    retry_after: float = 1.0
+    disconnect_rate: float = 0.0  # share of streams cut off halfway
+    seed: Optional[int] = None
+
+
+def token_text(index: int) -> str:
+    return f" tok{index}"
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self) -> MockConfig:
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    # Plumbing
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send_json(self, data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _inject_failure(self) -> bool:
+        """Answer with an injected error; True if the request was handled that way."""
+        roll = self.server.random()
+        config = self.config
+        if roll < config.rate_limit_rate:
+            self.server.count("rate_limited")
+            self._send_json({"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error"}},
+                            status=429, headers={"Retry-After": f"{config.retry_after:g}"})
+            return True
+        if roll < config.rate_limit_rate + config.error_rate:
+            self.server.count("errors")
+            self._send_json({"error": {"message": "Injected error (mock)", "type": "server_error"}},
+                            status=config.error_status)
+            return True
+        return False
+
+    def _tokens(self) -> Iterator[str]:
+        """Yield the response tokens paced by the configured rate; stops early on a disconnect."""
+        config = self.config
+        disconnect_at = config.tokens // 2 if self.server.random() < config.disconnect_rate else None
+        time.sleep(config.latency)
+        started = time.perf_counter()
+        for index in range(config.tokens):
+            if index == disconnect_at:
+                self.server.count("disconnects")
+                self.close_connection = True
+                raise ConnectionAbortedError("injected disconnect")
+            if config.token_rate > 0:
+                delay = started + index / config.token_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield token_text(index)
+
+    def _full_text(self) -> str:
+        return "".join(self._tokens())
+
+    def _stream(self, content_type: str, frames: Iterator[bytes]):
+        self._start_stream(content_type)
+        try:
+            for frame in frames:
+                self._write_chunk(frame)
+        except ConnectionAbortedError:
+            # Drop the connection without the terminating chunk, like a crashed upstream
+            return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        self._end_stream()
+
+    # Routing
+
+    def do_GET(self):
+        self.server.count("requests")
+        if self.path.startswith("/v1/models"):
+            self._send_json({"object": "list", "data": [{"id": MOCK_MODEL, "object": "model"}]})
+        elif self.path.startswith("/api/tags"):
+            self._send_json({"models": [{"name": MOCK_MODEL, "model": MOCK_MODEL, "size": 1 << 30}]})
+        elif self.path.startswith("/api/ps"):
+            self._send_json({"models": []})
+        elif self.path.startswith("/props"):
+            self._send_json({"total_slots": 4, "model_path": MOCK_MODEL})
+        elif self.path.startswith("/health"):
+            self._send_json({"status": "ok"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        self.server.count("requests")
+        request = self._read_json()
+        routes = {
+            "/v1/chat/completions": self._openai_chat,
+            "/chat/completions": self._openai_chat,
+            "/v1/messages": self._anthropic_messages,
+            "/api/chat": self._ollama_chat,
+            "/api/generate": self._ollama_generate,
+            "/completion": self._llama_cpp_completion,
+        }
+        handler = routes.get(self.path.split("?", 1)[0])
+        if handler is None:
+            self._send_json({"error": "not found"}, status=404)
+            return
+        if self._inject_failure():
+            return
+        try:
+            handler(request)
+        except ConnectionAbortedError:
+            # Injected disconnect of a non-streamed response: close without answering
+            pass
+
+    # OpenAI
+
+    def _openai_chat(self, request: Dict[str, Any]):
+        model = request.get("model") or MOCK_MODEL
+        if not request.get("stream"):
+            text = self._full_text()
+            self._send_json({
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": self.config.tokens,
+                          "total_tokens": 10 + self.config.tokens},
+            })
+            return
+        include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+
+        def frames():
+            base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model}
+            for index, token in enumerate(self._tokens()):
+                delta = {"content": token} if index else {"role": "assistant", "content": token}
+                chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+                yield b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n"
+            yield b"data: " + json.dumps(dict(base, choices=[{"index": 0, "delta": {},
+                                                              "finish_reason": "stop"}])).encode("utf-8") + b"\n\n"
+            if include_usage:
+                usage = {"prompt_tokens": 10, "completion_tokens": self.config.tokens,
+                         "total_tokens": 10 + self.config.tokens}
+                yield b"data: " + json.dumps(dict(base, choices=[], usage=usage)).encode("utf-8") + b"\n\n"
+            yield b"data: [DONE]\n\n"
+
+        self._stream("text/event-stream", frames())
+
+    # Anthropic
+
+    def _anthropic_messages(self, request: Dict[str, Any]):
+        model = request.get("model") or MOCK_MODEL
+        usage = {"input_tokens": 10, "output_tokens": self.config.tokens,
+                 "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        if not request.get("stream"):
+            self._send_json({
+                "id": "msg_mock", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": self._full_text()}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+            })
+            return
+
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+        def frames():
+            yield event("message_start", {"type": "message_start", "message": {
+                "id": "msg_mock", "type": "message", "role": "assistant", "content": [], "model": model,
+                "stop_reason": None, "stop_sequence": None, "usage": dict(usage, output_tokens=1)}})
+            yield event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                "content_block": {"type": "text", "text": ""}})
+            yield event("ping", {"type": "ping"})
+            for token in self._tokens():
+                yield event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                    "delta": {"type": "text_delta", "text": token}})
+            yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield event("message_delta", {"type": "message_delta",
+                                          "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                          "usage": {"output_tokens": self.config.tokens}})
+            yield event("message_stop", {"type": "message_stop"})
+
+        self._stream("text/event-stream", frames())
+
+    # Ollama
+
+    def _ollama_final(self, model: str, started: float, field: str, text: str = "") -> Dict[str, Any]:
+        final = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                 "done": True, "done_reason": "stop", "total_duration": int((time.perf_counter() - started) * 1e9),
+                 "prompt_eval_count": 10, "eval_count": self.config.tokens}
+        if field == "message":
+            final["message"] = {"role": "assistant", "content": text}
+        else:
+            final["response"] = text
+        return final
+
+    def _ollama_stream(self, request: Dict[str, Any], field: str):
+        model = request.get("model") or MOCK_MODEL
+        started = time.perf_counter()
+        # Ollama streams unless told otherwise
+        if request.get("stream") is False:
+            self._send_json(self._ollama_final(model, started, field, self._full_text()))
+            return
+
+        def frames():
+            for token in self._tokens():
+                chunk = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                         "done": False}
+                if field == "message":
+                    chunk["message"] = {"role": "assistant", "content": token}
+                else:
+                    chunk["response"] = token
+                yield json.dumps(chunk).encode("utf-8") + b"\n"
+            yield json.dumps(self._ollama_final(model, started, field)).encode("utf-8") + b"\n"
+
+        self._stream("application/x-ndjson", frames())
+
+    def _ollama_chat(self, request: Dict[str, Any]):
+        self._ollama_stream(request, "message")
+
+    def _ollama_generate(self, request: Dict[str, Any]):
+        if not request.get("prompt"):
+            # A request without a prompt only loads (or with keep_alive 0, unloads) the model
+            self._send_json({"model": request.get("model") or MOCK_MODEL, "response": "", "done": True})
+            return
+        self._ollama_stream(request, "response")
+
+    # llama.cpp
+
+    def _llama_cpp_completion(self, request: Dict[str, Any]):
+        final = {"content": "", "stop": True, "tokens_predicted": self.config.tokens,
+                 **self.server.prompt_cache(request)}
+        if not request.get("stream"):
+            self._send_json(dict(final, content=self._full_text()))
+            return
+
+        def frames():
+            for token in self._tokens():
+                yield b"data: " + json.dumps({"content": token, "stop": False}).encode("utf-8") + b"\n\n"
+            yield b"data: " + json.dumps(final).encode("utf-8") + b"\n\n"
+
+        self._stream("text/event-stream", frames())
+
+
+class MockProviderServer(ThreadingHTTPServer):
+    """Threaded HTTP server serving every mock provider API, with request counters."""
+    daemon_threads = True
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), MockProviderHandler)
+        self.config = config or MockConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0, "disconnects": 0}
+        self._slot_prompts: Dict[int, str] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def prompt_cache(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Imitate llama.cpp slot prompt caching: with cache_prompt, the prefix a
+        prompt shares with the last prompt of its slot is not evaluated again.
+        Returns the tokens_evaluated/timings fields (one token per character).
+        """
+        prompt = str(request.get("prompt") or "")
+        slot = request.get("id_slot", -1)
+        previous = ""
+        # Requests without a slot get any free one; assume it held something else
+        if slot is not None and slot >= 0:
+            with self._lock:
+                if request.get("cache_prompt"):
+                    previous = self._slot_prompts.get(slot, "")
+                self._slot_prompts[slot] = prompt
+        cached = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            cached += 1
+        return {"tokens_evaluated": len(prompt), "tokens_cached": cached,
+                "timings": {"prompt_n": len(prompt) - cached, "predicted_n": self.config.tokens}}
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def start(self) -> "MockProviderServer":
+        """Serve on a daemon thread."""
+        threading.Thread(target=self.serve_forever, name="mock-provider-server", daemon=True).start()
+        return self
+
+
+def start_mock_server(config: Optional[MockConfig] = None, port: int = 0) -> MockProviderServer:
+    """Start a mock server in this process (use the CLI to keep its CPU out of measurements)."""
+    return MockProviderServer(config, port=port).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve mock OpenAI, Anthropic, Ollama and llama.cpp APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--tokens", type=int, default=256, help="tokens per response")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="tokens per second (0 = unthrottled)")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="share of streams cut off halfway")
+    parser.add_argument("--seed", type=int, help="seed for reproducible error injection")
+    args = parser.parse_args()
+
+    config = MockConfig(tokens=args.tokens, token_rate=args.token_rate, latency=args.latency,
+                        error_rate=args.error_rate, error_status=args.error_status,
+                        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                        disconnect_rate=args.disconnect_rate, seed=args.seed)
+    server = MockProviderServer(config, host=args.host, port=args.port)
+    print(f"listening on {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Micro-benchmark for api.stream_decoder.
+
+Starts a local replay server that serves a recorded-style SSE or NDJSON token
+stream, then decodes it twice: once the way the clients used to (512-byte
+reads, per-line str decode, json.loads per event) and once with
+StreamDecoder fed as bytes arrive. Reports events per second for each.
+
+Usage:
+    python benchmarks/stream_decoder_benchmark.py [--events 200000] [--framing sse|ndjson]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.stream_decoder import NDJSON, ORJSON_AVAILABLE, SSE, StreamDecoder, openai_delta_text  # noqa: E402
+
+
+def build_body(framing, events):
+    """Build a response body shaped like a real token stream."""
+    frames = []
+    for i in range(events):
+        if framing == SSE:
+            chunk = {"id": "chatcmpl-replay", "object": "chat.completion.chunk", "created": 0,
+                     "model": "replay", "choices": [{"index": 0, "delta": {"content": f" tok{i}"},
+                                                     "finish_reason": None}]}
+            frames.append(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+        else:
+            chunk = {"model": "replay", "created_at": "2024-01-01T00:00:00Z",
+                     "message": {"role": "assistant", "content": f" tok{i}"}, "done": False}
+            frames.append(json.dumps(chunk).encode() + b"\n")
+    if framing == SSE:
+        frames.append(b"data: [DONE]\n\n")
+    return b"".join(frames)
+
+
+def start_replay_server(body, write_size):
+    """Serve ``body`` with chunked transfer encoding in ``write_size`` pieces."""
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(body), write_size):
+                piece = body[start:start + write_size]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReplayHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def open_stream(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/stream")
+    return connection, connection.getresponse()
+
+
+def decode_line_by_line(response, framing):
+    """The previous approach: iter_lines(512), str decode and json.loads per line."""
+    events = 0
+    pending = b""
+    while True:
+        data = response.read(512)
+        if not data:
+            break
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if not line:
+                continue
+            line = line.decode("utf-8").rstrip("\r")
+            if framing == SSE:
+                if not line.startswith("data: "):
+                    continue
+                line = line[6:]
+                if line.strip() == "[DONE]":
+                    return events
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if framing == SSE:
+                chunk["choices"][0].get("delta", {}).get("content", "")
+            else:
+                chunk["message"].get("content", "")
+            events += 1
+    return events
+
+
+def decode_with_stream_decoder(response, framing):
+    """StreamDecoder fed with whatever the socket has available."""
+    decoder = StreamDecoder(framing)
+    events = 0
+    while not decoder.done:
+        data = response.read1(65536)
+        if not data:
+            break
+        for chunk in decoder.feed(data):
+            if framing == SSE:
+                openai_delta_text(chunk)
+            else:
+                chunk["message"].get("content", "")
+            events += 1
+    events += len(decoder.flush())
+    return events
+
+
+def run(name, decode, port, framing, repeat):
+    best = None
+    events = 0
+    for _ in range(repeat):
+        connection, response = open_stream(port)
+        start = time.perf_counter()
+        events = decode(response, framing)
+        elapsed = time.perf_counter() - start
+        connection.close()
+        best = elapsed if best is None else min(best, elapsed)
+    rate = events / best if best else 0.0
+    print(f"{name:<16} {events:>9} events  {best * 1000:>9.1f} ms  {rate:>12,.0f} events/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed response decoding")
+    parser.add_argument("--events", type=int, default=200000, help="events per stream")
+    parser.add_argument("--framing", choices=[SSE, NDJSON], default=SSE)
+    parser.add_argument("--write-size", type=int, default=4096, help="bytes per HTTP chunk sent by the server")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per decoder (best is reported)")
+    args = parser.parse_args()
+
+    body = build_body(args.framing, args.events)
+    server = start_replay_server(body, args.write_size)
+    port = server.server_address[1]
+    print(f"Replaying {len(body) / 1e6:.1f} MB of {args.framing} ({args.events} events), "
+          f"orjson={'yes' if ORJSON_AVAILABLE else 'no'}")
+    try:
+        baseline = run("line-by-line", decode_line_by_line, port, args.framing, args.repeat)
+        decoder = run("StreamDecoder", decode_with_stream_decoder, port, args.framing, args.repeat)
+        if baseline:
+            print(f"speedup: {decoder / baseline:.2f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ Configuration and imports module for The Oracle
 Handles all dependency imports with fallbacks and path management
 """
 
+import importlib
 import os
 import sys
 import json
@@ -499,26 +500,23 @@ except ImportError:
 
     nx = DummyNX()
 
-# Export anthropic if available, else dummy
-try:
-    import anthropic
-except ImportError:
+# Provider SDKs are slow to import; export proxies that import them on first use
+class LazyModule:
 
-    class DummyAnthropic:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
 
-        def __getattr__(self, name):
-            return None
-
-    anthropic = DummyAnthropic()
-
-# Export openai if available, else dummy
-try:
-    import openai
-except ImportError:
-
-    class DummyOpenAI:
+    def __getattr__(self, name):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError:
+                # Behave like the dummy modules: every attribute is None
+                return None
+        return getattr(self._module, name)
 
-        def __getattr__(self, name):
-            return None
 
-    openai = DummyOpenAI()
+# Export anthropic and openai (attributes are None if the SDK is not installed)
+anthropic = LazyModule("anthropic")
+openai = LazyModule("openai")
@@ -0,0 +1,212 @@
+"""
+Conversation context builder with incremental token budgeting.
+
+Keeps the full history of a conversation and, for every request, assembles
+the messages array that fits the model's context window. Token counts are
+computed once per message and kept as running totals, so appending a turn
+is O(1) and fitting the window only moves a start pointer forward. Turns
+that fall out of the window are dropped or, when a summarizer is set,
+folded into a running summary sent as a system message.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .token_counter import MESSAGE_OVERHEAD_TOKENS, token_counter
+
+logger = logging.getLogger(__name__)
+
+# Used when the model's context window is unknown
+DEFAULT_CONTEXT_WINDOW = 4096
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+@dataclass
+class ContextMessage:
+    """One stored turn and its token cost."""
+    role: str
+    content: str
+    tokens: int
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+class ConversationContext:
+    """Conversation history that builds token-budgeted message arrays."""
+
+    def __init__(self, context_window: Optional[int] = None, system_message: Optional[str] = None,
+                 reserve_tokens: int = 1024, count_tokens: Optional[Callable[[str], int]] = None,
+                 summarizer: Optional[Callable[[List[Dict[str, str]]], str]] = None, model: Optional[str] = None):
+        """
+        :param context_window: int, the model's context size in tokens
+        :param reserve_tokens: int, tokens kept free for the model's reply
+        :param count_tokens: callable(text) -> int, defaults to the shared token counter for model
+        :param summarizer: callable(messages) -> str, condenses turns that no longer fit;
+                           without one, the oldest turns are simply left out
+        """
+        self.model = model
+        self.count_tokens = count_tokens or (lambda text: token_counter.count(text, self.model))
+        self.summarizer = summarizer
+        self.reserve_tokens = reserve_tokens
+        self.context_window = context_window or DEFAULT_CONTEXT_WINDOW
+
+        self.messages: List[ContextMessage] = []
+        self.total_tokens = 0
+        # Messages[window_start:] are sent; window_tokens is their running total
+        self.window_start = 0
+        self.window_tokens = 0
+
+        self.summary: Optional[str] = None
+        self.summary_tokens = 0
+        self._summarized_upto = 0
+
+        self.system_message = None
+        self.system_tokens = 0
+        self.set_system_message(system_message)
+
+    @classmethod
+    def for_model(cls, model_info, **kwargs) -> "ConversationContext":
+        """Create a context sized for a core.quick_switch.ModelInfo."""
+        kwargs.setdefault("model", getattr(model_info, "model_name", None))
+        return cls(context_window=getattr(model_info, "context_window", None), **kwargs)
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Dict[str, str]], **kwargs) -> "ConversationContext":
+        """Rebuild a context from stored {"role", "content"} dicts."""
+        context = cls(**kwargs)
+        for message in messages:
+            if message.get("role") == "system":
+                context.set_system_message(message.get("content"))
+            else:
+                context.add_message(message.get("role", "user"), message.get("content", ""))
+        return context
+
+    def _cost(self, content: Optional[str]) -> int:
+        return self.count_tokens(content or "") + MESSAGE_OVERHEAD_TOKENS
+
+    @property
+    def budget(self) -> int:
+        """Tokens available for the system message, summary and history."""
+        return max(0, self.context_window - self.reserve_tokens)
+
+    def set_system_message(self, system_message: Optional[str]):
+        self.system_message = system_message
+        self.system_tokens = self._cost(system_message) if system_message else 0
+        self._fit()
+
+    def set_context_window(self, context_window: Optional[int], reserve_tokens: Optional[int] = None):
+        """Resize the window, e.g. after switching models; re-fits the history."""
+        self.context_window = context_window or DEFAULT_CONTEXT_WINDOW
+        if reserve_tokens is not None:
+            self.reserve_tokens = reserve_tokens
+        # A bigger window can bring back turns that were left out
+        self.window_start = self._summarized_upto if self.summarizer else 0
+        self.window_tokens = sum(message.tokens for message in self.messages[self.window_start:])
+        self._fit()
+
+    def set_model(self, model: Optional[str], context_window: Optional[int] = None,
+                  reserve_tokens: Optional[int] = None):
+        """
+        Switch to another model: recount every stored turn with its tokenizer
+        and resize the window to its context size.
+        """
+        if model != self.model:
+            self.model = model
+            for message in self.messages:
+                message.tokens = self._cost(message.content)
+            self.total_tokens = sum(message.tokens for message in self.messages)
+            self.system_tokens = self._cost(self.system_message) if self.system_message else 0
+            self.summary_tokens = self._cost(SUMMARY_PREFIX + self.summary) if self.summary else 0
+        self.set_context_window(context_window, reserve_tokens)
+
+    def add_message(self, role: str, content: str) -> ContextMessage:
+        """Append a turn; its tokens are counted once."""
+        message = ContextMessage(role, content, self._cost(content))
+        self.messages.append(message)
+        self.total_tokens += message.tokens
+        self.window_tokens += message.tokens
+        self._fit()
+        return message
+
+    def add_user_message(self, content: str) -> ContextMessage:
+        return self.add_message("user", content)
+
+    def add_assistant_message(self, content: str) -> ContextMessage:
+        return self.add_message("assistant", content)
+
+    def clear(self):
+        self.messages = []
+        self.total_tokens = self.window_start = self.window_tokens = 0
+        self.summary = None
+        self.summary_tokens = self._summarized_upto = 0
+
+    def _fit(self, extra_tokens: int = 0):
+        """Move the window start forward until the window fits the budget."""
+        available = self.budget - self.system_tokens - self.summary_tokens - extra_tokens
+        # Always keep the latest turn, even if it alone exceeds the budget
+        while self.window_tokens > available and self.window_start < len(self.messages) - 1:
+            self.window_tokens -= self.messages[self.window_start].tokens
+            self.window_start += 1
+
+    def _summarize_dropped(self, extra_tokens: int = 0):
+        """Fold turns that left the window into the running summary."""
+        if not self.summarizer or self.window_start <= self._summarized_upto:
+            return
+        dropped = [message.to_dict() for message in self.messages[self._summarized_upto:self.window_start]]
+        if self.summary:
+            dropped.insert(0, {"role": "system", "content": SUMMARY_PREFIX + self.summary})
+        try:
+            self.summary = self.summarizer(dropped)
+        except Exception as e:
+            # Keep the previous summary; the turns are still left out of the window
+            logger.warning(f"Failed to summarize conversation history: {e}")
+        else:
+            self.summary_tokens = self._cost(SUMMARY_PREFIX + self.summary) if self.summary else 0
+        self._summarized_upto = self.window_start
+        # The summary itself takes room from the window
+        self._fit(extra_tokens)
+
+    def build_messages(self, prompt: Optional[str] = None, include_system: bool = True) -> List[Dict[str, str]]:
+        """
+        Assemble the messages array that fits the context window.
+        :param prompt: str, a new user turn that is sent but not stored
+        :param include_system: bool, False for clients that take the system message separately
+        """
+        prompt_tokens = self._cost(prompt) if prompt else 0
+        self._fit(prompt_tokens)
+        self._summarize_dropped(prompt_tokens)
+
+        messages = []
+        if include_system and self.system_message:
+            messages.append({"role": "system", "content": self.system_message})
+        if self.summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + self.summary})
+        messages.extend(message.to_dict() for message in self.messages[self.window_start:])
+        if prompt:
+            messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def history(self, prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Prior turns (and the summary) to pass as `history=` to the API clients,
+        fitted so that the prompt still fits alongside them.
+        """
+        messages = self.build_messages(prompt, include_system=False)
+        return messages[:-1] if prompt else messages
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get message and token counts of the stored history and the current window."""
+        return {
+            "messages": len(self.messages),
+            "total_tokens": self.total_tokens,
+            "window_messages": len(self.messages) - self.window_start,
+            "window_tokens": self.window_tokens,
+            "system_tokens": self.system_tokens,
+            "summary_tokens": self.summary_tokens,
+            "dropped_messages": self.window_start,
+            "context_window": self.context_window,
+            "budget": self.budget,
+        }
@@ -7,8 +7,11 @@ from core.config import (NETWORKX_AVAILABLE, SENTENCE_TRANSFORMERS_AVAILABLE,
                         nx, logger)
 
 class KnowledgeGraph:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        if not NETWORKX_AVAILABLE or not SENTENCE_TRANSFORMERS_AVAILABLE:
+    def __init__(self, model_name='all-MiniLM-L6-v2', embedder=None):
+        # Callable(list of texts) -> list of vectors (e.g. api.embeddings.EmbeddingService);
+        # when set, sentence-transformers is never loaded into this process
+        self.embedder = embedder
+        if not NETWORKX_AVAILABLE or (embedder is None and not SENTENCE_TRANSFORMERS_AVAILABLE):
             logger.warning("Dependencies not available for KnowledgeGraph, using simplified version")
             self.graph = {}  # Simple dict as fallback
             self.model = None
@@ -16,7 +19,8 @@ class KnowledgeGraph:
             return
             
         try:
-            from sentence_transformers import SentenceTransformer
+            if embedder is None:
+                from sentence_transformers import SentenceTransformer
             
             self.graph = nx.DiGraph()
             # Lazy load the model to prevent freezes during initialization
@@ -39,6 +43,23 @@ class KnowledgeGraph:
                 logger.warning(f"Failed to load sentence transformer model: {e}")
                 self.model = None
 
+    def set_embedder(self, embedder):
+        """Embed messages with a provider backend instead of sentence-transformers."""
+        self.embedder = embedder
+        if isinstance(self.graph, dict) and NETWORKX_AVAILABLE:
+            self.graph = nx.DiGraph()
+
+    def _embed(self, content):
+        """Vector for a message, or None if no embedding backend works."""
+        if self.embedder is not None:
+            try:
+                return self.embedder([content])[0]
+            except Exception as e:
+                logger.warning(f"Failed to embed message: {e}")
+                return None
+        self._load_model()
+        return self.model.encode(content) if self.model else None
+
     def add_message(self, role, content, conversation_id):
         if not NETWORKX_AVAILABLE:
             # Simplified storage without graph
@@ -47,8 +68,7 @@ class KnowledgeGraph:
             return node_id
             
         try:
-            self._load_model()
-            vector = self.model.encode(content) if self.model else None
+            vector = self._embed(content)
             node_id = self.node_counter
             self.graph.add_node(node_id, role=role, content=content, vector=vector, conversation_id=conversation_id)
             
@@ -54,6 +54,7 @@ class QuickSwitchModelMenu(QObject):
     model_switched = pyqtSignal(str, str)  # provider, model_name
     models_updated = pyqtSignal(list)  # List[ModelInfo]
     error_occurred = pyqtSignal(str)  # error_message
+    provider_discovered = pyqtSignal(str, list)  # provider, model names (emitted from discovery threads)
     
     def __init__(self, settings_manager=None, api_manager=None):
         super().__init__()
@@ -70,6 +71,11 @@ class QuickSwitchModelMenu(QObject):
         self.recent_models: List[str] = []
         self.favorite_models: List[str] = []
         
+        # Local servers found by MultiProviderClient discovery: provider -> model names
+        self.discovered_models: Dict[str, List[str]] = {}
+        self.discovery_client = None
+        self._discovery_listener = None
+        
         # UI components (will be set by the main window)
         self.completer: Optional[QCompleter] = None
         self.search_input: Optional[QLineEdit] = None
@@ -85,6 +91,7 @@ class QuickSwitchModelMenu(QObject):
         
         # Initialize
         self._load_configuration()
+        self._sync_pinned_models()
         self._initialize_models()
         self._start_auto_refresh()
     
@@ -224,11 +231,9 @@ class QuickSwitchModelMenu(QObject):
                     model.has_valid_key = True
                     model.is_available = True
                     
-                    # For Ollama models, check if the model is actually available
-                    if provider == 'Ollama' and self.api_manager:
-                        # This would require checking with the Ollama server
-                        # For now, we'll assume it's available
-                        pass
+                    # Once a local server answered discovery, only the models it reported are available
+                    if provider in self.discovered_models:
+                        model.is_available = model.model_name in self.discovered_models[provider]
             
         except Exception as e:
             self.error_handler.log_error(
@@ -252,6 +257,49 @@ class QuickSwitchModelMenu(QObject):
                 ErrorCategory.MODEL_MANAGEMENT
             )
     
+    def attach_discovery(self, client):
+        """
+        Follow local server discovery of a MultiProviderClient.
+        Probes answer on worker threads, so results are queued onto this
+        object's (GUI) thread before the model list is touched.
+        """
+        self.detach_discovery()
+        self.provider_discovered.connect(self._on_provider_discovered, Qt.ConnectionType.QueuedConnection)
+        # Kept so the same callable can be unregistered later
+        self._discovery_listener = self.provider_discovered.emit
+        self.discovery_client = client
+        client.add_discovery_listener(self._discovery_listener)
+    
+    def detach_discovery(self):
+        """Stop following local server discovery."""
+        if self.discovery_client is None:
+            return
+        self.discovery_client.remove_discovery_listener(self._discovery_listener)
+        self.provider_discovered.disconnect(self._on_provider_discovered)
+        self.discovery_client = None
+        self._discovery_listener = None
+    
+    @error_handler(ErrorCategory.MODEL_MANAGEMENT, "Failed to apply discovered models")
+    def _on_provider_discovered(self, provider: str, model_names: list):
+        """Add the models a local server reported and refresh the list."""
+        try:
+            self.discovered_models[provider] = list(model_names)
+            for model_name in model_names:
+                key = f"{provider}:{model_name}"
+                if key not in self.models:
+                    self.models[key] = ModelInfo(provider, model_name, model_name, api_key_required=False,
+                                                 has_valid_key=True, cost_per_1k_tokens=0.0)
+            for model in self.models.values():
+                if model.provider == provider:
+                    model.is_available = model.model_name in self.discovered_models[provider]
+            self.refresh_models()
+        except Exception as e:
+            self.error_handler.log_error(
+                f"Failed to apply discovered models of {provider}: {e}",
+                ErrorSeverity.WARNING,
+                ErrorCategory.MODEL_MANAGEMENT
+            )
+    
     @error_handler(ErrorCategory.MODEL_MANAGEMENT, "Failed to start auto refresh")
     def _start_auto_refresh(self):
         """Start the auto-refresh timer."""
@@ -316,6 +364,9 @@ class QuickSwitchModelMenu(QObject):
                 # Update usage tracking
                 self._update_model_usage(model_key)
                 
+                # Start loading local models now, so the first message does not wait for it
+                self._preload_model(provider, model_name)
+                
                 # Emit signals
                 self.model_selected.emit(provider, model_name)
                 self.model_switched.emit(provider, model_name)
@@ -379,6 +430,7 @@ class QuickSwitchModelMenu(QObject):
                     self.favorite_models.append(model_key)
             
             self._save_configuration()
+            self._sync_pinned_models()
             
         except Exception as e:
             self.error_handler.log_error(
@@ -387,6 +439,29 @@ class QuickSwitchModelMenu(QObject):
                 ErrorCategory.MODEL_MANAGEMENT
             )
     
+    def _ollama_residency(self):
+        """The shared Ollama residency manager, or None if the API package is unavailable."""
+        try:
+            from api.ollama_residency import ollama_residency
+            return ollama_residency
+        except ImportError:
+            return None
+    
+    def _sync_pinned_models(self):
+        """Pin favorite Ollama models so they stay loaded longer."""
+        residency = self._ollama_residency()
+        if residency is not None:
+            prefix = "Ollama:"
+            residency.set_pinned(key[len(prefix):] for key in self.favorite_models if key.startswith(prefix))
+    
+    def _preload_model(self, provider: str, model_name: str):
+        """Preload a selected Ollama model in the background."""
+        if provider != 'Ollama':
+            return
+        residency = self._ollama_residency()
+        if residency is not None:
+            residency.preload(model_name)
+    
     @error_handler(ErrorCategory.MODEL_MANAGEMENT, "Failed to get recent models")
     def get_recent_models(self) -> List[ModelInfo]:
         """Get list of recently used models."""
@@ -609,6 +684,7 @@ class QuickSwitchModelMenu(QObject):
         """Cleanup resources."""
         try:
             self.stop_auto_refresh()
+            self.detach_discovery()
             self._save_configuration()
         except Exception as e:
             self.error_handler.log_error(
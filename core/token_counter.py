@@ -0,0 +1,238 @@
+"""
+Token counting service for context budgeting, rate limiting and cost tracking.
+
+Picks a tokenizer per model family: tiktoken BPE encodings for OpenAI and
+OpenAI-compatible models, the GGUF vocabulary (loaded vocab-only through
+llama-cpp-python) for registered local models, and a calibrated
+character/word heuristic for everything else. Tokenizers are loaded lazily
+and shared; counts are memoized per text hash, so re-counting a
+conversation only tokenizes the new turns.
+"""
+
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+# Only checked here: importing llama_cpp loads its native library, so that waits for the first GGUF tokenizer
+LLAMA_CPP_AVAILABLE = importlib.util.find_spec("llama_cpp") is not None
+
+logger = logging.getLogger(__name__)
+
+# Tokens every chat message costs on top of its content (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+HEURISTIC = "heuristic"
+
+# Model name prefixes and the tiktoken encoding that matches (or closely approximates) them
+_ENCODING_PREFIXES = (
+    ("gpt-4o", "o200k_base"),
+    ("gpt-4.1", "o200k_base"),
+    ("gpt-5", "o200k_base"),
+    ("o1", "o200k_base"),
+    ("o3", "o200k_base"),
+    ("o4", "o200k_base"),
+    ("gpt-4", "cl100k_base"),
+    ("gpt-3.5", "cl100k_base"),
+    ("text-embedding", "cl100k_base"),
+    ("deepseek", "cl100k_base"),
+    ("qwen", "cl100k_base"),
+)
+
+# Letter runs, short digit groups and single other characters, roughly how BPE splits text
+_HEURISTIC_PIECES = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]|_", re.UNICODE)
+
+
+class HeuristicTokenizer:
+    """Estimate tokens from word and character shapes; calibratable against real counts."""
+
+    def __init__(self, chars_per_token: float = 4.0, scale: float = 1.0):
+        self.chars_per_token = chars_per_token
+        self.scale = scale
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokens = 0
+        for piece in _HEURISTIC_PIECES.findall(text):
+            if piece.isascii():
+                # Common words are one token, longer ones split every few characters
+                tokens += 1 + int(max(0, len(piece) - 1) / (self.chars_per_token * 2))
+            else:
+                # Non-Latin scripts tokenize at roughly one token per character
+                tokens += len(piece)
+        return max(1, int(round(tokens * self.scale)))
+
+    def calibrate(self, estimated: int, actual: int, weight: float = 0.2):
+        """Nudge the scale toward a provider-reported token count."""
+        if estimated > 0 and actual > 0:
+            ratio = actual / (estimated / self.scale)
+            self.scale = (1 - weight) * self.scale + weight * ratio
+
+
+class TokenCounter:
+    """Per-model token counting with lazily loaded tokenizers and a memo of counted texts."""
+
+    def __init__(self, memo_size: int = 8192):
+        self.memo_size = memo_size
+        self._tokenizers: Dict[str, object] = {}
+        self._gguf_paths: Dict[str, str] = {}
+        self._memo: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.heuristic = HeuristicTokenizer()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def register_gguf(self, model: str, path: str):
+        """Count tokens for a local model with the vocabulary of its GGUF file."""
+        self._gguf_paths[model] = path
+
+    def tokenizer_key(self, model: Optional[str]) -> str:
+        """Name of the tokenizer used for a model: "gguf:<path>", a tiktoken encoding, or "heuristic"."""
+        if not model:
+            return HEURISTIC
+        path = self._gguf_paths.get(model) or (model if model.lower().endswith(".gguf") else None)
+        if path and LLAMA_CPP_AVAILABLE and os.path.exists(path):
+            return f"gguf:{path}"
+        if TIKTOKEN_AVAILABLE:
+            # Strip provider prefixes such as "openai/gpt-4o" (OpenRouter)
+            name = model.lower().rsplit("/", 1)[-1]
+            for prefix, encoding in _ENCODING_PREFIXES:
+                if name.startswith(prefix):
+                    return encoding
+        return HEURISTIC
+
+    def _tokenizer(self, key: str):
+        tokenizer = self._tokenizers.get(key)
+        if tokenizer is not None:
+            return tokenizer
+        with self._load_lock:
+            tokenizer = self._tokenizers.get(key)
+            if tokenizer is None:
+                tokenizer = self._load(key)
+                self._tokenizers[key] = tokenizer
+        return tokenizer
+
+    def _load(self, key: str):
+        try:
+            if key.startswith("gguf:"):
+                import llama_cpp
+                model = llama_cpp.Llama(model_path=key[5:], vocab_only=True, verbose=False)
+                logger.debug(f"Loaded GGUF vocabulary from {key[5:]}")
+                return model
+            if key != HEURISTIC:
+                return tiktoken.get_encoding(key)
+        except Exception as e:
+            logger.warning(f"Failed to load tokenizer {key}, estimating instead: {e}")
+        return self.heuristic
+
+    def _tokenize_count(self, tokenizer, text: str) -> int:
+        if tokenizer is self.heuristic:
+            return self.heuristic.count(text)
+        if hasattr(tokenizer, "encode_ordinary"):
+            return len(tokenizer.encode_ordinary(text))
+        # GGUF vocabulary (llama_cpp.Llama)
+        return len(tokenizer.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _remember(self, memo_key: Tuple[str, str], tokens: int):
+        with self._lock:
+            self._memo[memo_key] = tokens
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def _lookup(self, memo_key: Tuple[str, str]) -> Optional[int]:
+        with self._lock:
+            tokens = self._memo.get(memo_key)
+            if tokens is None:
+                self._stats["misses"] += 1
+            else:
+                self._memo.move_to_end(memo_key)
+                self._stats["hits"] += 1
+            return tokens
+
+    def count(self, text: Optional[str], model: Optional[str] = None) -> int:
+        """Count the tokens of one text for a model."""
+        if not text:
+            return 0
+        key = self.tokenizer_key(model)
+        memo_key = (key, self._hash(text))
+        tokens = self._lookup(memo_key)
+        if tokens is None:
+            tokens = self._tokenize_count(self._tokenizer(key), text)
+            self._remember(memo_key, tokens)
+        return tokens
+
+    def count_batch(self, texts: Iterable[Optional[str]], model: Optional[str] = None) -> List[int]:
+        """Count many texts at once; only texts not seen before are tokenized, in one batch."""
+        texts = [text or "" for text in texts]
+        key = self.tokenizer_key(model)
+        counts: List[Optional[int]] = []
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            tokens = self._lookup((key, self._hash(text))) if text else 0
+            counts.append(tokens)
+            if tokens is None:
+                missing.setdefault(text, []).append(index)
+
+        if missing:
+            tokenizer = self._tokenizer(key)
+            pending = list(missing)
+            if hasattr(tokenizer, "encode_ordinary_batch"):
+                # tiktoken tokenizes batches on its own thread pool
+                results = [len(tokens) for tokens in tokenizer.encode_ordinary_batch(pending)]
+            else:
+                results = [self._tokenize_count(tokenizer, text) for text in pending]
+            for text, tokens in zip(pending, results):
+                self._remember((key, self._hash(text)), tokens)
+                for index in missing[text]:
+                    counts[index] = tokens
+        return counts
+
+    def count_messages(self, messages: Iterable[Dict[str, str]], model: Optional[str] = None) -> int:
+        """Count a whole chat messages array, including per-message overhead."""
+        messages = list(messages)
+        contents = self.count_batch((message.get("content") for message in messages), model)
+        return sum(contents) + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+    def calibrate(self, text: str, actual_tokens: int, model: Optional[str] = None):
+        """
+        Calibrate the heuristic with a token count reported by a provider for text.
+        Counts for models with a real tokenizer are ignored, since they say nothing about the estimate.
+        """
+        if not text or not actual_tokens or (model and self.tokenizer_key(model) != HEURISTIC):
+            return
+        self.heuristic.calibrate(self.heuristic.count(text), actual_tokens)
+        with self._lock:
+            # Heuristic counts memoized so far were made with the old scale
+            for memo_key in [memo_key for memo_key in self._memo if memo_key[0] == HEURISTIC]:
+                del self._memo[memo_key]
+
+    def get_stats(self) -> Dict[str, object]:
+        """Get memo hit rate and the loaded tokenizers."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memo_entries"] = len(self._memo)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["tokenizers"] = sorted(self._tokenizers)
+        stats["heuristic_scale"] = self.heuristic.scale
+        return stats
+
+
+# Shared counter; tokenizers are expensive to load, so every component uses this one
+token_counter = TokenCounter()
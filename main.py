@@ -281,8 +281,9 @@ def main() -> NoReturn:
         if splash:
             splash.finish(window)
         
-        # Start event loop
-        sys.exit(app.exec())
+        # Start event loop (qasync-driven when available so async streams share it)
+        from api.async_streams import run_event_loop
+        sys.exit(run_event_loop(app))
         
     except Exception as exc:
         log_critical(f"Critical error in main function: {exc}")
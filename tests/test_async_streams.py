@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from api.async_streams import AsyncLoopBridge, aiter_sync, iter_async
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+async def tokens(*chunks, error=None):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+    if error is not None:
+        raise error
+
+
+@pytest.fixture
+def bridge():
+    bridge = AsyncLoopBridge()
+    yield bridge
+    bridge.stop()
+
+
+def test_streams_report_chunks_and_the_full_response(bridge):
+    chunks, finished = [], []
+    future = bridge.stream(tokens("Hel", "lo"), chunks.append, finished.append)
+    assert future.result(5) == "Hello"
+    assert chunks == ["Hel", "lo"] and finished == ["Hello"]
+    assert not bridge.uses_qt
+
+
+def test_stream_errors_go_to_the_error_callback(bridge):
+    errors = []
+    future = bridge.stream(tokens("a", error=ValueError("boom")), lambda chunk: None, on_error=errors.append)
+    assert future.result(5) is None
+    assert [str(error) for error in errors] == ["boom"]
+
+
+def test_streams_share_one_loop_thread(bridge):
+    threads = set()
+
+    async def where():
+        threads.add(threading.current_thread().name)
+        yield "x"
+
+    for _ in range(3):
+        bridge.stream(where(), lambda chunk: None).result(5)
+    assert threads == {"async-streams"}
+
+
+def test_blocking_callers_can_iterate_async_streams():
+    assert list(iter_async(tokens("a", "b", "c"), timeout=5)) == ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        list(iter_async(tokens("a", error=ValueError("boom")), timeout=5))
+
+
+def test_blocking_generators_see_the_callers_context():
+    def generate():
+        for _ in range(2):
+            yield request_id.get()
+
+    async def consume():
+        request_id.set("request-1")
+        return [chunk async for chunk in aiter_sync(generate)]
+
+    assert asyncio.run(consume()) == ["request-1", "request-1"]
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+from api.batch_runner import BatchRunner, load_rows, render_template
+
+
+class FakeClient:
+    """agenerate_response stand-in: echoes the prompt, failing for prompts listed in `fail`."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.prompts = []
+
+    async def agenerate_response(self, prompt, provider_name=None, model_name=None, on_usage=None, **kwargs):
+        self.prompts.append((provider_name, prompt))
+        await asyncio.sleep(0)
+        if prompt in self.fail:
+            raise ConnectionError("down")
+        yield f"{model_name}: {prompt}"
+        if on_usage is not None:
+            on_usage({"input_tokens": 3, "output_tokens": 2})
+
+
+def read_records(path):
+    records = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            records.append(None)
+    return records
+
+
+ROWS = [{"id": "a", "text": "one"}, {"id": "b", "text": "two"}]
+TARGETS = [("P", "m1"), ("Q", "m2")]
+
+
+def runner(client, output, **kwargs):
+    return BatchRunner(client, ROWS, TARGETS, str(output), template="Say {{text}}", **kwargs)
+
+
+def test_results_and_usage_are_written(tmp_path):
+    output = tmp_path / "out.jsonl"
+    progress = runner(FakeClient(), output).run()
+    assert (progress.completed, progress.failed, progress.skipped) == (4, 0, 0)
+    assert progress.tokens == 8
+    records = read_records(output)
+    assert {(r["id"], r["provider"]) for r in records} == {("a", "P"), ("a", "Q"), ("b", "P"), ("b", "Q")}
+    assert all(r["status"] == "ok" and r["usage"]["output_tokens"] == 2 for r in records)
+
+
+def test_resume_skips_successful_pairs_and_retries_failures(tmp_path):
+    output = tmp_path / "out.jsonl"
+    first = runner(FakeClient(fail={"Say two"}), output).run()
+    assert (first.completed, first.failed) == (2, 2)
+
+    client = FakeClient()
+    second = runner(client, output).run()
+    assert second.skipped == 2
+    assert second.completed == 2
+    assert sorted(client.prompts) == [("P", "Say two"), ("Q", "Say two")]
+    assert runner(FakeClient(), output).completed_pairs() == {("a", "P:m1"), ("a", "Q:m2"),
+                                                              ("b", "P:m1"), ("b", "Q:m2")}
+
+
+def test_truncated_last_line_does_not_corrupt_new_records(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text('{"id": "a", "provider": "P", "model": "m1", "status": "ok"}\n{"id": "b", "prov',
+                      encoding="utf-8")
+    client = FakeClient()
+    progress = runner(client, output).run()
+    assert progress.skipped == 1
+    assert progress.completed == 3
+    records = read_records(output)
+    # The cut-off line stays unreadable; every record after it parses
+    assert records[1] is None
+    assert all(record is not None for record in records[2:])
+    assert len(records) == 5
+
+
+def test_rows_without_an_id_use_their_position(tmp_path):
+    rows = [{"prompt": "x"}, {"prompt": "y"}]
+    batch = BatchRunner(FakeClient(), rows, [("P", "m")], str(tmp_path / "out.jsonl"))
+    batch.run()
+    assert batch.completed_pairs() == {("0", "P:m"), ("1", "P:m")}
+
+
+def test_missing_template_variable_fails_the_row(tmp_path):
+    with pytest.raises(ValueError, match="audience"):
+        render_template("For {{audience}}", {})
+    output = tmp_path / "out.jsonl"
+    batch = BatchRunner(FakeClient(), [{"id": "a"}], [("P", "m")], str(output), template="{{text}}")
+    assert batch.run().failed == 1
+    assert "text" in read_records(output)[0]["error"]
+
+
+def test_load_rows_reads_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "rows.csv"
+    csv_path.write_text("id,text\n1,hello\n", encoding="utf-8")
+    jsonl_path = tmp_path / "rows.jsonl"
+    jsonl_path.write_text('{"id": 1, "text": "hello"}\n\n"bare prompt"\n', encoding="utf-8")
+    assert load_rows(str(csv_path)) == [{"id": "1", "text": "hello"}]
+    assert load_rows(str(jsonl_path)) == [{"id": 1, "text": "hello"}, {"prompt": "bare prompt"}]
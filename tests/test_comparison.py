@@ -0,0 +1,36 @@
+import asyncio
+
+from api.comparison import ComparisonRun
+from core.token_counter import token_counter
+
+
+class FakeClient:
+    """agenerate_response stand-in streaming fixed chunks and reporting optional usage."""
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    async def agenerate_response(self, prompt, provider_name=None, model_name=None, on_usage=None, **kwargs):
+        chunks, usage = self.plan[provider_name]
+        for chunk in chunks:
+            await asyncio.sleep(0.01)
+            yield chunk
+        if usage and on_usage is not None:
+            on_usage(usage)
+
+
+def test_tokens_come_from_provider_usage():
+    client = FakeClient({"claude": (["one two three ", "four five six"], {"output_tokens": 6})})
+    results = ComparisonRun(client, "prompt", [("claude", "model")]).start().wait(timeout=5)
+    result = results["claude:model"]
+    assert result["status"] == "done"
+    assert result["response"] == "one two three four five six"
+    assert result["metrics"]["tokens"] == 6
+
+
+def test_tokens_are_counted_when_usage_is_missing():
+    text = ["A much longer chunk of text ", "than a single token each"]
+    client = FakeClient({"local": (text, None)})
+    results = ComparisonRun(client, "prompt", [("local", "model")]).start().wait(timeout=5)
+    assert results["local:model"]["metrics"]["tokens"] == token_counter.count("".join(text), "model")
+    assert results["local:model"]["metrics"]["tokens"] > 2
@@ -0,0 +1,35 @@
+from core.conversation_context import DEFAULT_CONTEXT_WINDOW, ConversationContext
+
+
+def counter(per_model):
+    """count_tokens stub whose cost per word depends on the context's current model."""
+    def count(context):
+        return lambda text: len(text.split()) * per_model.get(context.model, 1)
+    return count
+
+
+def test_set_model_recounts_stored_turns():
+    per_model = {"small": 1, "large": 3}
+    context = ConversationContext(context_window=1000, reserve_tokens=0, model="small")
+    context.count_tokens = counter(per_model)(context)
+    context.add_user_message("one two three")
+    context.add_assistant_message("four five")
+    before = context.total_tokens
+
+    context.set_model("large", 1000)
+    assert context.total_tokens == before + 2 * 5
+    assert context.window_tokens == context.total_tokens
+
+
+def test_set_model_resizes_window():
+    context = ConversationContext(context_window=100000, reserve_tokens=0, count_tokens=lambda text: 100)
+    for i in range(10):
+        context.add_user_message(str(i))
+    assert context.get_stats()["dropped_messages"] == 0
+
+    context.set_model("tiny", 500)
+    assert context.context_window == 500
+    assert context.get_stats()["dropped_messages"] > 0
+
+    context.set_model("tiny", None)
+    assert context.context_window == DEFAULT_CONTEXT_WINDOW
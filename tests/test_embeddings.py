@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from api.embeddings import EmbeddingService
+
+
+class FakeEmbedder:
+    """Embeds a text as [length, batch number] and records each batch."""
+    name = "Fake"
+    supports_embeddings = True
+    EMBED_BATCH_SIZE = 3
+    DEFAULT_EMBEDDING_MODEL = "fake-embed"
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed(self, texts, model=None):
+        with self._lock:
+            self.batches.append(list(texts))
+        return [[float(len(text)), float(len(self.batches))] for text in texts]
+
+
+def test_texts_are_split_into_batches_of_the_provider_limit():
+    client = FakeEmbedder()
+    service = EmbeddingService(client, batch_size=10)
+    texts = [f"text {n}" for n in range(7)]
+    vectors = service.embed(texts)
+    assert service.batch_size == 3
+    assert sorted(len(batch) for batch in client.batches) == [1, 3, 3]
+    assert [vector[0] for vector in vectors] == [float(len(text)) for text in texts]
+    assert service.get_stats()["batches"] == 3
+    service.close()
+
+
+def test_repeated_and_cached_texts_are_embedded_once():
+    client = FakeEmbedder()
+    service = EmbeddingService(client)
+    first = service.embed(["a", "bb", "a"])
+    assert client.batches == [["a", "bb"]]
+    assert first[0] is first[2]
+    second = service.embed(["bb", "ccc"])
+    assert client.batches[-1] == ["ccc"]
+    assert second[0] == first[1]
+    stats = service.get_stats()
+    assert (stats["texts"], stats["hits"], stats["embedded"]) == (5, 1, 3)
+
+
+def test_cache_is_bounded():
+    client = FakeEmbedder()
+    service = EmbeddingService(client, cache_size=2)
+    service.embed(["a", "b", "c"])
+    service.embed(["a"])
+    assert client.batches[-1] == ["a"]
+
+
+def test_clients_without_embeddings_are_rejected():
+    class NoEmbeddings:
+        name = "Chat only"
+        supports_embeddings = False
+
+    with pytest.raises(ValueError):
+        EmbeddingService(NoEmbeddings())
+
+
+def test_mismatched_vector_counts_are_errors():
+    client = FakeEmbedder()
+    client.embed = lambda texts, model=None: [[0.0]]
+    with pytest.raises(ValueError):
+        EmbeddingService(client).embed(["a", "b"])
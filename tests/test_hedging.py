@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from api.hedging import HedgedRequest
+from api.metrics import LatencyTracker
+
+
+class FakeClient:
+    """
+    agenerate_response stand-in: each provider waits `delay` seconds (or, for None,
+    until the gate opens), then streams its chunks or raises.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.gate = None
+        self.started = []
+        self.closed = []
+
+    async def agenerate_response(self, prompt, provider_name=None, model_name=None, **kwargs):
+        self.started.append(provider_name)
+        delay, result = self.plan[provider_name]
+        try:
+            if delay is None:
+                await self.gate.wait()
+            else:
+                await asyncio.sleep(delay)
+            if isinstance(result, Exception):
+                raise result
+            for chunk in result:
+                yield chunk
+        finally:
+            self.closed.append(provider_name)
+
+
+def race(client, targets, **kwargs):
+    request = HedgedRequest(client, "prompt", [(provider, "model") for provider in targets], **kwargs)
+
+    async def collect():
+        if any(delay is None for delay, _ in client.plan.values()):
+            # Gated providers all answer in the same event loop iteration
+            client.gate = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.05, client.gate.set)
+        return [chunk async for chunk in request.stream()]
+
+    return request, asyncio.run(collect())
+
+
+def test_fastest_target_wins_and_loser_is_cancelled():
+    client = FakeClient({"slow": (0.5, ["s"]), "fast": (0.01, ["f1", "f2"])})
+    request, chunks = race(client, ["slow", "fast"], hedge_delay=0)
+    assert chunks == ["f1", "f2"]
+    assert request.winner.provider == "fast"
+    assert request.hedged
+    assert "slow" in client.closed
+
+
+def test_backups_wait_for_hedge_delay():
+    client = FakeClient({"primary": (0.01, ["p"]), "backup": (0.01, ["b"])})
+    request, chunks = race(client, ["primary", "backup"], hedge_delay=1.0)
+    assert chunks == ["p"]
+    assert client.started == ["primary"]
+    assert not request.hedged
+
+
+def test_failed_primary_starts_backups_immediately():
+    client = FakeClient({"primary": (0, RuntimeError("down")), "backup": (0.01, ["b"])})
+    request, chunks = race(client, ["primary", "backup"], hedge_delay=10.0)
+    assert chunks == ["b"]
+    assert "primary:model" in request.errors
+
+
+def test_empty_stream_does_not_win():
+    client = FakeClient({"empty": (0, []), "backup": (0.05, ["b"])})
+    request, chunks = race(client, ["empty", "backup"], hedge_delay=0)
+    assert chunks == ["b"]
+    assert request.winner.provider == "backup"
+    assert "empty:model" in request.errors
+
+
+def test_all_targets_failing_raises():
+    client = FakeClient({"a": (0, RuntimeError("a down")), "b": (0, [])})
+    with pytest.raises(Exception, match="All raced providers failed"):
+        race(client, ["a", "b"], hedge_delay=0)
+
+
+def test_ttft_recorded_for_winner_and_losers_with_a_first_token():
+    tracker = LatencyTracker()
+    client = FakeClient({"a": (None, ["a"]), "b": (None, ["b"]), "c": (1.0, ["c"])})
+    request, _ = race(client, ["a", "b", "c"], hedge_delay=0, tracker=tracker)
+    assert request.winner.provider == "a"
+    assert tracker.count("a:model") == 1
+    # b answered alongside a but lost; c was cancelled before its first token
+    assert tracker.count("b:model") == 1
+    assert tracker.count("c:model") == 0
+
+
+def test_hedge_delay_defaults_to_primary_percentile():
+    tracker = LatencyTracker()
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0):
+        tracker.record("p:model", seconds)
+    request = HedgedRequest(FakeClient({}), "prompt", [("p", "model"), ("b", "model")], tracker=tracker)
+    assert request.resolve_hedge_delay() == pytest.approx(0.9)
+    assert HedgedRequest(FakeClient({}), "prompt", [("p", "model")]).resolve_hedge_delay() == 0.0
+
+
+def test_requires_a_target():
+    with pytest.raises(ValueError):
+        HedgedRequest(FakeClient({}), "prompt", [])
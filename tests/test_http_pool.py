@@ -0,0 +1,120 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+import requests  # noqa: E402
+
+from api.http_pool import HTTPSessionPool, _httpx_timeout  # noqa: E402
+from api.stream_decoder import iter_decoded  # noqa: E402
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Streams three SSE events, waiting for the test's gate before the last one."""
+    protocol_version = "HTTP/1.1"
+    gate = None
+
+    def do_GET(self):
+        events = [b'data: {"n": %d}\n\n' % n for n in range(3)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(sum(map(len, events))))
+        self.end_headers()
+        for n, event in enumerate(events):
+            if n == 2 and self.path == "/gated":
+                self.gate.wait(5)
+            self.wfile.write(event)
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.gate = threading.Event()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    Handler.gate.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class ClosingPool(HTTPSessionPool):
+    """Records which sessions were closed."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.closed = []
+
+    def _close_session(self, session):
+        self.closed.append(session)
+        super()._close_session(session)
+
+
+def test_sessions_are_reused_per_host(server):
+    pool = HTTPSessionPool()
+    for _ in range(3):
+        assert list(iter_decoded(pool.get(f"{server}/", stream=True))) == [{"n": 0}, {"n": 1}, {"n": 2}]
+    metrics = pool.get_metrics()
+    assert metrics["requests_sent"] == 3
+    assert metrics["connections_opened"] == 1
+    assert metrics["pool_hits"] == 2
+    pool.close()
+
+
+def test_configure_keeps_streaming_response_open(server):
+    pool = ClosingPool()
+    events = iter_decoded(pool.get(f"{server}/gated", stream=True))
+    assert next(events) == {"n": 0}
+    old_session = pool.session_for(server)
+
+    pool.configure(pool_maxsize=4)
+    assert pool.closed == []
+    # New requests use a new session right away
+    assert pool.session_for(server) is not old_session
+
+    Handler.gate.set()
+    assert list(events) == [{"n": 1}, {"n": 2}]
+    # The replaced session closes once its last response finished
+    assert pool.closed == [old_session]
+    pool.close()
+
+
+def test_configure_closes_idle_sessions(server):
+    pool = ClosingPool()
+    pool.get(f"{server}/").content
+    old_session = pool.session_for(server)
+    pool.configure(pool_connections=2)
+    assert pool.closed == [old_session]
+    pool.configure(pool_connections=2)
+    assert pool.closed == [old_session]
+
+
+def test_httpx_requests_take_requests_arguments_and_raise_requests_errors(server):
+    httpx = pytest.importorskip("httpx")
+    client = httpx.Client()
+    response = HTTPSessionPool._httpx_send(client, "GET", f"{server}/", False,
+                                          {"timeout": (1, 5), "cookies": {"a": "b"}, "verify": True})
+    assert response.status_code == 200
+
+    with pytest.raises(TypeError, match="proxies"):
+        HTTPSessionPool._httpx_send(client, "GET", f"{server}/", False, {"proxies": {}})
+    with pytest.raises(TypeError, match="verify"):
+        HTTPSessionPool._httpx_send(client, "GET", f"{server}/", False, {"verify": False})
+
+    # Nothing listens on port 9 of localhost
+    with pytest.raises(requests.exceptions.ConnectionError):
+        HTTPSessionPool._httpx_send(client, "GET", "http://127.0.0.1:9/", False, {"timeout": 1})
+    client.close()
+
+
+def test_httpx_timeout_from_connect_read_tuple():
+    httpx = pytest.importorskip("httpx")
+    timeout = _httpx_timeout((2, 30))
+    assert isinstance(timeout, httpx.Timeout)
+    assert (timeout.connect, timeout.read) == (2, 30)
+    assert _httpx_timeout(10) == 10
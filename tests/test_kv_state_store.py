@@ -0,0 +1,81 @@
+import os
+import time
+
+from api.kv_state_store import KVStateStore
+
+
+def test_saved_state_loads_back(tmp_path):
+    store = KVStateStore(tmp_path)
+    key = KVStateStore.state_key(("model", 4096), "conversation")
+    store.save(key, {"tokens": [1, 2, 3]}, background=False)
+    assert store.load(key) == {"tokens": [1, 2, 3]}
+    stats = store.get_stats()
+    assert (stats["saves"], stats["restores"], stats["snapshots"]) == (1, 1, 1)
+
+
+def test_state_key_depends_on_model_settings_and_conversation():
+    base = KVStateStore.state_key(("model", 4096), "a")
+    assert base == KVStateStore.state_key(("model", 4096), "a")
+    assert base != KVStateStore.state_key(("model", 8192), "a")
+    assert base != KVStateStore.state_key(("model", 4096), "b")
+
+
+def test_missing_snapshot_is_a_miss(tmp_path):
+    store = KVStateStore(tmp_path)
+    assert store.load("absent") is None
+    assert store.get_stats()["misses"] == 1
+
+
+def test_unreadable_snapshot_is_discarded(tmp_path):
+    store = KVStateStore(tmp_path)
+    store.save("key", "state", background=False)
+    (tmp_path / "key.state").write_bytes(b"not a pickle")
+    assert store.load("key") is None
+    assert not (tmp_path / "key.state").exists()
+    assert store.get_stats()["errors"] == 1
+
+
+def test_background_saves_are_written_on_close(tmp_path):
+    store = KVStateStore(tmp_path)
+    for turn in range(3):
+        store.save("key", {"turn": turn})
+    store.close()
+    # Saves of one key are written in order, so the last one wins
+    assert store.load("key") == {"turn": 2}
+
+
+def test_least_recently_used_snapshots_are_evicted(tmp_path):
+    state = b"x" * 1000
+    store = KVStateStore(tmp_path, max_bytes=10 ** 9)
+    for key in ("a", "b", "c"):
+        store.save(key, state, background=False)
+        time.sleep(0.01)
+    store.load("a")
+    size = os.path.getsize(tmp_path / "a.state")
+    store.configure(max_bytes=size * 2)
+    assert store.load("b") is None
+    assert store.load("a") == state and store.load("c") == state
+    assert store.get_stats()["evictions"] == 1
+
+
+def test_newest_snapshot_is_kept_even_if_alone_over_the_limit(tmp_path):
+    store = KVStateStore(tmp_path, max_bytes=10)
+    store.save("big", b"x" * 1000, background=False)
+    assert store.load("big") == b"x" * 1000
+
+
+def test_existing_snapshots_are_indexed_on_start(tmp_path):
+    KVStateStore(tmp_path).save("key", "state", background=False)
+    store = KVStateStore(tmp_path)
+    assert store.get_stats()["snapshots"] == 1
+    store.clear()
+    assert store.get_stats()["snapshots"] == 0
+    assert not list(tmp_path.glob("*.state"))
+
+
+def test_zero_budget_disables_snapshots(tmp_path):
+    store = KVStateStore(tmp_path, max_bytes=0)
+    assert not store.enabled
+    store.save("key", "state", background=False)
+    assert store.load("key") is None
+    assert not list(tmp_path.glob("*.state"))
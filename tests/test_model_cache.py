@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from api.model_cache import CatalogEntry, ModelCatalogCache
+
+
+class Fetcher:
+    """Returns the given listing, or None (not modified) when it has no new one."""
+
+    def __init__(self, *listings):
+        self.listings = list(listings)
+        self.calls = 0
+
+    def __call__(self, entry):
+        self.calls += 1
+        models = self.listings.pop(0)
+        return None if models is None else CatalogEntry(models=models, fetched_at=time.time(), etag="v")
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_fresh_listings_are_served_from_the_cache(tmp_path):
+    cache = ModelCatalogCache(tmp_path / "catalog.json")
+    fetch = Fetcher(["a", "b"])
+    assert cache.get("OpenAI", "https://api", fetch) == ["a", "b"]
+    assert cache.get("OpenAI", "https://api", fetch) == ["a", "b"]
+    assert fetch.calls == 1
+    stats = cache.get_stats()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+
+
+def test_stale_listings_are_served_and_revalidated_in_the_background(tmp_path):
+    cache = ModelCatalogCache(tmp_path / "catalog.json", ttls={"Ollama": 0})
+    changes = []
+    cache.add_listener(lambda provider, endpoint, models: changes.append(models))
+    cache.get("Ollama", "http://local", Fetcher(["a"]))
+    assert cache.get("Ollama", "http://local", Fetcher(["a", "b"])) == ["a"]
+    wait_for(lambda: len(changes) == 2)
+    assert changes == [["a"], ["a", "b"]]
+    assert cache.peek("Ollama", "http://local") == ["a", "b"]
+
+
+def test_not_modified_keeps_the_listing(tmp_path):
+    cache = ModelCatalogCache(tmp_path / "catalog.json")
+    cache.get("vLLM", "http://local", Fetcher(["a"]))
+    assert cache.get("vLLM", "http://local", Fetcher(None), force=True) == ["a"]
+    assert cache.get_stats()["not_modified"] == 1
+
+
+def test_listings_survive_a_restart(tmp_path):
+    path = tmp_path / "catalog.json"
+    ModelCatalogCache(path).get("OpenRouter.ai", "https://openrouter", Fetcher(["x"]))
+    restarted = ModelCatalogCache(path)
+    assert restarted.peek("OpenRouter.ai", "https://openrouter") == ["x"]
+    restarted.clear()
+    assert ModelCatalogCache(path).peek("OpenRouter.ai", "https://openrouter") == []
+
+
+def test_forced_refresh_raises_fetch_errors(tmp_path):
+    cache = ModelCatalogCache(tmp_path / "catalog.json")
+
+    def broken(entry):
+        raise ConnectionError("down")
+
+    assert cache.get("LM Studio", "http://local", broken) == []
+    with pytest.raises(ConnectionError):
+        cache.get("LM Studio", "http://local", broken, force=True)
+    assert cache.get_stats()["errors"] == 2
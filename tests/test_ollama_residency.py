@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+
+from api.ollama_residency import OllamaResidency  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, data=None):
+        self.data = data or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeHTTP:
+    """Records the requests of one host; preloads wait for the test's gate."""
+
+    def __init__(self):
+        self.requests = []
+        self.posting = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def get(self, url, timeout=None):
+        self.requests.append(("GET", url))
+        return FakeResponse({"models": []})
+
+    def post(self, url, json=None, timeout=None):
+        self.posting.set()
+        self.gate.wait(5)
+        self.requests.append(("POST", url, json))
+        return FakeResponse()
+
+
+def test_each_host_has_its_own_manager_with_the_shared_policy():
+    residency = OllamaResidency("http://a:11434")
+    residency.configure(keep_alive="10m", pinned_keep_alive=-1)
+    residency.set_pinned(["llama3"])
+    first = residency.for_host("http://a:11434/", http=FakeHTTP())
+    second = residency.for_host("http://b:11434", http=FakeHTTP())
+    assert first is residency.for_host() and first is not second
+    assert second.host == "http://b:11434"
+    assert (second.keep_alive_for("llama3"), second.keep_alive_for("phi3")) == (-1, "10m")
+    residency.configure(keep_alive=300)
+    assert first.keep_alive_for("phi3") == second.keep_alive_for("phi3") == 300
+
+
+def test_preload_goes_to_its_own_host():
+    residency = OllamaResidency("http://a:11434")
+    hosts = {host: FakeHTTP() for host in ("http://a:11434", "http://b:11434")}
+    for host, http in hosts.items():
+        residency.for_host(host, http=http)
+    residency.preload("llama3", host="http://b:11434").result(5)
+    assert hosts["http://a:11434"].requests == []
+    assert hosts["http://b:11434"].requests[-1][:2] == ("POST", "http://b:11434/api/generate")
+
+
+def test_close_cancels_queued_preloads_and_later_preloads_still_run():
+    residency = OllamaResidency("http://a:11434")
+    http = FakeHTTP()
+    http.gate.clear()
+    manager = residency.for_host(http=http)
+    running = manager.preload("llama3")
+    assert http.posting.wait(5)
+    queued = manager.preload("phi3")
+    residency.close()
+    assert queued.cancelled()
+    http.gate.set()
+    running.result(5)
+    assert manager.preload("phi3").result(5) >= 0
+    residency.close()
@@ -0,0 +1,60 @@
+from types import SimpleNamespace as NS
+
+import pytest
+
+pytest.importorskip("requests")
+
+from api.clients import GroqClient, NebiusClient, OpenRouterClient, PerplexityClient, RequestUsage  # noqa: E402
+
+
+class FakeCompletions:
+    """Answers "Hi there" in two chunks, then (if asked for) a usage chunk without choices."""
+
+    def __init__(self, usage_field="usage"):
+        self.usage_field = usage_field
+        self.calls = []
+
+    def create(self, **params):
+        self.calls.append(params)
+        usage = NS(prompt_tokens=12, completion_tokens=2, prompt_tokens_details=NS(cached_tokens=8))
+        if not params["stream"]:
+            return NS(choices=[NS(message=NS(content="Hi there"))], usage=usage)
+        chunks = [NS(choices=[NS(delta=NS(content=text))], usage=None) for text in ("Hi", " there")]
+        if params.get("stream_options", {}).get("include_usage"):
+            if self.usage_field == "x_groq":
+                chunks.append(NS(choices=[], usage=None, x_groq=NS(usage=usage)))
+            else:
+                chunks.append(NS(choices=[], usage=usage))
+        return iter(chunks)
+
+
+def client_with(client_class, completions):
+    client = client_class()
+    client.client = NS(chat=NS(completions=completions))
+    return client
+
+
+@pytest.mark.parametrize("client_class", [GroqClient, NebiusClient, OpenRouterClient, PerplexityClient])
+def test_streamed_usage_is_recorded_per_request(client_class):
+    completions = FakeCompletions()
+    client = client_with(client_class, completions)
+    capture = RequestUsage()
+    text = "".join(capture.wrap(client.generate_response("Hello", "model", stream=True)))
+    assert text == "Hi there"
+    assert completions.calls[0]["stream_options"] == {"include_usage": True}
+    assert capture.usage == {"input_tokens": 12, "output_tokens": 2, "cache_read_tokens": 8,
+                             "cache_write_tokens": 0}
+
+
+def test_non_streamed_usage_is_recorded():
+    completions = FakeCompletions()
+    client = client_with(OpenRouterClient, completions)
+    assert list(client.generate_response("Hello", "model")) == ["Hi there"]
+    assert "stream_options" not in completions.calls[0]
+    assert client.last_usage["input_tokens"] == 12
+
+
+def test_groq_stream_usage_is_read_from_x_groq():
+    client = client_with(GroqClient, FakeCompletions(usage_field="x_groq"))
+    assert "".join(client.generate_response("Hello", "model", stream=True)) == "Hi there"
+    assert client.last_usage["output_tokens"] == 2
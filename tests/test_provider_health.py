@@ -0,0 +1,65 @@
+import time
+
+from api.provider_health import CLOSED, HALF_OPEN, OPEN, ProviderHealthTracker
+
+
+def tracker(**kwargs):
+    kwargs.setdefault("open_duration", 0.05)
+    return ProviderHealthTracker(**kwargs)
+
+
+def test_consecutive_failures_open_the_circuit():
+    health = tracker(failure_threshold=3, min_samples=100)
+    states = []
+    health.add_listener(lambda provider, state: states.append(state))
+    for _ in range(2):
+        health.record_failure("p", "timeout")
+    assert health.get_state("p") == CLOSED
+    health.record_failure("p", "timeout")
+    assert health.get_state("p") == OPEN
+    assert not health.allow_request("p")
+    assert states == [OPEN]
+    assert health.get_stats()["p"]["last_error"] == "timeout"
+
+
+def test_error_rate_opens_the_circuit():
+    health = tracker(failure_threshold=100, error_rate_threshold=0.5, min_samples=4)
+    for ok in (True, False, True, False):
+        if ok:
+            health.record_success("p")
+        else:
+            health.record_failure("p")
+    assert health.get_state("p") == OPEN
+
+
+def test_half_open_admits_one_probe_and_success_closes():
+    health = tracker(failure_threshold=1)
+    health.record_failure("p")
+    time.sleep(0.06)
+    assert health.is_available("p")
+    assert health.allow_request("p")
+    assert health.get_state("p") == HALF_OPEN
+    # Only one probe at a time
+    assert not health.allow_request("p")
+    health.record_success("p", latency=0.2)
+    assert health.get_state("p") == CLOSED
+    assert health.allow_request("p")
+
+
+def test_failed_probe_reopens_with_longer_cooldown():
+    health = tracker(failure_threshold=1, max_open_duration=1.0)
+    health.record_failure("p")
+    time.sleep(0.06)
+    assert health.allow_request("p")
+    health.record_failure("p")
+    assert health.get_state("p") == OPEN
+    assert 0.05 < health.retry_in("p") <= 0.1
+
+
+def test_release_returns_the_probe_slot():
+    health = tracker(failure_threshold=1)
+    health.record_failure("p")
+    time.sleep(0.06)
+    assert health.allow_request("p")
+    health.release("p")
+    assert health.allow_request("p")
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from api.clients import OpenRouterClient, PerplexityClient  # noqa: E402
+from api.provider_registry import ProviderRegistry  # noqa: E402
+
+
+def test_clients_are_shared_until_their_configuration_changes():
+    registry = ProviderRegistry()
+    first = registry.get(PerplexityClient, "key-1")
+    assert registry.get(PerplexityClient, "key-1") is first
+    replaced = registry.get(PerplexityClient, api_key="key-2")
+    assert replaced is not first
+    assert registry.peek(PerplexityClient) is replaced
+    stats = registry.get_stats()["PerplexityClient"]
+    assert (stats["created"], stats["reused"]) == (2, 1)
+
+
+def test_sdk_clients_are_built_only_when_used():
+    registry = ProviderRegistry()
+    client = registry.get(PerplexityClient, "key")
+    assert client.get_models()
+    assert registry.get_stats()["PerplexityClient"]["sdk_initialized"] is False
+
+
+def test_removed_clients_are_forgotten():
+    registry = ProviderRegistry()
+    registry.get(OpenRouterClient)
+    registry.remove(OpenRouterClient)
+    assert registry.peek(OpenRouterClient) is None
+    registry.get(PerplexityClient)
+    registry.clear()
+    assert registry.peek(PerplexityClient) is None
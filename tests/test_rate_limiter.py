@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import pytest
+
+from api.rate_limiter import (FREE_TIER_RATE_LIMITS, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimiter,
+                              RateLimitTimeout, rate_limit_retry_after)
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+def wrapped(cause, message):
+    """Raise an error the way the clients re-wrap SDK errors."""
+    try:
+        try:
+            raise cause
+        except Exception as e:
+            raise Exception(message) from e
+    except Exception as e:
+        return e
+
+
+def test_numbers_containing_429_are_not_rate_limits():
+    assert rate_limit_retry_after(Exception("context has 4290 tokens")) is None
+    assert rate_limit_retry_after(Exception("model id abc-1429x not found")) is None
+
+
+def test_rate_limit_text_matches():
+    assert rate_limit_retry_after(Exception("Groq API error: 429 Too Many Requests")) == 0.0
+    assert rate_limit_retry_after(Exception("Too many requests")) == 0.0
+    assert rate_limit_retry_after(Exception("rate_limit_error: slow down, retry after 7 seconds")) == 7.0
+
+
+def test_status_read_from_chained_cause():
+    error = wrapped(HTTPError(429, {"retry-after": "3"}), "OpenAI API error: something went wrong")
+    assert rate_limit_retry_after(error) == 3.0
+
+
+def test_chained_non_429_status_wins_over_text():
+    error = wrapped(HTTPError(500), "Gemini API error: rate limit of the backend exceeded")
+    assert rate_limit_retry_after(error) is None
+
+
+def test_no_budgets_by_default():
+    limiter = RateLimiter()
+    assert limiter.limits == {}
+    for _ in range(100):
+        assert limiter.acquire("Groq", "key", tokens=10000, timeout=0).wait_time == 0.0
+
+
+def test_free_tier_preset_is_opt_in():
+    limiter = RateLimiter()
+    limiter.set_limits({"Groq": {"rpm": 60}}, preset="free_tier")
+    assert limiter.limits["Groq"].rpm == 60
+    assert limiter.limits["Groq"].tpm == FREE_TIER_RATE_LIMITS["Groq"]["tpm"]
+    assert "OpenRouter.ai" in limiter.limits
+
+
+def test_requests_over_budget_wait_or_time_out():
+    limiter = RateLimiter({"P": {"rpm": 2}})
+    limiter.acquire("P")
+    limiter.acquire("P")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("P", timeout=0.05)
+    assert limiter.get_stats()["P"]["timeouts"] == 1
+
+
+def test_api_keys_have_separate_lanes():
+    limiter = RateLimiter({"P": {"rpm": 1}})
+    limiter.acquire("P", "a")
+    limiter.acquire("P", "b")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("P", "a", timeout=0.05)
+
+
+def test_settle_charges_actual_tokens():
+    limiter = RateLimiter({"P": {"tpm": 1000}})
+    permit = limiter.acquire("P", tokens=100)
+    limiter.settle(permit, 1000)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("P", tokens=100, timeout=0.05)
+
+
+def test_penalize_pauses_unbudgeted_provider_with_backoff():
+    limiter = RateLimiter(max_backoff=4.0)
+    permit = limiter.acquire("P")
+    assert limiter.penalize(permit) == 1.0
+    assert limiter.penalize(permit) == 2.0
+    assert limiter.penalize(permit, retry_after=0.5) == 0.5
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("P", timeout=0.05)
+    assert limiter.get_stats()["P"]["rate_limited"] == 3
+
+
+def test_interactive_requests_go_first():
+    limiter = RateLimiter({"P": {"rpm": 240}})
+    for _ in range(240):
+        limiter.acquire("P")  # empty the bucket so the next requests queue
+
+    async def run():
+        order = []
+
+        async def request(name, priority):
+            await limiter.aacquire("P", priority=priority, timeout=5)
+            order.append(name)
+
+        background = asyncio.ensure_future(request("background", PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(request("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.gather(background, interactive)
+        return order
+
+    started = time.monotonic()
+    assert asyncio.run(run()) == ["interactive", "background"]
+    assert time.monotonic() - started < 2
@@ -0,0 +1,178 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# local_model_server builds on the Qt, psutil and requests stack
+pytest.importorskip("PyQt6")
+pytest.importorskip("psutil")
+pytest.importorskip("requests")
+
+from api.local_model_server import InferenceRequest, ReplicaGroup  # noqa: E402
+from api.slot_scheduler import SlotScheduler, SlotTimeout  # noqa: E402
+
+
+class FakeServer:
+    """Stands in for a LlamaCppServer: answers with its own name, or raises a queued error."""
+
+    def __init__(self, name, slots=1, healthy=True):
+        self.server_url = f"http://{name}"
+        self.name = name
+        self.is_running = True
+        self.healthy = healthy
+        self.scheduler = SlotScheduler(slots)
+        self.config = SimpleNamespace(cpu_affinity=None)
+        self.errors = []
+        self.requests = 0
+        self.health_checks = 0
+
+    def _health_check(self):
+        self.health_checks += 1
+        self.healthy = True
+        return self.healthy
+
+    def generate_response(self, request):
+        self.requests += 1
+        if request.stream:
+            return self._stream()
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.name
+
+    def _stream(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        yield self.name
+        yield "done"
+
+
+def group_of(*servers):
+    return ReplicaGroup("group", list(servers))
+
+
+def test_idle_replicas_share_requests_round_robin():
+    a, b = FakeServer("a"), FakeServer("b")
+    group = group_of(a, b)
+    answers = [group.generate_response(InferenceRequest("hi")) for _ in range(4)]
+    assert sorted(answers) == ["a", "a", "b", "b"]
+
+
+def test_busy_replica_is_avoided():
+    a, b = FakeServer("a"), FakeServer("b")
+    group = group_of(a, b)
+    stream = group.generate_response(InferenceRequest("hi", stream=True))
+    first = next(stream)
+    # The open stream keeps its replica loaded, so the next request goes elsewhere
+    other = group.generate_response(InferenceRequest("hi"))
+    assert other != first
+    stream.close()
+    assert group.get_stats()["in_flight"] == 0
+
+
+def test_conversation_stays_on_its_replica():
+    a, b = FakeServer("a"), FakeServer("b")
+    group = group_of(a, b)
+    answers = {group.generate_response(InferenceRequest("hi", conversation_id="chat")) for _ in range(3)}
+    assert len(answers) == 1
+
+
+def test_unhealthy_replicas_are_skipped():
+    a, b = FakeServer("a", healthy=False), FakeServer("b")
+    group = group_of(a, b)
+    assert [group.generate_response(InferenceRequest("hi")) for _ in range(3)] == ["b", "b", "b"]
+    b.healthy = False
+    with pytest.raises(Exception, match="No healthy replica"):
+        group.generate_response(InferenceRequest("hi"))
+
+
+def test_failed_request_is_retried_on_another_replica():
+    a, b = FakeServer("a"), FakeServer("b")
+    a.errors.append(ConnectionError("down"))
+    group = group_of(a, b)
+    # Both are idle, so the first replica is tried first
+    assert group.generate_response(InferenceRequest("hi")) == "b"
+    stats = group.get_stats()["replicas"]
+    assert (stats[0]["errors"], stats[0]["retries"]) == (1, 1)
+    # The failed replica is checked in the background and routed to again once healthy
+    wait_for(lambda: a.health_checks == 1 and a.healthy)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_failover_does_not_wait_for_the_health_check():
+    release = threading.Event()
+
+    class HungServer(FakeServer):
+        def _health_check(self):
+            release.wait(5)
+            return super()._health_check()
+
+    a, b = HungServer("a"), FakeServer("b")
+    a.errors.append(TimeoutError("hung"))
+    group = group_of(a, b)
+    started = time.monotonic()
+    assert group.generate_response(InferenceRequest("hi")) == "b"
+    assert time.monotonic() - started < 1
+    # Suspect until its health check answers
+    assert not a.healthy
+    assert group.generate_response(InferenceRequest("hi")) == "b"
+    release.set()
+    wait_for(lambda: a.healthy)
+
+
+def test_every_replica_failing_raises_the_last_error():
+    a, b = FakeServer("a"), FakeServer("b")
+    a.errors.append(ConnectionError("a down"))
+    b.errors.append(ConnectionError("b down"))
+    with pytest.raises(ConnectionError):
+        group_of(a, b).generate_response(InferenceRequest("hi"))
+
+
+def test_slot_timeout_is_not_retried():
+    a, b = FakeServer("a"), FakeServer("b")
+    a.errors.append(SlotTimeout("busy"))
+    b.errors.append(SlotTimeout("busy"))
+    group = group_of(a, b)
+    with pytest.raises(SlotTimeout):
+        group.generate_response(InferenceRequest("hi"))
+    assert a.requests + b.requests == 1
+
+
+def test_stream_is_retried_only_before_its_first_chunk():
+    a, b = FakeServer("a"), FakeServer("b")
+    a.errors.append(ConnectionError("down"))
+    assert list(group_of(a, b).generate_response(InferenceRequest("hi", stream=True))) == ["b", "done"]
+
+    class MidStreamFailure(FakeServer):
+        def _stream(self):
+            yield "partial"
+            raise ConnectionError("lost")
+
+    c, d = MidStreamFailure("c"), MidStreamFailure("d")
+    stream = group_of(c, d).generate_response(InferenceRequest("hi", stream=True))
+    assert next(stream) == "partial"
+    with pytest.raises(ConnectionError):
+        next(stream)
+    assert c.requests + d.requests == 1
+
+
+def test_plan_cpus_splits_cpus_evenly():
+    assert ReplicaGroup.plan_cpus(2, [0, 1, 2, 3, 4]) == [[0, 1, 2], [3, 4]]
+    assert ReplicaGroup.plan_cpus(4, [0, 1]) == [[0], [1]]
+    assert ReplicaGroup.plan_cpus(1, [2, 3]) == [[2, 3]]
+
+
+def test_stats_aggregate_replicas():
+    a, b = FakeServer("a", slots=2), FakeServer("b", slots=4, healthy=False)
+    group = group_of(a, b)
+    group.generate_response(InferenceRequest("hi"))
+    stats = group.get_stats()
+    assert stats["healthy"] == 1
+    assert [replica["slots"] for replica in stats["replicas"]] == [2, 4]
+    assert stats["replicas"][0]["routed"] == 1
@@ -0,0 +1,157 @@
+import threading
+import time
+
+import pytest
+
+from api.resident_models import ModelKey, ResidentModelCache
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def key(model, context_length=2048):
+    return ModelKey(model, context_length, threads=4, gpu_layers=0)
+
+
+def test_model_is_loaded_once_and_reused():
+    cache = ResidentModelCache(ram_budget=0)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return FakeModel("a")
+
+    with cache.acquire(key("a"), loader) as first:
+        pass
+    with cache.acquire(key("a"), loader) as second:
+        pass
+    assert first is second
+    assert len(loads) == 1
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["loads"]) == (1, 1, 1)
+
+
+def test_different_load_settings_are_separate_models():
+    cache = ResidentModelCache(ram_budget=0)
+    with cache.acquire(key("a", 2048), lambda: FakeModel("a-2k")) as small:
+        pass
+    with cache.acquire(key("a", 8192), lambda: FakeModel("a-8k")) as large:
+        pass
+    assert small is not large
+    assert len(cache.get_stats()["models"]) == 2
+
+
+def test_concurrent_requests_share_one_load():
+    cache = ResidentModelCache(ram_budget=0)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return FakeModel("a")
+
+    models = []
+
+    def use():
+        with cache.acquire(key("a"), loader) as model:
+            models.append(model)
+
+    threads = [threading.Thread(target=use) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len(models) == 5 and all(model is models[0] for model in models)
+
+
+def test_failed_load_is_raised_and_retried_later():
+    cache = ResidentModelCache(ram_budget=0)
+
+    def broken():
+        raise RuntimeError("bad file")
+
+    with pytest.raises(RuntimeError):
+        with cache.acquire(key("a"), broken):
+            pass
+    with cache.acquire(key("a"), lambda: FakeModel("a")) as model:
+        assert model.name == "a"
+    assert cache.get_stats()["load_errors"] == 1
+
+
+def test_least_recently_used_model_is_unloaded_for_a_new_one():
+    cache = ResidentModelCache(ram_budget=100)
+    models = {}
+    for name in ("a", "b"):
+        with cache.acquire(key(name), lambda name=name: FakeModel(name), size=40) as model:
+            models[name] = model
+        time.sleep(0.01)
+    # Touch a so b is the least recently used
+    with cache.acquire(key("a"), lambda: FakeModel("unused"), size=40):
+        pass
+    with cache.acquire(key("c"), lambda: FakeModel("c"), size=40):
+        pass
+    resident = {model["model"] for model in cache.get_stats()["models"]}
+    assert resident == {"a", "c"}
+    assert models["b"].closed and not models["a"].closed
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_models_in_use_are_not_unloaded():
+    cache = ResidentModelCache(ram_budget=50)
+    with cache.acquire(key("a"), lambda: FakeModel("a"), size=40) as in_use:
+        with cache.acquire(key("b"), lambda: FakeModel("b"), size=40):
+            assert not in_use.closed
+    assert {model["model"] for model in cache.get_stats()["models"]} == {"a", "b"}
+
+
+def test_evict_unloads_idle_instances_of_a_model():
+    cache = ResidentModelCache(ram_budget=0)
+    with cache.acquire(key("a", 2048), lambda: FakeModel("a")) as model:
+        pass
+    with cache.acquire(key("b"), lambda: FakeModel("b")):
+        pass
+    assert cache.evict("a") == 1
+    assert model.closed
+    assert [entry["model"] for entry in cache.get_stats()["models"]] == ["b"]
+    cache.clear()
+    assert cache.get_stats()["models"] == []
+
+
+def test_waiters_hold_the_model_as_soon_as_it_is_loaded():
+    cache = ResidentModelCache(ram_budget=0)
+    waiting = threading.Event()
+    release = threading.Event()
+
+    def loader():
+        assert waiting.wait(5)
+        return FakeModel("a")
+
+    def wait_for_load():
+        with cache.acquire(key("a"), loader):
+            release.wait(5)
+
+    owner = threading.Thread(target=wait_for_load)
+    owner.start()
+    while not cache._loading:
+        time.sleep(0.001)
+    waiter = threading.Thread(target=wait_for_load)
+    waiter.start()
+    while cache.get_stats()["waits"] == 0:
+        time.sleep(0.001)
+    waiting.set()
+    while not cache.get_stats()["models"]:
+        time.sleep(0.001)
+    # Both requests count as users from the moment the model is published, so it cannot be unloaded
+    assert cache.get_stats()["models"][0]["in_use"] == 2
+    assert cache.evict("a") == 0
+    release.set()
+    owner.join()
+    waiter.join()
+    assert cache.get_stats()["models"][0]["in_use"] == 0
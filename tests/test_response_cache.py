@@ -0,0 +1,74 @@
+import time
+
+from api.response_cache import ResponseCache
+
+
+def cache(tmp_path, **kwargs):
+    return ResponseCache(cache_dir=tmp_path, enabled=True, **kwargs)
+
+
+def test_only_deterministic_requests_get_a_key(tmp_path):
+    responses = cache(tmp_path)
+    assert responses.key_for("OpenAI", "gpt-4o", None, {"temperature": 0.7}, "Hi") is None
+    assert responses.key_for("OpenAI", "gpt-4o", None, {"seed": -1}, "Hi") is None
+    key = responses.key_for("OpenAI", "gpt-4o", None, {"temperature": 0}, "Hi")
+    assert key == responses.key_for("OpenAI", "gpt-4o", None, {"temperature": 0}, "Hi")
+    assert key != responses.key_for("OpenAI", "gpt-4o", None, {"temperature": 0}, "Hi",
+                                    history=[{"role": "user", "content": "Earlier"}])
+    responses.enabled = False
+    assert responses.key_for("OpenAI", "gpt-4o", None, {"temperature": 0}, "Hi") is None
+
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    cache(tmp_path).put("k", "Hello there")
+    responses = cache(tmp_path)
+    assert responses.get("k") == "Hello there"
+    assert responses.get("k") == "Hello there"
+    stats = responses.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+    assert list(responses.replay("Hello there")) == ["Hello ", "there"]
+
+
+def test_expired_entries_are_misses_and_removed_from_disk(tmp_path):
+    responses = cache(tmp_path, ttl=0.05)
+    responses.put("k", "Hello")
+    assert responses.get("k") == "Hello"
+    time.sleep(0.06)
+    assert responses.get("k") is None
+    assert not (tmp_path / "k.json").exists()
+    assert responses.get_stats()["memory_entries"] == 0
+    assert responses.get_stats()["disk_bytes"] == 0
+
+
+def test_memory_tier_keeps_the_most_recently_used_entries(tmp_path):
+    responses = cache(tmp_path, max_entries=2)
+    responses.put("a", "A")
+    responses.put("b", "B")
+    responses.get("a")
+    responses.put("c", "C")
+    assert list(responses._memory) == ["a", "c"]
+    assert responses.get_stats()["evictions"] == 1
+
+
+def test_disk_tier_deletes_the_oldest_files_over_its_budget(tmp_path):
+    responses = cache(tmp_path)
+    responses.put("first", "x" * 100)
+    size = (tmp_path / "first.json").stat().st_size
+    # Room for two entries but not three (timestamps vary the size by a few bytes)
+    responses.max_disk_bytes = 2 * size + size // 2
+    for key in ("second", "third"):
+        time.sleep(0.01)
+        responses.put(key, "x" * 100)
+    assert sorted(path.stem for path in tmp_path.glob("*.json")) == ["second", "third"]
+    assert responses.get_stats()["disk_bytes"] == sum(path.stat().st_size for path in tmp_path.glob("*.json"))
+    # Still served from memory; a fresh cache only finds what is left on disk
+    assert responses.get("first") is not None
+    assert cache(tmp_path).get("first") is None
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    responses = cache(tmp_path)
+    responses.put("k", "Hello")
+    responses.clear()
+    assert responses.get("k") is None
+    assert list(tmp_path.glob("*.json")) == []
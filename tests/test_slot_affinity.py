@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from api.clients import LlamaCppClient  # noqa: E402
+from api.slot_affinity import SlotAffinity, conversation_key  # noqa: E402
+
+
+def client_with_slots(slots):
+    client = LlamaCppClient(auto_refresh=False)
+    client.slots.resize(slots)
+    client._slots_ready = True
+    return client
+
+
+def test_first_turn_is_pinned_to_the_slot_of_its_follow_ups():
+    client = client_with_slots(4)
+    first = client._completion_payload("Hello", True, "Be brief")
+    history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi"}]
+    second = client._completion_payload("How are you?", True, "Be brief", history)
+    assert first["id_slot"] == second["id_slot"]
+
+    other = client._completion_payload("Something else", True, "Be brief")
+    assert other["id_slot"] != first["id_slot"]
+
+
+def test_server_picks_slots_until_the_count_is_known():
+    client = LlamaCppClient(auto_refresh=False)
+    assert "id_slot" not in client._completion_payload("Hello", True)
+
+
+def test_conversation_key_prefers_explicit_id():
+    assert conversation_key("system", [{"role": "user", "content": "a"}], "chat-1") == "chat-1"
+    assert conversation_key("system", []) is None
+    assert conversation_key("s", [{"role": "user", "content": "a"}]) != conversation_key("t", [{"role": "user", "content": "a"}])
+
+
+def test_least_recently_used_slot_is_reassigned():
+    affinity = SlotAffinity(2)
+    assert [affinity.assign(key) for key in ("a", "b", "a")] == [0, 1, 0]
+    # "b" has been idle the longest, so "c" takes its slot
+    assert affinity.assign("c") == 1
+    assert affinity.get_stats()["evictions"] == 1
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from api.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from api.slot_scheduler import SchedulerFull, SlotScheduler, SlotTimeout
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+def queue_requests(scheduler, requests, order):
+    """Start one thread per (key, priority), each waiting in the queue before the next starts."""
+    threads = []
+    for key, priority in requests:
+        def run(key=key, priority=priority):
+            lease = scheduler.acquire(key, priority, timeout=5)
+            order.append(key)
+            scheduler.release(lease)
+
+        depth = scheduler.queue_depth
+        thread = threading.Thread(target=run)
+        thread.start()
+        wait_until(lambda: scheduler.queue_depth == depth + 1)
+        threads.append(thread)
+    return threads
+
+
+def test_free_slots_are_granted_immediately():
+    scheduler = SlotScheduler(slots=2)
+    first = scheduler.acquire("a")
+    second = scheduler.acquire("b")
+    assert {first.slot, second.slot} == {0, 1}
+    assert scheduler.get_stats()["busy_slots"] == 2
+
+
+def test_conversation_returns_to_its_slot():
+    scheduler = SlotScheduler(slots=3)
+    leases = [scheduler.acquire(key) for key in ("a", "b", "c")]
+    slot_of_b = leases[1].slot
+    for lease in leases:
+        scheduler.release(lease)
+    assert scheduler.acquire("b").slot == slot_of_b
+    assert scheduler.get_stats()["affinity_hits"] == 1
+
+
+def test_lower_priority_value_goes_first():
+    scheduler = SlotScheduler(slots=1)
+    held = scheduler.acquire("held")
+    order = []
+    threads = queue_requests(scheduler, [("batch", PRIORITY_BACKGROUND), ("chat", PRIORITY_INTERACTIVE)], order)
+    scheduler.release(held)
+    for thread in threads:
+        thread.join()
+    assert order == ["chat", "batch"]
+
+
+def test_conversations_take_turns_within_a_priority():
+    scheduler = SlotScheduler(slots=1)
+    held = scheduler.acquire("held")
+    order = []
+    threads = queue_requests(scheduler, [("a", 0), ("a", 0), ("a", 0), ("b", 0)], order)
+    scheduler.release(held)
+    for thread in threads:
+        thread.join()
+    assert order == ["a", "b", "a", "a"]
+
+
+def test_full_queue_rejects_requests():
+    scheduler = SlotScheduler(slots=1, max_queue=1)
+    held = scheduler.acquire("held")
+    order = []
+    threads = queue_requests(scheduler, [("waiting", 0)], order)
+    with pytest.raises(SchedulerFull):
+        scheduler.acquire("rejected")
+    scheduler.release(held)
+    for thread in threads:
+        thread.join()
+    assert order == ["waiting"]
+    assert scheduler.get_stats()["rejected"] == 1
+
+
+def test_wait_times_out_and_leaves_the_queue():
+    scheduler = SlotScheduler(slots=1)
+    held = scheduler.acquire("held")
+    with pytest.raises(SlotTimeout):
+        scheduler.acquire("late", timeout=0.01)
+    assert scheduler.queue_depth == 0
+    scheduler.release(held)
+    assert scheduler.acquire("next").slot == 0
+    assert scheduler.get_stats()["timeouts"] == 1
+
+
+def test_resize_admits_waiting_requests():
+    scheduler = SlotScheduler(slots=1)
+    held = scheduler.acquire("held")
+    order = []
+    threads = queue_requests(scheduler, [("waiting", 0)], order)
+    scheduler.resize(2)
+    for thread in threads:
+        thread.join()
+    assert order == ["waiting"]
+    scheduler.release(held)
+
+
+def test_releasing_twice_is_harmless():
+    scheduler = SlotScheduler(slots=1)
+    lease = scheduler.acquire()
+    lease.tokens = 10
+    scheduler.release(lease)
+    scheduler.release(lease)
+    stats = scheduler.get_stats()
+    assert stats["completed"] == 1
+    assert stats["tokens"] == 10
+    assert stats["busy_slots"] == 0
+
+
+def test_slot_context_manager_releases_on_error():
+    scheduler = SlotScheduler(slots=1)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot("a"):
+            raise RuntimeError("failed")
+    assert scheduler.get_stats()["busy_slots"] == 0
@@ -0,0 +1,201 @@
+import asyncio
+import json
+
+import pytest
+
+from api.stream_decoder import NDJSON, SSE, StreamDecoder, aiter_decoded, iter_decoded, openai_delta_text
+
+
+def sse(*payloads):
+    return b"".join(b"data: " + json.dumps(payload).encode() + b"\n\n" for payload in payloads)
+
+
+class FakeResponse:
+    """requests-style streaming response that serves fixed chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.consumed = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncResponse:
+    """httpx-style streaming response that serves fixed chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.consumed = 0
+
+    async def aiter_bytes(self, chunk_size=None):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+
+def test_sse_frames_split_across_chunks():
+    data = sse({"n": 1}, {"n": 2}, {"n": 3})
+    decoder = StreamDecoder(SSE)
+    events = []
+    for i in range(0, len(data), 5):
+        events.extend(decoder.feed(data[i:i + 5]))
+    assert events == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert decoder.events == 3
+
+
+def test_sse_crlf_comments_and_multiline_data():
+    data = b": keep-alive\r\nevent: message\r\ndata: {\"a\":\r\ndata: 1}\r\n\r\n"
+    assert StreamDecoder(SSE).feed(data) == [{"a": 1}]
+
+
+def test_sse_done_stops_decoding():
+    decoder = StreamDecoder(SSE)
+    events = decoder.feed(sse({"n": 1}) + b"data: [DONE]\n\n" + sse({"n": 2}))
+    assert events == [{"n": 1}]
+    assert decoder.done
+    assert decoder.feed(sse({"n": 3})) == []
+
+
+def test_sse_invalid_payload_counted_as_error():
+    decoder = StreamDecoder(SSE)
+    assert decoder.feed(b"data: {oops\n\n" + sse({"ok": True})) == [{"ok": True}]
+    assert decoder.errors == 1
+
+
+def test_flush_terminates_pending_event():
+    decoder = StreamDecoder(SSE)
+    assert decoder.feed(b"data: {\"tail\": 1}") == []
+    assert decoder.flush() == [{"tail": 1}]
+
+
+def test_ndjson_lines_and_partial_tail():
+    decoder = StreamDecoder(NDJSON)
+    assert decoder.feed(b'{"a": 1}\n\n{"b"') == [{"a": 1}]
+    assert decoder.feed(b': 2}\n{"c": 3}') == [{"b": 2}]
+    assert decoder.flush() == [{"c": 3}]
+
+
+def test_unknown_framing_rejected():
+    with pytest.raises(ValueError):
+        StreamDecoder("xml")
+
+
+def test_iter_decoded_drains_body_after_done_without_closing():
+    response = FakeResponse([sse({"n": 1}), b"data: [DONE]\n\n", b"0\r\n", b"\r\n"])
+    assert list(iter_decoded(response)) == [{"n": 1}]
+    # Read to the end so the connection goes back to the pool
+    assert response.consumed == 4
+    assert not response.closed
+
+
+def test_iter_decoded_flushes_without_done():
+    response = FakeResponse([b'{"a": 1}\n{"b": 2}'])
+    assert list(iter_decoded(response, NDJSON)) == [{"a": 1}, {"b": 2}]
+    assert not response.closed
+
+
+def test_iter_decoded_closes_abandoned_stream():
+    response = FakeResponse([sse({"n": 1}), sse({"n": 2})])
+    events = iter_decoded(response)
+    assert next(events) == {"n": 1}
+    events.close()
+    assert response.closed
+
+
+def test_iter_decoded_closes_on_error():
+    class Broken(FakeResponse):
+        def iter_content(self, chunk_size=None):
+            yield sse({"n": 1})
+            raise ConnectionError("reset")
+
+    response = Broken([])
+    with pytest.raises(ConnectionError):
+        list(iter_decoded(response))
+    assert response.closed
+
+
+class FakeRaw:
+    """urllib3-style raw body of a non-chunked (Content-Length) response, read one network read at a time."""
+
+    def __init__(self, chunks, chunked=False):
+        self.chunks = list(chunks)
+        self.chunked = chunked
+        self.reads = 0
+
+    def supports_chunked_reads(self):
+        return True
+
+    def read_chunked(self, amt=None, decode_content=None):
+        for chunk in self.chunks:
+            self.reads += 1
+            yield chunk
+
+    def read1(self, amt=None, decode_content=None):
+        self.reads += 1
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+class RawResponse(FakeResponse):
+    """Response whose iter_content(None), like urllib3's stream(None), reads the whole body at once."""
+
+    def __init__(self, raw):
+        super().__init__([])
+        self.raw = raw
+        self.chunk_sizes = []
+
+    def iter_content(self, chunk_size=None):
+        self.chunk_sizes.append(chunk_size)
+        yield b"".join(self.raw.chunks)
+
+
+def test_iter_decoded_streams_non_chunked_body_as_it_arrives():
+    raw = FakeRaw([sse({"n": 1}), sse({"n": 2}), b"data: [DONE]\n\n"])
+    response = RawResponse(raw)
+    events = iter_decoded(response)
+    assert next(events) == {"n": 1}
+    # Only the first network read has happened when the first event is delivered
+    assert raw.reads == 1
+    assert list(events) == [{"n": 2}]
+    assert response.chunk_sizes == []
+    assert not response.closed
+
+
+def test_iter_decoded_reads_chunked_body_per_chunk():
+    raw = FakeRaw([sse({"n": 1}), sse({"n": 2})], chunked=True)
+    events = iter_decoded(RawResponse(raw))
+    assert next(events) == {"n": 1}
+    assert raw.reads == 1
+    assert list(events) == [{"n": 2}]
+
+
+def test_iter_decoded_falls_back_to_small_reads():
+    class OldRaw:
+        chunks = [sse({"n": 1})]
+
+    response = RawResponse(OldRaw())
+    assert list(iter_decoded(response)) == [{"n": 1}]
+    assert response.chunk_sizes[0] is not None
+
+
+def test_aiter_decoded_drains_body_after_done():
+    response = FakeAsyncResponse([sse({"n": 1}) + b"data: [DONE]\n\n", b"trailing"])
+
+    async def collect():
+        return [event async for event in aiter_decoded(response)]
+
+    assert asyncio.run(collect()) == [{"n": 1}]
+    assert response.consumed == 2
+
+
+def test_openai_delta_text():
+    assert openai_delta_text({"choices": [{"delta": {"content": "hi"}}]}) == "hi"
+    assert openai_delta_text({"choices": [{"text": "completion"}]}) == "completion"
+    assert openai_delta_text({"choices": [{"delta": {}}]}) == ""
+    assert openai_delta_text({}) == ""
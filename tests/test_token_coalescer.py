@@ -0,0 +1,49 @@
+import threading
+
+from api.token_coalescer import TokenCoalescer
+
+
+def test_chunks_are_delivered_as_frames():
+    coalescer = TokenCoalescer(max_chunks_per_frame=3)
+    assert coalescer.take_frame() is None
+    assert not coalescer.push("Hel")
+    assert not coalescer.push("")
+    assert not coalescer.push("lo")
+    assert coalescer.push(" there")
+    assert coalescer.queue_depth == 3
+    assert coalescer.take_frame() == "Hello there"
+    assert coalescer.take_frame() is None
+    coalescer.push("!")
+    assert coalescer.take_frame() == "!"
+    assert coalescer.text() == "Hello there!"
+    metrics = coalescer.get_metrics()
+    assert (metrics["chunks"], metrics["frames"], metrics["max_queue_depth"]) == (4, 2, 3)
+    assert metrics["chunks_per_frame"] == 2
+
+
+def test_frames_taken_while_producing_keep_every_chunk_in_order():
+    coalescer = TokenCoalescer(max_chunks_per_frame=8)
+    chunks = [f"{n} " for n in range(2000)]
+    frames = []
+
+    def produce():
+        for chunk in chunks:
+            coalescer.push(chunk)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while producer.is_alive():
+        frame = coalescer.take_frame()
+        if frame:
+            frames.append(frame)
+    producer.join()
+    frames.append(coalescer.take_frame() or "")
+    assert "".join(frames) == "".join(chunks) == coalescer.text()
+
+
+def test_reset_starts_a_new_stream():
+    coalescer = TokenCoalescer()
+    coalescer.push("old")
+    coalescer.reset()
+    assert coalescer.text() == "" and coalescer.take_frame() is None
+    assert coalescer.get_metrics()["chunks"] == 0
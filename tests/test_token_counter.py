@@ -0,0 +1,88 @@
+import pytest
+
+from core.token_counter import HEURISTIC, MESSAGE_OVERHEAD_TOKENS, HeuristicTokenizer, TokenCounter
+
+
+class CountingTokenizer:
+    """Splits on whitespace and records which texts it was asked to tokenize."""
+
+    def __init__(self):
+        self.seen = []
+
+    def count(self, text):
+        self.seen.append(text)
+        return len(text.split())
+
+
+def counter_with_spy():
+    counter = TokenCounter()
+    spy = CountingTokenizer()
+    counter.heuristic.count = spy.count
+    return counter, spy
+
+
+def test_repeated_texts_are_counted_from_the_memo():
+    counter, spy = counter_with_spy()
+    assert counter.count("one two three") == 3
+    assert counter.count("one two three") == 3
+    assert spy.seen == ["one two three"]
+    stats = counter.get_stats()
+    assert (stats["hits"], stats["misses"], stats["memo_entries"]) == (1, 1, 1)
+
+
+def test_batches_only_tokenize_new_texts_once():
+    counter, spy = counter_with_spy()
+    counter.count("old turn")
+    assert counter.count_batch(["old turn", "new turn here", "", None, "new turn here"]) == [2, 3, 0, 0, 3]
+    assert spy.seen == ["old turn", "new turn here"]
+
+
+def test_messages_include_the_per_message_overhead():
+    counter, _ = counter_with_spy()
+    messages = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hello"}]
+    assert counter.count_messages(messages) == 3 + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def test_memo_is_bounded_least_recently_used_first():
+    counter, spy = counter_with_spy()
+    counter.memo_size = 2
+    for text in ("a", "b", "a", "c"):
+        counter.count(text)
+    counter.count("a")
+    counter.count("b")
+    assert spy.seen == ["a", "b", "c", "b"]
+
+
+def test_calibration_moves_the_heuristic_toward_reported_counts():
+    tokenizer = HeuristicTokenizer()
+    estimate = tokenizer.count("some ordinary english words")
+    for _ in range(30):
+        tokenizer.calibrate(tokenizer.count("some ordinary english words"), estimate * 2)
+    # Estimates are rounded, so the scale only settles near the true ratio
+    assert tokenizer.scale == pytest.approx(2.0, rel=0.1)
+    assert tokenizer.count("some ordinary english words") == estimate * 2
+
+
+def test_calibration_drops_memoized_heuristic_counts():
+    counter = TokenCounter()
+    text = "some ordinary english words"
+    before = counter.count(text)
+    counter.calibrate(text, before * 3)
+    assert counter.get_stats()["memo_entries"] == 0
+    assert counter.count(text) > before
+    assert counter.get_stats()["heuristic_scale"] > 1.0
+
+
+def test_calibration_ignores_models_with_a_real_tokenizer():
+    pytest.importorskip("tiktoken")
+    counter = TokenCounter()
+    assert counter.tokenizer_key("openai/gpt-4o-mini") == "o200k_base"
+    counter.calibrate("some ordinary english words", 100, model="gpt-4o")
+    assert counter.heuristic.scale == 1.0
+
+
+def test_unknown_models_use_the_heuristic():
+    counter = TokenCounter()
+    assert counter.tokenizer_key(None) == HEURISTIC
+    assert counter.tokenizer_key("claude-3-5-sonnet") == HEURISTIC
+    assert counter.count("") == 0
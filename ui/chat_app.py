@@ -216,6 +216,9 @@ class ChatApp(QMainWindow):
         self.knowledge_graph = KnowledgeGraph()
         self.ai_evaluator = AIEvaluator()
         self.multi_client = MultiProviderClient()
+        if self.multi_client.embedding_provider:
+            # Embed with the configured provider instead of loading sentence-transformers
+            self.knowledge_graph.set_embedder(self.multi_client.embed)
         
         # State variables
         self.current_conversation_id = None
@@ -355,3 +358,7 @@ class ChatApp(QMainWindow):
         
         # Initialize comprehensive tagging system
         self.setup_conversation_tagging_system()
+
+    def closeEvent(self, event: QCloseEvent):
+        self.multi_client.cleanup()
+        super().closeEvent(event)
@@ -22,7 +22,7 @@ from PyQt6.QtWidgets import (
     QSpacerItem, QSizePolicy, QToolButton
 )
 from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QRect, pyqtSignal
-from PyQt6.QtGui import QFont, QKeySequence, QColor, QPixmap, QAction, QShortcut
+from PyQt6.QtGui import QFont, QKeySequence, QColor, QPixmap, QAction, QShortcut, QTextCursor
 from PyQt6.QtWidgets import QApplication
 
 # Import comprehensive error handling
@@ -46,6 +46,11 @@ from ui.command_palette import CommandPaletteManager, CommandPaletteDialog
 from core.quick_switch import QuickSwitchModelMenu
 from ui.quick_switch_widget import QuickSwitchWidget
 
+# Import provider client (local server discovery) and response streaming
+from api.multi_provider import MultiProviderClient
+from api.threads import MultiProviderResponseThread
+from core.conversation_context import DEFAULT_CONTEXT_WINDOW, ConversationContext
+
 # Import last read marker system
 from core.last_read_marker import LastReadMarker
 from ui.last_read_marker_widget import LastReadMarkerDialog
@@ -53,6 +58,13 @@ from ui.last_read_marker_widget import LastReadMarkerDialog
 # Use the logger from dependencies
 from utils.dependencies import log as logger
 
+# Quick switch provider names that MultiProviderClient lists under another name
+CLIENT_PROVIDER_NAMES = {
+    "Google": "Google Gemini",
+    "Deepseek": "DeepSeek",
+    "OpenRouter": "OpenRouter.ai",
+}
+
 # Import API settings dialog
 from ui.api_settings_dialog import APISettingsDialog
 from ui.prompt_library_dialog import PromptLibraryDialog
@@ -736,6 +748,34 @@ class ChatWidget(QWidget):
         scrollbar = self.chat_history.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
     
+    def begin_streamed_message(self, model_name: str = None):
+        """Start an assistant reply that is shown chunk by chunk until finish_streamed_message."""
+        self._streamed_html = self.chat_history.toHtml()
+        model_info = " ({})".format(model_name) if model_name else ""
+        cursor = self.chat_history.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertBlock()
+        cursor.insertText("🤖 Assistant{}: ".format(model_info))
+    
+    def append_streamed_chunk(self, chunk: str):
+        """Append streamed text to the reply started by begin_streamed_message."""
+        if getattr(self, '_streamed_html', None) is None:
+            return
+        # Insert at the end instead of re-rendering the whole history for every chunk
+        cursor = self.chat_history.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(chunk)
+        scrollbar = self.chat_history.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+    
+    def finish_streamed_message(self, sender: str, message: str, message_type: str = "assistant",
+                                model_name: str = None):
+        """Replace the streamed reply with the formatted message."""
+        if getattr(self, '_streamed_html', None) is not None:
+            self.chat_history.setHtml(self._streamed_html)
+            self._streamed_html = None
+        self.add_message(sender, message, message_type, model_name)
+    
     def _get_current_time(self) -> str:
         """Get current time formatted for display."""
         return datetime.now().strftime("%H:%M:%S")
@@ -1447,6 +1487,14 @@ class MainWindow(QMainWindow):
             self.quick_switch_menu = QuickSwitchModelMenu()
             self.quick_switch_widget = None  # Will be created when needed
             
+            # Provider client; local servers are probed in the background and listed as they answer
+            try:
+                self.multi_client = MultiProviderClient()
+            except Exception as exc:
+                self.multi_client = None
+                if hasattr(logger, 'warning'):
+                    logger.warning("Provider client unavailable, local servers will not be discovered: {}".format(exc))
+            
             # Initialize last read marker system
             self.last_read_marker = LastReadMarker()
             self.last_read_marker_dialog = None  # Will be created when needed
@@ -1457,8 +1505,17 @@ class MainWindow(QMainWindow):
             self.setup_status_bar()
             self.setup_connections()
             
+            # Token-budgeted history per conversation, sent with every request
+            self.conversation_contexts = {}
+            self.current_conversation_id = None
+            # Running response threads are kept referenced until they finish
+            self.response_threads = set()
+            self.pending_reply = None
+            
             # Load initial data
             self.load_models()
+            if self.multi_client is not None:
+                self.quick_switch_menu.attach_discovery(self.multi_client)
             
             # Load conversation tags with error handling
             self.load_conversation_tags()
@@ -1762,6 +1819,9 @@ class MainWindow(QMainWindow):
             # Top panel expand/contract
             self.top_panel.panel_toggled.connect(self.on_top_panel_toggled)
             
+            # Discovered local models (queued onto the GUI thread by the quick switch menu)
+            self.quick_switch_menu.models_updated.connect(self.on_models_updated)
+            
             if hasattr(logger, 'info'):
                 logger.info("Signal connections setup completed successfully")
             
@@ -1854,6 +1914,29 @@ class MainWindow(QMainWindow):
                 else:
                     print("Error: Failed to load fallback models: {}".format(fallback_error))
 
+    def on_models_updated(self, models: list):
+        """Add newly available models (e.g. from discovered local servers) to the model selector."""
+        try:
+            if not hasattr(self, 'top_panel') or not hasattr(self.top_panel, 'model_selector'):
+                return
+            selector = self.top_panel.model_selector
+            listed = {selector.itemData(i, Qt.ItemDataRole.UserRole) for i in range(selector.count())}
+            added = 0
+            for model in models:
+                key = "{}:{}".format(model.provider, model.model_name)
+                if model.is_available and key not in listed:
+                    selector.addItem("{}: {}".format(model.provider, model.display_name), key)
+                    listed.add(key)
+                    added += 1
+            if added and hasattr(logger, 'info'):
+                logger.info("Added {} models to the model selector".format(added))
+            
+        except Exception as exc:
+            if hasattr(logger, 'error'):
+                logger.error("Failed to update model selector: {}".format(exc))
+            else:
+                print("Error: Failed to update model selector: {}".format(exc))
+
     def handle_message(self, message: str):
         """Handle incoming messages with error handling."""
         try:
@@ -1862,12 +1945,18 @@ class MainWindow(QMainWindow):
             
             # Add message to chat history
             if hasattr(self, 'chat_widget'):
+                if self.pending_reply is not None:
+                    # One reply streams into the chat at a time
+                    self.chat_widget.add_message("System", "Please wait for the current reply to finish.", "system")
+                    return
                 self.chat_widget.add_message("User", message, "user")
                 
-                # TODO: Process message with AI
-                # For now, just echo back
-                response = "Echo: {}".format(message)
-                self.chat_widget.add_message("Assistant", response, "assistant")
+                if self.multi_client is not None:
+                    provider, model_name = self.get_selected_model()
+                    self.start_response_thread(message, provider, model_name)
+                else:
+                    response = "Echo: {}".format(message)
+                    self.chat_widget.add_message("Assistant", response, "assistant")
                 
                 if hasattr(logger, 'debug'):
                     logger.debug("Message handled successfully")
@@ -1881,6 +1970,77 @@ class MainWindow(QMainWindow):
             else:
                 print("Error: Failed to handle message: {}".format(exc))
 
+    def get_selected_model(self):
+        """Provider and model of the top panel selector, or (None, None) for the client's default."""
+        if hasattr(self, 'top_panel') and hasattr(self.top_panel, 'model_selector'):
+            item_data = self.top_panel.model_selector.currentData(Qt.ItemDataRole.UserRole)
+            if item_data and ":" in str(item_data):
+                provider, model_name = str(item_data).split(":", 1)
+                return provider, model_name
+        return None, None
+
+    def get_conversation_context(self, provider=None, model_name=None, conversation_id=None):
+        """
+        History of a conversation (the current one by default), sized for the model's context window.
+        Switching models recounts the stored turns with the new model's tokenizer.
+        """
+        conversation_id = conversation_id or self.current_conversation_id
+        model_info = self.quick_switch_menu.get_model_by_key("{}:{}".format(provider, model_name)) \
+            if provider and model_name else None
+        context_window = getattr(model_info, 'context_window', None) or DEFAULT_CONTEXT_WINDOW
+        context = self.conversation_contexts.get(conversation_id)
+        if context is None:
+            context = ConversationContext(context_window=context_window, model=model_name)
+            self.conversation_contexts[conversation_id] = context
+        elif context.model != model_name or context.context_window != context_window:
+            context.set_model(model_name, context_window)
+        return context
+
+    def client_provider_name(self, provider):
+        """Name MultiProviderClient uses for a quick switch provider (e.g. "Google" -> "Google Gemini")."""
+        if not provider:
+            return provider
+        provider = CLIENT_PROVIDER_NAMES.get(provider, provider)
+        known = getattr(self.multi_client, 'providers', None) or {}
+        if provider not in known:
+            for name in known:
+                if name.lower() == provider.lower():
+                    return name
+        return provider
+
+    def start_response_thread(self, prompt: str, provider=None, model_name=None):
+        """Stream a reply to prompt, sending the conversation's earlier turns as history."""
+        context = self.get_conversation_context(provider, model_name)
+        history = context.history(prompt)
+        # The prompt is part of the conversation from now on, even if the reply fails
+        context.add_user_message(prompt)
+        thread = MultiProviderResponseThread(self.multi_client, prompt, self.client_provider_name(provider),
+                                             model_name, history=history)
+
+        def record_reply(response):
+            # Signals are queued, so these run on the GUI thread
+            self.pending_reply = None
+            context.add_assistant_message(response)
+            self.chat_widget.finish_streamed_message("Assistant", response, "assistant", model_name)
+
+        def report_error(error):
+            self.pending_reply = None
+            self.chat_widget.finish_streamed_message("System", "Error: {}".format(error), "system")
+
+        def release():
+            self.response_threads.discard(thread)
+            thread.deleteLater()
+
+        thread.response_chunk.connect(self.chat_widget.append_streamed_chunk)
+        thread.response_finished.connect(record_reply)
+        thread.error_occurred.connect(report_error)
+        thread.finished.connect(release)
+        self.response_threads.add(thread)
+        self.pending_reply = thread
+        self.chat_widget.begin_streamed_message(model_name)
+        thread.start()
+        return thread
+
     def handle_file_attachment(self, file_path: str):
         """Handle file attachments with error handling."""
         try:
@@ -1918,6 +2078,7 @@ class MainWindow(QMainWindow):
         try:
             if hasattr(logger, 'info'):
                 logger.info("Loading conversation: {}".format(conversation_id))
+            self.current_conversation_id = conversation_id
             # TODO: Load conversation from storage
             
         except Exception as exc:
@@ -1977,6 +2138,8 @@ class MainWindow(QMainWindow):
         """Create a new conversation with error handling."""
         try:
             # TODO: Implement new conversation creation
+            self.current_conversation_id = None
+            self.conversation_contexts.pop(None, None)
             if hasattr(logger, 'info'):
                 logger.info("New conversation created")
             
@@ -2147,6 +2310,10 @@ class MainWindow(QMainWindow):
             if hasattr(self, 'quick_switch_menu') and self.quick_switch_menu:
                 self.quick_switch_menu.cleanup()
             
+            # Stop following provider discovery and model catalogs
+            if hasattr(self, 'multi_client') and self.multi_client:
+                self.multi_client.cleanup()
+            
             if hasattr(logger, 'info'):
                 logger.info("Application closed successfully")
             event.accept()
@@ -143,6 +143,25 @@ class RecoveryManager:
             ErrorCategory.MODEL_MANAGEMENT: [self._retry_model_operation, self._use_alternative_model],
             ErrorCategory.UNKNOWN: [self._log_and_continue, self._restart_component]
         }
+        # API recovery hooks, installed by the provider layer via register_api_handlers()
+        self.api_retry_handler: Optional[Callable[[Exception, ErrorContext], bool]] = None
+        self.provider_failover_handler: Optional[Callable[[Exception, ErrorContext], bool]] = None
+        
+    def register_api_handlers(self, retry_handler: Optional[Callable[[Exception, ErrorContext], bool]] = None,
+                              failover_handler: Optional[Callable[[Exception, ErrorContext], bool]] = None):
+        """Install the handlers backing the API retry and provider failover strategies."""
+        if retry_handler is not None:
+            self.api_retry_handler = retry_handler
+        if failover_handler is not None:
+            self.provider_failover_handler = failover_handler
+        
+    def unregister_api_handlers(self, retry_handler: Optional[Callable[[Exception, ErrorContext], bool]] = None,
+                                failover_handler: Optional[Callable[[Exception, ErrorContext], bool]] = None):
+        """Remove API recovery handlers, unless another provider layer has replaced them since."""
+        if retry_handler is not None and self.api_retry_handler == retry_handler:
+            self.api_retry_handler = None
+        if failover_handler is not None and self.provider_failover_handler == failover_handler:
+            self.provider_failover_handler = None
         
     def attempt_recovery(self, error: Exception, context: ErrorContext, category: ErrorCategory) -> bool:
         """Attempt to recover from an error using available strategies."""
@@ -182,12 +201,16 @@ class RecoveryManager:
         return True
         
     def _retry_api_call(self, error: Exception, context: ErrorContext) -> bool:
-        """Retry API calls with different parameters."""
-        return True
+        """Retry API calls if the provider is currently accepting requests."""
+        if self.api_retry_handler is None:
+            return False
+        return self.api_retry_handler(error, context)
         
     def _use_alternative_provider(self, error: Exception, context: ErrorContext) -> bool:
         """Switch to alternative API provider."""
-        return True
+        if self.provider_failover_handler is None:
+            return False
+        return self.provider_failover_handler(error, context)
         
     def _clear_cache(self, error: Exception, context: ErrorContext) -> bool:
         """Clear memory cache to free up resources."""